@@ -0,0 +1,106 @@
+"""
+Generación de historias por lotes, tanto para el endpoint `/generate-stories`
+como en modo offline desde la línea de comandos.
+
+Uso offline:
+    python -m batch entrada.jsonl salida.jsonl --concurrency 8
+
+Cada línea de la entrada es un `StoryRequest` en JSON; cada línea de la salida es
+un `BatchItemResult` escrito en orden de finalización.
+"""
+
+# Python imports.
+import sys
+import asyncio
+import logging
+import argparse
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Sequence
+
+# Project imports.
+from models import StoryRequest, StoryResponse, BatchItemResult
+from cache import make_request_key
+
+# Configuración de logging.
+logger = logging.getLogger(__name__)
+
+
+def group_identical(requests: Sequence[StoryRequest]) -> List[List[int]]:
+    """Agrupa los índices de las solicitudes idénticas una vez normalizadas"""
+    groups: Dict[str, List[int]] = {}
+    for index, request in enumerate(requests):
+        groups.setdefault(make_request_key(request), []).append(index)
+    return list(groups.values())
+
+
+async def run_batch(
+    requests: Sequence[StoryRequest],
+    generate: Callable[[StoryRequest], Awaitable[StoryResponse]],
+    concurrency: int,
+) -> AsyncIterator[BatchItemResult]:
+    """
+    Genera las solicitudes únicas con como mucho `concurrency` llamadas a la vez y
+    devuelve los resultados en orden de finalización. Un fallo solo afecta a su elemento.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_group(indices: List[int]) -> BatchItemResult:
+        async with semaphore:
+            try:
+                response = await generate(requests[indices[0]])
+            except Exception as e:
+                logger.error("Error en el elemento %s del lote: %s", indices, e)
+                return BatchItemResult(indices=indices, status="error", error=str(e))
+        return BatchItemResult(
+            indices=indices,
+            status="ok",
+            story=response.story,
+            metadata=response.metadata,
+        )
+
+    tasks = [asyncio.create_task(run_group(g)) for g in group_identical(requests)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Si el cliente se desconecta, no seguir generando historias que nadie leerá
+        for task in tasks:
+            task.cancel()
+
+
+async def run_offline(input_path: str, output_path: str, concurrency: int) -> int:
+    """Procesa un archivo JSONL de solicitudes y escribe los resultados en JSONL"""
+    from main import app, build_story_response, lifespan
+
+    with open(input_path, "r", encoding="utf-8") as file:
+        requests = [
+            StoryRequest.model_validate_json(line) for line in file if line.strip()
+        ]
+
+    failed = 0
+    async with lifespan(app):
+        with open(output_path, "w", encoding="utf-8") as output:
+            async for result in run_batch(requests, build_story_response, concurrency):
+                failed += result.status == "error"
+                output.write(result.model_dump_json(exclude_none=True) + "\n")
+                output.flush()
+
+    logger.info("Lote completado: %s solicitudes, %s con error", len(requests), failed)
+    return failed
+
+
+def main() -> None:
+    from config import settings
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("input", help="Archivo JSONL con un StoryRequest por línea")
+    parser.add_argument("output", help="Archivo JSONL donde escribir los resultados")
+    parser.add_argument("--concurrency", type=int, default=settings.batch_concurrency)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    failed = asyncio.run(run_offline(args.input, args.output, args.concurrency))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
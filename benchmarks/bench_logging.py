@@ -0,0 +1,109 @@
+"""
+Microbenchmark del coste de logging por solicitud en el hilo que atiende la solicitud:
+las nueve líneas INFO con f-strings de antes frente al evento único encolado de
+`RequestLogMiddleware`. La escritura en stderr ocurre en el hilo del listener y no
+se cuenta.
+
+Uso:
+    python -m benchmarks.bench_logging --iterations 50000
+"""
+
+# Python imports.
+import io
+import time
+import queue
+import logging
+import argparse
+
+# Project imports.
+from benchmarks.bench_prompts import build_requests
+from structured_logging import JsonFormatter, NonBlockingQueueHandler, SamplingFilter
+
+
+def legacy_lines(logger: logging.Logger, request, processing_time: float) -> None:
+    """Las líneas que se registraban por cada historia antes del evento único"""
+    logger.info(
+        "Recibida solicitud:"
+        f"word_count={request.word_count}, "
+        f"genre={request.genre}, "
+        f"creativity_level={request.creativity_level}, "
+        f"category={request.category}"
+    )
+    logger.info("PARÁMETROS DEL REQUEST:")
+    logger.info(f"  - word_count: {request.word_count}")
+    logger.info(f"  - creativity_level: {request.creativity_level}")
+    logger.info(f"  - genre: {request.genre}")
+    logger.info(f"  - category: {request.category}")
+    logger.info(f"  - suggestions: {request.suggestions or 'Ninguna'}")
+    logger.info("=" * 80)
+    logger.info(f"Historia generada exitosamente en {processing_time:.2f}s")
+
+
+def structured_event(logger: logging.Logger, request, processing_time: float) -> None:
+    """El evento único con los parámetros y las etapas de la solicitud"""
+    logger.info(
+        "Solicitud completada",
+        extra={
+            "method": "POST",
+            "path": "/generate-story",
+            "status": 200,
+            "duration": processing_time,
+            "stages": {"validation": 0.001, "prompt_build": 0.0001, "completion": 0.5},
+            "word_count": request.word_count,
+            "genre": request.genre,
+            "category": request.category,
+            "creativity_level": request.creativity_level,
+            "suggestions": request.suggestions,
+        },
+    )
+
+
+def microseconds_per_request(function, logger, requests: list, iterations: int) -> float:
+    start = time.perf_counter()
+    for index in range(iterations):
+        function(logger, requests[index % len(requests)], 0.5)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def make_logger(name: str, handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=50_000)
+    parser.add_argument("--sample-rate", type=float, default=1.0, help="Proporción de INFO")
+    args = parser.parse_args()
+    requests = build_requests()
+
+    # Antes: StreamHandler síncrono (basicConfig) formateando en el hilo de la solicitud
+    stream = logging.StreamHandler(io.StringIO())
+    stream.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+    legacy = microseconds_per_request(
+        legacy_lines, make_logger("bench.legacy", stream), requests, args.iterations
+    )
+
+    # Ahora: evento único encolado; se vacía la cola para no llenarla
+    handler = NonBlockingQueueHandler(queue.Queue())
+    handler.addFilter(SamplingFilter({logging.INFO: args.sample_rate}))
+    structured = microseconds_per_request(
+        structured_event, make_logger("bench.structured", handler), requests, args.iterations
+    )
+    formatter = JsonFormatter()
+    start = time.perf_counter()
+    pending = handler.queue.qsize()
+    while not handler.queue.empty():
+        formatter.format(handler.queue.get_nowait())
+    listener = (time.perf_counter() - start) / max(pending, 1) * 1e6
+
+    print(f"Antes (9 líneas, f-strings, escritura síncrona): {legacy:7.2f} µs por solicitud")
+    print(f"Ahora (evento único encolado):                  {structured:7.2f} µs por solicitud")
+    print(f"Formateo JSON en el hilo del listener:          {listener:7.2f} µs por evento")
+
+
+if __name__ == "__main__":
+    main()
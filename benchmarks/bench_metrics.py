@@ -0,0 +1,60 @@
+"""
+Microbenchmark del coste de la instrumentación: lo que añade `observe_stage` por
+etapa registrada y lo que tarda en exportarse `/metrics` con todas las series posibles.
+
+Uso:
+    python -m benchmarks.bench_metrics --iterations 200000
+"""
+
+# Python imports.
+import time
+import argparse
+import itertools
+
+# Project imports.
+from benchmarks.bench_prompts import build_requests
+from metrics import STAGE_LATENCY, observe_stage, render_metrics
+
+# Etapas instrumentadas en una generación sin streaming
+STAGES = ("validation", "prompt_build", "queue", "completion")
+
+
+def nanoseconds_per_call(function, requests: list, iterations: int) -> float:
+    """Coste medio en nanosegundos de `function(request)` recorriendo las solicitudes"""
+    cycle = itertools.islice(itertools.cycle(requests), iterations)
+    start = time.perf_counter_ns()
+    for request in cycle:
+        function(request)
+    return (time.perf_counter_ns() - start) / iterations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=200_000)
+    args = parser.parse_args()
+
+    requests = build_requests()
+    baseline = nanoseconds_per_call(lambda r: time.perf_counter(), requests, args.iterations)
+    observe = nanoseconds_per_call(
+        lambda r: observe_stage("completion", r, time.perf_counter()),
+        requests,
+        args.iterations,
+    )
+    per_observation = observe - baseline
+    print(f"observe_stage: {per_observation:8.0f} ns por etapa")
+    print(f"Por solicitud ({len(STAGES)} etapas): {per_observation * len(STAGES) / 1000:.2f} µs")
+
+    # Todas las combinaciones de etapa y parámetros con alguna observación
+    for stage, request in itertools.product(STAGES, requests):
+        observe_stage(stage, request, 0.1)
+    start = time.perf_counter()
+    text = render_metrics()
+    elapsed = time.perf_counter() - start
+    print(
+        f"render_metrics: {elapsed * 1000:.2f} ms para {len(STAGE_LATENCY._children)} series "
+        f"({len(text) / 1024:.0f} KiB)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Microbenchmark de `PromptManager.generate_prompt`: plantillas precompiladas frente al
+formateo en dos pasadas de `str.format` que se hacía en cada solicitud.
+
+Uso:
+    python -m benchmarks.bench_prompts --iterations 100000
+"""
+
+# Python imports.
+import time
+import argparse
+import itertools
+
+# Project imports.
+from models import StoryRequest, GENRES, CATEGORIES, CREATIVITY_LEVELS
+from prompt_manager import PromptManager
+
+
+def legacy_generate_prompt(manager: PromptManager, request: StoryRequest) -> str:
+    """Implementación anterior: dos pasadas de `str.format` por solicitud"""
+    genre_info = manager.get_genre_info(request.genre)
+    creativity_info = manager.get_creativity_info(request.creativity_level)
+    formatted_base_prompt = manager.prompts_data.get("base_prompt", "").format(
+        genre=request.genre,
+        category=request.category,
+        word_count=request.word_count,
+        creativity_level=request.creativity_level,
+        suggestions=request.suggestions or "Ninguna sugerencia específica",
+    )
+    return manager.prompts_data.get("prompt_template", "").format(
+        base_prompt=formatted_base_prompt,
+        genre=request.genre,
+        genre_description=genre_info.get("description", ""),
+        genre_elements=genre_info.get("elements", ""),
+        genre_tone=genre_info.get("tone", ""),
+        creativity_level=request.creativity_level,
+        creativity_instructions=creativity_info.get("instructions", ""),
+    )
+
+
+def build_requests() -> list:
+    """Una solicitud por cada combinación de parámetros"""
+    return [
+        StoryRequest(
+            word_count=300,
+            genre=genre,
+            category=category,
+            creativity_level=creativity_level,
+            suggestions="Un dragón en una montaña nevada",
+        )
+        for genre, category, creativity_level in itertools.product(
+            GENRES, CATEGORIES, CREATIVITY_LEVELS
+        )
+    ]
+
+
+def prompts_per_second(generate, requests: list, iterations: int) -> float:
+    """Prompts generados por segundo recorriendo las solicitudes en bucle"""
+    cycle = itertools.islice(itertools.cycle(requests), iterations)
+    start = time.perf_counter()
+    for request in cycle:
+        generate(request)
+    return iterations / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=100_000)
+    args = parser.parse_args()
+
+    manager = PromptManager()
+    requests = build_requests()
+    for request in requests:
+        assert manager.generate_prompt(request) == legacy_generate_prompt(manager, request)
+
+    before = prompts_per_second(
+        lambda r: legacy_generate_prompt(manager, r), requests, args.iterations
+    )
+    after = prompts_per_second(manager.generate_prompt, requests, args.iterations)
+    print(f"Antes (dos str.format):  {before:12,.0f} prompts/s")
+    print(f"Después (precompilado): {after:12,.0f} prompts/s")
+    print(f"Mejora: x{after / before:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Latencia de búsqueda del índice de sugerencias casi idénticas con muchas entradas:
+llena el índice con sugerencias sintéticas repartidas en varios scopes y mide
+búsquedas de variantes triviales de sugerencias indexadas (aciertos) y de
+sugerencias nuevas (fallos), además de la memoria que ocupa el índice.
+
+Uso:
+    python -m benchmarks.bench_semantic_cache --entries 1000000 --lookups 20000
+"""
+
+# Python imports.
+import gc
+import time
+import random
+import argparse
+from typing import List
+
+# Project imports.
+from benchmarks.harness import percentile
+from metrics import resident_memory_bytes
+from semantic_cache import NearDuplicateIndex
+
+SYLLABLES = "ba be bi bo bu da de di do du ga la le li lo lu ma me mi mo mu na ne ni no " \
+    "ra re ri ro ru sa se si so ta te ti to tu za ñu ló pé cí".split()
+
+
+def build_vocabulary(size: int, rng: random.Random) -> List[str]:
+    return [
+        "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(size)
+    ]
+
+
+def make_text(vocabulary: List[str], rng: random.Random) -> str:
+    return " ".join(rng.choice(vocabulary) for _ in range(rng.randint(4, 8)))
+
+
+def trivial_variant(text: str, rng: random.Random) -> str:
+    """Misma sugerencia con otras mayúsculas, acentos, puntuación y espacios"""
+    variant = text.upper() if rng.random() < 0.5 else text.capitalize()
+    variant = variant.replace("o", "ó").replace("O", "Ó")
+    return f"  {variant.replace(' ', '  ', 1)}!"
+
+
+def timed_lookups(index: NearDuplicateIndex, queries: list) -> tuple:
+    latencies, hits = [], 0
+    for scope, text in queries:
+        start = time.perf_counter()
+        match = index.lookup(scope, text)
+        latencies.append(time.perf_counter() - start)
+        hits += match is not None
+    return latencies, hits
+
+
+def report(title: str, latencies: List[float], hits: int) -> None:
+    print(
+        f"{title:<28} p50 {percentile(latencies, 50) * 1e6:7.1f} µs   "
+        f"p99 {percentile(latencies, 99) * 1e6:7.1f} µs   "
+        f"aciertos {hits / len(latencies):6.1%}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=20_000)
+    parser.add_argument("--scopes", type=int, default=72, help="Combinaciones de parámetros")
+    parser.add_argument("--threshold", type=float, default=0.85)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    vocabulary = build_vocabulary(5000, rng)
+    scopes = [f"scope-{i}" for i in range(args.scopes)]
+
+    index = NearDuplicateIndex(
+        threshold=args.threshold, max_entries=args.entries, max_bytes=1 << 40
+    )
+    gc.collect()
+    rss_before = resident_memory_bytes()
+    stored = []
+    start = time.perf_counter()
+    for i in range(args.entries):
+        scope, text = rng.choice(scopes), make_text(vocabulary, rng)
+        index.add(scope, text, f"historia {i}", ttl=86400)
+        if i % max(1, args.entries // args.lookups) == 0:
+            stored.append((scope, text))
+    build = time.perf_counter() - start
+    gc.collect()
+    rss = resident_memory_bytes() - rss_before
+
+    print(f"Entradas: {len(index)}   buckets: {index.stats()['buckets']}")
+    print(f"Inserción: {build / args.entries * 1e6:7.1f} µs por entrada ({build:.1f} s)")
+    print(f"Memoria del índice: {rss / 1024 / 1024:8.1f} MiB ({rss / len(index):.0f} B por entrada)")
+
+    variants = [(scope, trivial_variant(text, rng)) for scope, text in stored[:args.lookups]]
+    novel = [(rng.choice(scopes), make_text(vocabulary, rng)) for _ in range(len(variants))]
+    report("Variantes (aciertos):", *timed_lookups(index, variants))
+    report("Sugerencias nuevas (fallos):", *timed_lookups(index, novel))
+
+
+if __name__ == "__main__":
+    main()
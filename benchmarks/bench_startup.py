@@ -0,0 +1,120 @@
+"""
+Tiempo de arranque en frío de un worker, medido con `python -X importtime`:
+importación de `main` (con y sin la caché compilada de prompts) y arranque completo
+(importación más el lifespan, que crea los clientes de OpenAI). Con `--baseline`
+se mide también otro commit en un worktree temporal para comparar antes y después.
+
+Uso:
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --runs 5 --baseline HEAD~1
+"""
+
+# Python imports.
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Importa la app y ejecuta su lifespan (arranque y parada inmediata)
+FULL_STARTUP = """
+import time
+started = time.perf_counter()
+import asyncio
+import main
+
+async def run():
+    async with main.lifespan(main.app):
+        pass
+
+asyncio.run(run())
+print(time.perf_counter() - started)
+"""
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """Filas `(módulo, propio µs, acumulado µs)` de la salida de `-X importtime`"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(own), int(cumulative)))
+    return rows
+
+
+def run_python(cwd: str, env: Dict[str, str], *args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args], cwd=cwd, env=env, capture_output=True, text=True, check=True
+    )
+
+
+def measure(cwd: str, runs: int, cache_file: Optional[str] = None) -> Dict[str, object]:
+    """Mediana de la importación de `main` y del arranque completo en `cwd`"""
+    env = {**os.environ, "OPENAI_API_KEY": "fake-key", "PROMPTS_WATCH_INTERVAL": "0"}
+    if cache_file:
+        env["PROMPTS_CACHE_FILE"] = cache_file
+        # La primera ejecución genera la caché
+        run_python(cwd, env, "-c", "import main")
+
+    imports, full = [], []
+    rows: List[Tuple[str, int, int]] = []
+    for _ in range(runs):
+        result = run_python(cwd, env, "-X", "importtime", "-c", "import main")
+        rows = parse_importtime(result.stderr)
+        imports.append(next(cum for name, _, cum in rows if name == "main") / 1e6)
+        full.append(float(run_python(cwd, env, "-c", FULL_STARTUP).stdout.strip()))
+    heaviest = sorted(
+        ((name, cum) for name, _, cum in rows if name.split(".")[0] == name), key=lambda r: -r[1]
+    )[:8]
+    return {
+        "import_main": statistics.median(imports),
+        "full_startup": statistics.median(full),
+        "heaviest": heaviest,
+    }
+
+
+def report(title: str, result: Dict[str, object]) -> None:
+    print(f"\n{title}")
+    print(f"  import main:                    {result['import_main'] * 1000:8.1f} ms")
+    print(f"  import + lifespan (arranque):   {result['full_startup'] * 1000:8.1f} ms")
+    print("  Paquetes de primer nivel más lentos (acumulado):")
+    for name, cumulative in result["heaviest"]:
+        print(f"    {name:<24} {cumulative / 1000:8.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--baseline", help="Commit con el que comparar (p. ej. HEAD~1)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.baseline:
+            worktree = os.path.join(tmp, "baseline")
+            subprocess.run(
+                ["git", "worktree", "add", "--detach", worktree, args.baseline],
+                cwd=ROOT, check=True, capture_output=True,
+            )
+            try:
+                report(f"Antes ({args.baseline})", measure(worktree, args.runs))
+            finally:
+                subprocess.run(
+                    ["git", "worktree", "remove", "--force", worktree],
+                    cwd=ROOT, check=False, capture_output=True,
+                )
+        report("Ahora", measure(ROOT, args.runs))
+        cache_file = os.path.join(tmp, "prompts.cache")
+        report("Ahora con PROMPTS_CACHE_FILE", measure(ROOT, args.runs, cache_file))
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
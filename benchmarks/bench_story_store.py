@@ -0,0 +1,110 @@
+"""
+Almacén de historias con millones de filas: velocidad de inserción por lotes, coste de
+`StoryArchive.record` en la ruta de la solicitud frente a una inserción síncrona por
+historia, y latencia de una página de `GET /stories` al principio y a mitad de la
+tabla con cada combinación de filtros.
+
+Uso:
+    python -m benchmarks.bench_story_store --rows 2000000
+"""
+
+# Python imports.
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+# Project imports.
+from models import CATEGORIES, CREATIVITY_LEVELS, GENRES, StoryRequest
+from story_store import SQLiteStoryStore, StoryArchive, encode_cursor
+
+STORY = "Había una vez " + "palabra " * 300
+
+
+def make_rows(start: int, count: int, rng: random.Random) -> list:
+    return [
+        (
+            f"bench-{index}",
+            1_600_000_000 + index * 0.01,
+            rng.choice(GENRES),
+            rng.choice(CATEGORIES),
+            rng.choice(CREATIVITY_LEVELS),
+            300,
+            None,
+            STORY,
+            "{}",
+        )
+        for index in range(start, start + count)
+    ]
+
+
+def page_latency(store: SQLiteStoryStore, rows: int, filters: dict, repeat: int) -> tuple:
+    """Mediana en ms de la primera página y de una página a mitad de la tabla"""
+    middle = encode_cursor(1_600_000_000 + rows // 2 * 0.01, rows // 2)
+
+    def measure(cursor):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            asyncio.run(store.list(20, cursor, **filters))
+            samples.append(time.perf_counter() - start)
+        return statistics.median(samples) * 1000
+
+    return measure(None), measure(middle)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    rng = random.Random(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteStoryStore(os.path.join(tmp, "stories.db"))
+        start = time.perf_counter()
+        for offset in range(0, args.rows, args.batch_size):
+            count = min(args.batch_size, args.rows - offset)
+            asyncio.run(store.save_many(make_rows(offset, count, rng)))
+        elapsed = time.perf_counter() - start
+        print(f"Inserción por lotes de {args.batch_size}: {args.rows / elapsed:10.0f} filas/s")
+
+        # Ruta de la solicitud: inserción síncrona por historia frente a encolar
+        request = StoryRequest(
+            word_count=300, creativity_level="creativo", genre="drama", category="todos"
+        )
+        samples = []
+        for row in make_rows(args.rows, 200, rng):
+            start = time.perf_counter()
+            asyncio.run(store.save_many([row]))
+            samples.append(time.perf_counter() - start)
+        archive = StoryArchive(store, max_pending=10_000)
+        start = time.perf_counter()
+        for _ in range(5000):
+            archive.record(request, STORY, {"genre": "drama"})
+        record = (time.perf_counter() - start) / 5000
+        print(f"Inserción síncrona de una historia: {statistics.median(samples) * 1e6:8.1f} µs")
+        print(f"StoryArchive.record (escritura diferida): {record * 1e6:8.1f} µs")
+
+        print(f"\n{'Página de 20 historias (mediana)':<66} primera     a mitad")
+        for filters in (
+            {},
+            {"genre": "drama"},
+            {"genre": "drama", "category": "infantil"},
+            {"genre": "drama", "category": "infantil", "creativity_level": "locura"},
+            {"creativity_level": "locura"},
+        ):
+            first, middle = page_latency(store, args.rows, filters, args.repeat)
+            label = ", ".join(f"{k}={v}" for k, v in filters.items()) or "sin filtros"
+            print(f"  {label:<64} {first:7.2f} ms  {middle:7.2f} ms")
+        asyncio.run(store.close())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Escalado con el número de workers de `server.py`: solicitudes por segundo con carga
+cerrada (`--concurrency` clientes que envían la siguiente solicitud al recibir la
+respuesta) contra el servidor falso sin latencia, de modo que el límite es la CPU de
+los workers. Con historias largas, cada solicitud pasa por el cliente de OpenAI, el
+post-procesado y la serialización de la respuesta.
+
+Uso:
+    python -m benchmarks.bench_workers --workers 1,2,4 --duration 10
+"""
+
+# Python imports.
+import time
+import asyncio
+import argparse
+from typing import Dict, Sequence
+import httpx
+
+# Project imports.
+from benchmarks.fake_openai_server import FakeOpenAIServer, create_fake_openai_app
+from benchmarks.harness import free_port, start_api, wait_until_ready
+
+PAYLOAD = {
+    "word_count": 2000,
+    "creativity_level": "creativo",
+    "genre": "fantasia",
+    "category": "infantil",
+}
+STORY = " ".join(["palabra"] * 2000)
+
+
+async def closed_loop(base_url: str, concurrency: int, duration: float) -> float:
+    """Solicitudes correctas por segundo con `concurrency` clientes durante `duration`"""
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30, limits=limits) as client:
+
+        async def user(index: int, deadline: float) -> int:
+            ok = 0
+            sent = 0
+            while time.monotonic() < deadline:
+                # Sugerencias distintas para que no se agrupen ni se sirvan de caché
+                body = {**PAYLOAD, "suggestions": f"Variante {index}-{sent}"}
+                sent += 1
+                response = await client.post("/generate-story", json=body)
+                ok += response.status_code == 200
+            return ok
+
+        # Calentamiento: conexiones abiertas y primeras importaciones de cada worker
+        await user(-1, time.monotonic() + 0.5)
+        start = time.monotonic()
+        results = await asyncio.gather(
+            *(user(index, start + duration) for index in range(concurrency))
+        )
+        return sum(results) / (time.monotonic() - start)
+
+
+def measure(
+    worker_counts: Sequence[int], concurrency: int = 32, duration: float = 5
+) -> Dict[int, float]:
+    """Solicitudes por segundo para cada número de workers"""
+    results = {}
+    with FakeOpenAIServer(create_fake_openai_app(latency=0, content=STORY)) as upstream:
+        for workers in worker_counts:
+            port = free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            process = start_api(port, workers, upstream.base_url)
+            try:
+                wait_until_ready(base_url, process)
+                results[workers] = asyncio.run(closed_loop(base_url, concurrency, duration))
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--workers", default="1,2,4", help="Números de workers a comparar")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+
+    counts = [int(value) for value in args.workers.split(",")]
+    results = measure(counts, args.concurrency, args.duration)
+    baseline = results[counts[0]]
+    print(f"{'Workers':>8} {'Solicitudes/s':>14} {'Escalado':>9}")
+    for workers, rps in results.items():
+        print(f"{workers:>8} {rps:14.1f} {rps / baseline:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Servidor local compatible con OpenAI para pruebas de carga sin coste"""
+
+# Python imports.
+import json
+import math
+import time
+import uuid
+import random
+import socket
+import asyncio
+import threading
+import uvicorn
+from typing import Callable, Optional, Sequence, Union
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def lognormal_latency(median: float, sigma: float = 0.5) -> Callable[[], float]:
+    """Distribución log-normal de latencias (cola larga) con la mediana indicada"""
+    return lambda: random.lognormvariate(math.log(median), sigma)
+
+
+def create_fake_openai_app(
+    latency: Union[float, Callable[[], float]] = 0.5,
+    content: str = "Había una vez un dragón...",
+    token_delay: float = 0.0,
+    failures: Sequence[int] = (),
+    retry_after: Optional[float] = None,
+    error_rate: float = 0.0,
+    error_status: int = 500,
+) -> FastAPI:
+    """
+    Crea una app que imita `/v1/chat/completions`.
+    `latency` es la espera hasta el primer token (un valor fijo o una función que
+    devuelve una muestra, p. ej. `lognormal_latency`) y `token_delay` la pausa entre
+    fragmentos cuando se pide `stream=true`. Las primeras solicitudes responden con
+    los códigos de error de `failures` (p. ej. `[429, 500]`), con cabecera
+    `Retry-After` si se indica `retry_after`; además, cada solicitud falla con
+    probabilidad `error_rate` con el código `error_status`. Cada palabra cuenta como un token: si
+    `max_tokens` no alcanza, la respuesta se corta con `finish_reason="length"`, y una
+    continuación (mensaje `assistant` con el texto previo) sigue donde se quedó.
+    """
+    sample_latency = latency if callable(latency) else (lambda: latency)
+    app = FastAPI()
+    app.state.requests = 0
+    app.state.failures = list(failures)
+    app.state.healthy = True
+    app.state.probes = 0
+
+    def select_words(body: dict) -> tuple:
+        """Palabras a devolver y `finish_reason` según la continuación y `max_tokens`"""
+        words = content.split(" ")
+        offset = 0
+        assistant = [m for m in body.get("messages", []) if m.get("role") == "assistant"]
+        if assistant:
+            # La continuación puede recibir solo el final de lo ya escrito
+            partial = assistant[-1]["content"].strip()
+            if partial in content:
+                offset = len(content[: content.find(partial) + len(partial)].split())
+            else:
+                offset = len(partial.split())
+        max_tokens = body.get("max_tokens") or len(words)
+        selected = words[offset : offset + max_tokens]
+        finish_reason = "length" if offset + max_tokens < len(words) else "stop"
+        return selected, offset > 0, finish_reason
+
+    def usage(completion_tokens: int) -> dict:
+        """Uso de tokens simulado (100 de prompt y uno por palabra)"""
+        return {
+            "prompt_tokens": 100,
+            "completion_tokens": completion_tokens,
+            "total_tokens": 100 + completion_tokens,
+        }
+
+    async def stream_chunks(completion_id: str, model: str, body: dict):
+        """Emite el contenido palabra a palabra en formato SSE de OpenAI"""
+        await asyncio.sleep(sample_latency())
+        words, continued, finish_reason = select_words(body)
+        for i, word in enumerate(words):
+            text = word if i == 0 and not continued else f" {word}"
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+            if token_delay:
+                await asyncio.sleep(token_delay)
+        final = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}],
+        }
+        yield f"data: {json.dumps(final)}\n\n"
+        if (body.get("stream_options") or {}).get("include_usage"):
+            # Con stream_options.include_usage, un último fragmento sin choices
+            final = {**final, "choices": [], "usage": usage(len(words))}
+            yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    @app.get("/v1/models")
+    async def models():
+        """Lista de modelos (la usa la sonda de salud); falla si `app.state.healthy` es False"""
+        app.state.probes += 1
+        if not app.state.healthy:
+            return JSONResponse(
+                status_code=503, content={"error": {"message": "Servicio no disponible"}}
+            )
+        return {"object": "list", "data": [{"id": "fake-model", "object": "model"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        """Devuelve una chat completion tras esperar `latency` segundos"""
+        body = await request.json()
+        app.state.requests += 1
+        status_code = None
+        if app.state.failures:
+            status_code = app.state.failures.pop(0)
+        elif error_rate and random.random() < error_rate:
+            status_code = error_status
+        if status_code is not None:
+            headers = {"Retry-After": str(retry_after)} if retry_after is not None else {}
+            return JSONResponse(
+                status_code=status_code,
+                content={"error": {"message": f"Fallo inyectado {status_code}"}},
+                headers=headers,
+            )
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = body.get("model", "fake-model")
+        if body.get("stream"):
+            return StreamingResponse(
+                stream_chunks(completion_id, model, body),
+                media_type="text/event-stream"
+            )
+
+        await asyncio.sleep(sample_latency())
+        words, continued, finish_reason = select_words(body)
+        text = (" " if continued else "") + " ".join(words)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": finish_reason,
+                }
+            ],
+            "usage": usage(len(words)),
+        }
+
+    return app
+
+
+class FakeOpenAIServer:
+    """Ejecuta el servidor falso en un hilo aparte mientras dure el contexto"""
+
+    def __init__(self, app: FastAPI, host: str = "127.0.0.1", port: int = 0):
+        self.app = app
+        self.host = host
+        self.port = port or self._free_port(host)
+        self._server = uvicorn.Server(
+            uvicorn.Config(app, host=self.host, port=self.port, log_level="warning")
+        )
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    @staticmethod
+    def _free_port(host: str) -> int:
+        """Obtiene un puerto libre del sistema operativo"""
+        with socket.socket() as sock:
+            sock.bind((host, 0))
+            return sock.getsockname()[1]
+
+    @property
+    def base_url(self) -> str:
+        """URL base para configurar `OPENAI_BASE_URL`"""
+        return f"http://{self.host}:{self.port}/v1"
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
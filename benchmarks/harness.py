@@ -0,0 +1,419 @@
+"""
+Banco de pruebas de carga de la API contra el servidor falso de OpenAI.
+
+Levanta el servidor falso (latencias log-normales, velocidad de streaming y tasa de
+errores configurables) y la API con `server.py` y `WORKERS=N`, envía solicitudes a ritmo
+constante (modelo abierto: no espera a que terminen las anteriores) y mide latencias
+p50/p95/p99, solicitudes por segundo, retraso del event loop de cada worker (leído de
+`/metrics`) y memoria residente de cada worker. El resultado se guarda en JSON.
+
+Uso:
+    python -m benchmarks.harness --endpoint /generate-story --rps 50 --duration 30
+    python -m benchmarks.harness --endpoint /generate-story/stream --workers 2 \\
+        --latency-median 0.8 --token-delay 0.02 --error-rate 0.01
+    python -m benchmarks.harness --compare benchmarks/results/abc1234-20240101T120000.json
+"""
+
+# Python imports.
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import httpx
+
+# Project imports.
+from benchmarks.fake_openai_server import (
+    FakeOpenAIServer,
+    create_fake_openai_app,
+    lognormal_latency,
+)
+from benchmarks.load_test import PAYLOAD
+from metrics import resident_memory_bytes
+
+ENDPOINTS = ("/generate-story", "/generate-story/stream", "/generate-stories", "/jobs")
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Percentil `q` (0-100) con interpolación lineal"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    """p50, p95, p99, media y máximo en segundos"""
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": sum(values) / len(values) if values else None,
+        "max": max(values) if values else None,
+    }
+
+
+def histogram_quantile(buckets: List[Tuple[float, float]], q: float) -> Optional[float]:
+    """Cuantil `q` (0-1) de un histograma de Prometheus con buckets `(le, acumulado)`"""
+    if not buckets or buckets[-1][1] == 0:
+        return None
+    rank = q * buckets[-1][1]
+    previous_bound, previous_count = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float("inf"):
+                return previous_bound
+            fraction = (rank - previous_count) / (count - previous_count or 1)
+            return previous_bound + (bound - previous_bound) * fraction
+        previous_bound, previous_count = bound, count
+    return previous_bound
+
+
+def parse_loop_lag(text: str) -> Tuple[Optional[float], Dict[str, Any]]:
+    """Extrae el instante de arranque del worker y su histograma de retraso del event loop"""
+    start_time = None
+    buckets: List[Tuple[float, float]] = []
+    total = count = 0.0
+    for line in text.splitlines():
+        name, _, value = line.rpartition(" ")
+        if name == "process_start_time_seconds":
+            start_time = float(value)
+        elif name.startswith("event_loop_lag_seconds_bucket"):
+            le = name.split('le="')[1].split('"')[0]
+            buckets.append((float("inf") if le == "+Inf" else float(le), float(value)))
+        elif name == "event_loop_lag_seconds_sum":
+            total = float(value)
+        elif name == "event_loop_lag_seconds_count":
+            count = float(value)
+    return start_time, {
+        "samples": int(count),
+        "mean": total / count if count else None,
+        "p99": histogram_quantile(buckets, 0.99),
+    }
+
+
+def free_port() -> int:
+    """Obtiene un puerto libre del sistema operativo"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def worker_pids(master_pid: int) -> List[int]:
+    """PIDs de los workers de la API (el propio proceso si no hay hijos)"""
+    children = []
+    for entry in os.listdir("/proc") if os.path.isdir("/proc") else []:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat:
+                # El nombre del proceso va entre paréntesis y puede contener espacios
+                parent = int(stat.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if parent == master_pid:
+            children.append(int(entry))
+    # El maestro puede tener además un hijo de multiprocessing (resource_tracker)
+    workers = [pid for pid in children if "resource_tracker" not in _cmdline(pid)]
+    return workers or [master_pid]
+
+
+def _cmdline(pid: int) -> str:
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as cmdline:
+            return cmdline.read().replace(b"\0", b" ").decode(errors="replace")
+    except OSError:
+        return ""
+
+
+def start_api(
+    port: int, workers: int, upstream_url: str, verbose: bool = False
+) -> subprocess.Popen:
+    """
+    Arranca la API con `server.py` (entrada de producción) apuntando al servidor falso,
+    sin logs salvo `verbose`
+    """
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "fake-key",
+        "OPENAI_BASE_URL": upstream_url,
+        "LLM_BACKENDS": "",
+        "HOST": "127.0.0.1",
+        "PORT": str(port),
+        "WORKERS": str(workers),
+        "LOG_LEVEL": "INFO" if verbose else "WARNING",
+    }
+    command = [sys.executable, "server.py"]
+    output = None if verbose else subprocess.DEVNULL
+    return subprocess.Popen(
+        command,
+        env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdout=output,
+        stderr=output,
+    )
+
+
+def wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float = 30) -> None:
+    """Espera a que la API responda en /health"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("La API terminó durante el arranque")
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError("La API no arrancó a tiempo")
+
+
+def build_body(endpoint: str, index: int, identical: bool, batch_size: int) -> Dict[str, Any]:
+    """Cuerpo de la solicitud número `index` (sugerencias distintas salvo `identical`)"""
+    story = dict(PAYLOAD) if identical else {**PAYLOAD, "suggestions": f"Variante {index}"}
+    if endpoint == "/generate-stories":
+        return {
+            "requests": [
+                {**story, "suggestions": f"{story.get('suggestions', '')} {i}"}
+                for i in range(batch_size)
+            ]
+        }
+    if endpoint == "/jobs":
+        return {"request": story}
+    return story
+
+
+async def send(client: httpx.AsyncClient, endpoint: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    """Envía una solicitud y mide la latencia total y hasta el primer byte del cuerpo"""
+    start = time.perf_counter()
+    first_byte = None
+    try:
+        async with client.stream("POST", endpoint, json=body) as response:
+            async for _ in response.aiter_bytes():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - start
+            status = response.status_code
+    except httpx.HTTPError as e:
+        return {"status": type(e).__name__, "latency": time.perf_counter() - start}
+    return {
+        "status": status,
+        "latency": time.perf_counter() - start,
+        "first_byte": first_byte,
+    }
+
+
+async def drive(
+    base_url: str,
+    endpoint: str,
+    rps: float,
+    duration: float,
+    identical: bool,
+    batch_size: int,
+    pids: List[int],
+) -> Tuple[List[Dict[str, Any]], float, Dict[int, int]]:
+    """
+    Envía `rps` solicitudes por segundo durante `duration` segundos sin esperar a las
+    anteriores y muestrea la memoria de los workers. Devuelve las muestras, la
+    duración real y el pico de RSS por worker.
+    """
+    peak_rss = {pid: 0 for pid in pids}
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=1000)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        tasks = []
+        start = time.perf_counter()
+        total = int(rps * duration)
+        next_rss = start
+        for index in range(total):
+            delay = start + index / rps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            body = build_body(endpoint, index, identical, batch_size)
+            tasks.append(asyncio.create_task(send(client, endpoint, body)))
+            if time.perf_counter() >= next_rss:
+                for pid in pids:
+                    peak_rss[pid] = max(peak_rss[pid], resident_memory_bytes(str(pid)))
+                next_rss += 0.5
+        samples = await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+    for pid in pids:
+        peak_rss[pid] = max(peak_rss[pid], resident_memory_bytes(str(pid)))
+    return samples, elapsed, peak_rss
+
+
+def scrape_loop_lag(base_url: str, workers: int) -> List[Dict[str, Any]]:
+    """Lee /metrics varias veces para obtener el retraso del event loop de cada worker"""
+    by_worker: Dict[float, Dict[str, Any]] = {}
+    for _ in range(workers * 8):
+        try:
+            text = httpx.get(f"{base_url}/metrics", timeout=5).text
+        except httpx.HTTPError:
+            continue
+        start_time, lag = parse_loop_lag(text)
+        if start_time is not None:
+            by_worker[start_time] = lag
+        if len(by_worker) >= workers:
+            break
+    return list(by_worker.values())
+
+
+def git_commit() -> str:
+    """Commit actual (o `unknown` fuera de un repositorio)"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmark(
+    endpoint: str = "/generate-story",
+    rps: float = 20,
+    duration: float = 10,
+    workers: int = 1,
+    latency_median: float = 0.5,
+    latency_sigma: float = 0.5,
+    token_delay: float = 0.0,
+    error_rate: float = 0.0,
+    identical: bool = False,
+    batch_size: int = 5,
+    verbose: bool = False,
+) -> Dict[str, Any]:
+    """Ejecuta el benchmark completo y devuelve el resultado como diccionario"""
+    config = {
+        "endpoint": endpoint,
+        "rps": rps,
+        "duration": duration,
+        "workers": workers,
+        "latency_median": latency_median,
+        "latency_sigma": latency_sigma,
+        "token_delay": token_delay,
+        "error_rate": error_rate,
+        "identical": identical,
+        "batch_size": batch_size,
+    }
+    fake_app = create_fake_openai_app(
+        latency=lognormal_latency(latency_median, latency_sigma) if latency_sigma else latency_median,
+        content=" ".join(["palabra"] * 50),
+        token_delay=token_delay,
+        error_rate=error_rate,
+    )
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with FakeOpenAIServer(fake_app) as upstream:
+        process = start_api(port, workers, upstream.base_url, verbose)
+        try:
+            wait_until_ready(base_url, process)
+            pids = worker_pids(process.pid)
+            samples, elapsed, peak_rss = asyncio.run(
+                drive(base_url, endpoint, rps, duration, identical, batch_size, pids)
+            )
+            loop_lag = scrape_loop_lag(base_url, workers)
+        finally:
+            process.terminate()
+            process.wait(timeout=15)
+
+    ok = [s for s in samples if s["status"] in (200, 202)]
+    statuses: Dict[str, int] = {}
+    for sample in samples:
+        statuses[str(sample["status"])] = statuses.get(str(sample["status"]), 0) + 1
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "config": config,
+        "results": {
+            "requests": len(samples),
+            "ok": len(ok),
+            "status_counts": statuses,
+            "requests_per_second": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+            "latency_seconds": summarize([s["latency"] for s in ok]),
+            "first_byte_seconds": summarize(
+                [s["first_byte"] for s in ok if s.get("first_byte") is not None]
+            ),
+            "event_loop_lag_seconds": loop_lag,
+            "rss_bytes_per_worker": list(peak_rss.values()),
+            "upstream_requests": fake_app.state.requests,
+        },
+    }
+
+
+def save_result(result: Dict[str, Any], output: Optional[str] = None) -> str:
+    """Guarda el resultado en JSON y devuelve la ruta"""
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{result['commit']}-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(result, file, indent=2)
+    return output
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Líneas con la variación de las métricas principales respecto a una ejecución anterior"""
+    lines = [f"Comparación con {baseline['commit']} ({baseline['timestamp']}):"]
+    pairs = [
+        ("requests_per_second", current["results"], baseline["results"]),
+        ("p50", current["results"]["latency_seconds"], baseline["results"]["latency_seconds"]),
+        ("p95", current["results"]["latency_seconds"], baseline["results"]["latency_seconds"]),
+        ("p99", current["results"]["latency_seconds"], baseline["results"]["latency_seconds"]),
+    ]
+    for name, now, before in pairs:
+        if now.get(name) is None or not before.get(name):
+            continue
+        change = (now[name] - before[name]) / before[name] * 100
+        lines.append(f"  {name:>20}: {before[name]:.3f} → {now[name]:.3f} ({change:+.1f}%)")
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--endpoint", choices=ENDPOINTS, default="/generate-story")
+    parser.add_argument("--rps", type=float, default=20, help="Solicitudes por segundo")
+    parser.add_argument("--duration", type=float, default=10, help="Segundos de carga")
+    parser.add_argument("--workers", type=int, default=1, help="Workers de la API (WORKERS)")
+    parser.add_argument("--latency-median", type=float, default=0.5)
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="0 = latencia fija")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Segundos por fragmento")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--identical", action="store_true", help="Misma solicitud siempre")
+    parser.add_argument("--batch-size", type=int, default=5)
+    parser.add_argument("--verbose", action="store_true", help="Muestra los logs de la API")
+    parser.add_argument("--output", help="Ruta del JSON (por defecto benchmarks/results/)")
+    parser.add_argument("--compare", help="JSON de una ejecución anterior")
+    args = parser.parse_args()
+
+    result = run_benchmark(
+        endpoint=args.endpoint,
+        rps=args.rps,
+        duration=args.duration,
+        workers=args.workers,
+        latency_median=args.latency_median,
+        latency_sigma=args.latency_sigma,
+        token_delay=args.token_delay,
+        error_rate=args.error_rate,
+        identical=args.identical,
+        batch_size=args.batch_size,
+        verbose=args.verbose,
+    )
+    path = save_result(result, args.output)
+    print(json.dumps(result["results"], indent=2))
+    print(f"Resultado guardado en {path}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            print("\n".join(compare(result, json.load(file))))
+
+
+if __name__ == "__main__":
+    main()
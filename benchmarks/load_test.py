@@ -0,0 +1,73 @@
+"""
+Prueba de carga de `/generate-story` contra el servidor falso de OpenAI.
+
+Uso:
+    python -m benchmarks.load_test --requests 20 --latency 0.5
+"""
+
+# Python imports.
+import time
+import asyncio
+import argparse
+import httpx
+
+# Project imports.
+from benchmarks.fake_openai_server import FakeOpenAIServer, create_fake_openai_app
+from config import override_settings
+
+PAYLOAD = {
+    "word_count": 300,
+    "creativity_level": "creativo",
+    "genre": "fantasia",
+    "category": "infantil",
+}
+
+
+async def run_concurrent_requests(total: int) -> float:
+    """
+    Lanza `total` solicitudes simultáneas y devuelve el tiempo transcurrido.
+    Cada una lleva sugerencias distintas para que no se agrupen en una sola llamada.
+    """
+    from main import app, lifespan
+
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test", timeout=60
+        ) as client:
+            start = time.perf_counter()
+            responses = await asyncio.gather(
+                *(
+                    client.post(
+                        "/generate-story", json={**PAYLOAD, "suggestions": f"Variante {i}"}
+                    )
+                    for i in range(total)
+                )
+            )
+            elapsed = time.perf_counter() - start
+
+    failed = [r for r in responses if r.status_code != 200]
+    if failed:
+        raise RuntimeError(f"{len(failed)} solicitudes fallaron: {failed[0].text}")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    with FakeOpenAIServer(create_fake_openai_app(latency=args.latency)) as server:
+        with override_settings(openai_api_key="fake-key", openai_base_url=server.base_url):
+            elapsed = asyncio.run(run_concurrent_requests(args.requests))
+
+    print(
+        f"{args.requests} solicitudes concurrentes en {elapsed:.2f}s "
+        f"(latencia de una completion: {args.latency:.2f}s, "
+        f"serializado serían ~{args.requests * args.latency:.2f}s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
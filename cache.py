@@ -0,0 +1,250 @@
+"""Caché de historias generadas para solicitudes deterministas"""
+
+# Python imports.
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# Project imports.
+from models import StoryRequest
+from services import completion_params
+from prompt_manager import prompt_manager
+from config import settings
+from shared_state import state_client
+
+# Configuración de logging.
+logger = logging.getLogger(__name__)
+
+
+def make_request_key(request: StoryRequest, prompt_version: Optional[str] = None) -> str:
+    """
+    Calcula la clave de una solicitud normalizada junto con el modelo, los
+    parámetros de muestreo y la versión de las plantillas (por defecto la activa), de
+    modo que cambiar cualquiera de ellos invalide la caché
+    """
+    suggestions = " ".join((request.suggestions or "").split())
+    payload = {
+        "genre": request.genre,
+        "category": request.category,
+        "creativity_level": request.creativity_level,
+        "word_count": request.word_count,
+        "suggestions": suggestions,
+        "prompt_version": prompt_version or prompt_manager.version,
+        **completion_params(),
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def encode_entry(story: str, model: str, prompt_version: str) -> str:
+    """
+    Serializa una historia cacheada junto con el modelo y la versión de las plantillas
+    que la generaron
+    """
+    return json.dumps(
+        {"story": story, "model": model, "prompt_version": prompt_version}, ensure_ascii=False
+    )
+
+
+def decode_entry(value: str) -> Optional[Tuple[str, str, str]]:
+    """
+    Historia, modelo y versión de las plantillas de una entrada; None si no tiene el
+    formato esperado
+    """
+    try:
+        entry = json.loads(value)
+        return entry["story"], entry["model"], entry["prompt_version"]
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+class CacheBackend:
+    """Interfaz de almacenamiento para la caché de historias"""
+
+    async def get(self, key: str) -> Optional[str]:
+        """Obtiene un valor o None si no existe o expiró"""
+        raise NotImplementedError
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        """Guarda un valor con un tiempo de vida en segundos"""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        """Libera los recursos del backend"""
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores propios del backend"""
+        return {}
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Caché LRU en memoria con expiración por TTL y límite de tamaño en bytes"""
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 10 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[float, str, int]]" = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        size = len(key) + len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, value, size)
+        self._bytes += size
+        # Expulsar las entradas menos usadas hasta respetar los límites
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        """Elimina una entrada y actualiza el tamaño ocupado"""
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class KeyValueCacheBackend(CacheBackend):
+    """
+    Backend sobre un almacén clave-valor externo con la interfaz de `redis.asyncio`
+    (`get(key)`, `set(key, value, ex=segundos)`), sustituible por un doble local en pruebas
+    """
+
+    def __init__(self, client: Any, prefix: str = "story-cache:"):
+        self.client = client
+        self.prefix = prefix
+        self.errors = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        try:
+            value = await self.client.get(self.prefix + key)
+        except Exception as e:
+            # Un fallo del almacén externo se trata como miss, nunca como error
+            self.errors += 1
+            logger.warning("Error al leer de la caché externa: %s", e)
+            return None
+        if isinstance(value, bytes):
+            value = value.decode("utf-8")
+        return value
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        try:
+            await self.client.set(self.prefix + key, value, ex=max(1, int(ttl)))
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Error al escribir en la caché externa: %s", e)
+
+    async def close(self) -> None:
+        close = getattr(self.client, "aclose", None) or getattr(self.client, "close", None)
+        if close is not None:
+            await close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"errors": self.errors}
+
+
+class StoryCache:
+    """Caché de historias delante de `generate_story_with_llm`"""
+
+    def __init__(self, backend: CacheBackend, ttl: float = 3600):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def is_cacheable(request: StoryRequest) -> bool:
+        """Solo se cachean las solicitudes sin sugerencias libres"""
+        return not (request.suggestions and request.suggestions.strip())
+
+    async def get(self, request: StoryRequest) -> Optional[Tuple[str, str, str]]:
+        """
+        Devuelve la historia cacheada para la solicitud, su modelo y la versión de las
+        plantillas, si existe
+        """
+        if not self.is_cacheable(request):
+            return None
+        value = await self.backend.get(make_request_key(request))
+        # Las entradas con otro formato (versiones anteriores) cuentan como fallo
+        entry = decode_entry(value) if value is not None else None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    async def set(
+        self, request: StoryRequest, story: str, model: str, prompt_version: str
+    ) -> None:
+        """
+        Guarda la historia generada para la solicitud, con el modelo y la versión de las
+        plantillas que la generaron; la clave usa esa versión y no la activa, que puede
+        haber cambiado durante la generación
+        """
+        if self.is_cacheable(request):
+            await self.backend.set(
+                make_request_key(request, prompt_version),
+                encode_entry(story, model, prompt_version),
+                self.ttl,
+            )
+
+    async def close(self) -> None:
+        """Cierra el backend de la caché"""
+        await self.backend.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de aciertos, fallos y expulsiones"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            **self.backend.stats(),
+        }
+
+
+def build_story_cache() -> Optional[StoryCache]:
+    """Crea la caché según la configuración, o None si está desactivada"""
+    if not settings.cache_enabled:
+        return None
+
+    client = state_client("cache")
+    if client is not None:
+        backend = KeyValueCacheBackend(client)
+    else:
+        backend = MemoryCacheBackend(
+            max_entries=settings.cache_max_entries,
+            max_bytes=settings.cache_max_bytes,
+        )
+    return StoryCache(backend, ttl=settings.cache_ttl_seconds)
+
+
+# Instancia global de la caché (None si CACHE_ENABLED=false)
+story_cache = build_story_cache()
@@ -0,0 +1,71 @@
+"""Agrupación (single-flight) de solicitudes idénticas que están en curso a la vez"""
+
+# Python imports.
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+# Project imports.
+from config import settings
+from metrics import COALESCED_CALLS
+
+# Configuración de logging.
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Ejecuta una sola vez las operaciones con la misma clave que coinciden en el tiempo.
+    La primera (líder) corre en su propia tarea y el resto espera su resultado; cada
+    solicitud espera a través de `asyncio.shield`, así que cancelar una (p. ej. porque
+    el cliente se desconecta) no cancela la llamada compartida.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Operaciones compartidas en curso"""
+        return len(self._calls)
+
+    async def do(self, key: str, operation: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        Devuelve el resultado de `operation()` para la clave y si se compartió con una
+        llamada que ya estaba en curso
+        """
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+            COALESCED_CALLS.labels().inc()
+        else:
+            self.leaders += 1
+            task = asyncio.create_task(operation())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        """Retira la operación terminada para que la siguiente vuelva a llamar al LLM"""
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Si todas las solicitudes se cancelaron, nadie más leerá la excepción
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """Llamadas compartidas y agrupadas"""
+        return {
+            "in_flight": self.in_flight,
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
+
+
+# Instancia global (None si COALESCING_ENABLED=false)
+story_flight: Optional[SingleFlight] = SingleFlight() if settings.coalescing_enabled else None
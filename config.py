@@ -1,67 +1,420 @@
 import os
-from typing import Optional
-from dotenv import load_dotenv
+import json
 import logging
+import contextlib
+import dataclasses
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple, get_type_hints
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
-# Cargar variables de entorno desde .env
-logger.info("=" * 50)
-logger.info("CARGANDO ARCHIVO .env:")
-logger.info(f"Directorio actual: {os.getcwd()}")
-logger.info(f"Archivo .env existe: {os.path.exists('.env')}")
 
-# Intentar cargar .env
-load_dotenv()
+def _parse_bool(value: str) -> bool:
+    value = value.lower()
+    if value in ("1", "true", "yes", "on"):
+        return True
+    if value in ("", "0", "false", "no", "off"):
+        return False
+    raise ValueError("se esperaba true o false")
+
+
+def _parse_optional(value: str) -> Optional[str]:
+    # Una variable vacía equivale a no configurarla
+    return value or None
+
+
+def _parse_ints(value: str) -> Tuple[int, ...]:
+    return tuple(int(item) for item in value.split(","))
+
+
+def _parse_origins(value: str) -> Tuple[str, ...]:
+    return tuple(origin.strip() for origin in value.split(","))
+
+
+def _parse_list(value: str) -> Tuple[str, ...]:
+    return tuple(item.strip() for item in value.split(",") if item.strip())
+
+
+def _parse_hosts(value: str) -> Tuple[str, ...]:
+    return tuple(host.strip().lower() for host in value.split(",") if host.strip())
+
+
+def _parse_backends(value: str) -> Tuple[Dict[str, Any], ...]:
+    backends = json.loads(value or "[]")
+    if not isinstance(backends, list) or not all(isinstance(b, dict) for b in backends):
+        raise ValueError("se esperaba una lista JSON de objetos")
+    return tuple(backends)
 
-# Verificar variables después de cargar
-logger.info("VARIABLES DE ENTORNO DESPUÉS DE CARGAR .env:")
-logger.info(f"CORS_ORIGINS: '{os.getenv('CORS_ORIGINS')}'")
-logger.info(
-    f"OPENAI_API_KEY: {'Configurada' if os.getenv('OPENAI_API_KEY') else 'No configurada'}"
-)
-logger.info("=" * 50)
 
+# Campos de cada backend de LLM_BACKENDS y su tipo
+_BACKEND_FIELDS = {
+    "name": str,
+    "base_url": str,
+    "model": str,
+    "api_key": str,
+    "weight": (int, float),
+    "max_concurrency": int,
+    "cheap": bool,
+}
 
+
+def _backend_errors(index: int, backend: Dict[str, Any]) -> List[str]:
+    """Problemas de un backend de LLM_BACKENDS"""
+    label = f"LLM_BACKENDS[{index}]"
+    errors = []
+    for key, value in backend.items():
+        expected = _BACKEND_FIELDS.get(key)
+        if expected is None:
+            errors.append(f"{label}: campo desconocido {key!r}")
+        elif value is None and key in ("base_url", "api_key"):
+            # Sin valor se usan OPENAI_BASE_URL y OPENAI_API_KEY
+            continue
+        # bool es subclase de int: no se acepta como número
+        elif not isinstance(value, expected) or (expected is not bool and isinstance(value, bool)):
+            errors.append(f"{label}: tipo inválido para {key!r}")
+        elif key in ("weight", "max_concurrency") and value <= 0:
+            errors.append(f"{label}: {key!r} debe ser mayor que 0")
+    return errors
+
+
+# Conversión de las variables de entorno según el tipo del campo
+_PARSERS = {
+    str: str,
+    int: int,
+    float: float,
+    bool: _parse_bool,
+    Optional[str]: _parse_optional,
+}
+
+
+class ConfigError(ValueError):
+    """Configuración inválida; `errors` enumera todos los problemas encontrados"""
+
+    def __init__(self, errors: List[str]):
+        super().__init__("Configuración inválida: " + "; ".join(errors))
+        self.errors = errors
+
+
+def _env(parse=None, **options):
+    """Campo leído de la variable de entorno con su nombre en mayúsculas"""
+    return field(metadata={"parse": parse} if parse else {}, **options)
+
+
+@dataclass(frozen=True)
 class Settings:
-    """Configuración de la aplicación"""
+    """
+    Configuración de la aplicación. Se lee y valida una sola vez al arrancar
+    (`get_settings`) y no cambia durante la vida del proceso.
+    """
 
     # OpenAI Configuration
-    openai_api_key: Optional[str] = os.getenv("OPENAI_API_KEY")
-    openai_model: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-    openai_max_tokens: int = int(os.getenv("OPENAI_MAX_TOKENS", "2000"))
-    openai_temperature: float = float(os.getenv("OPENAI_TEMPERATURE", "0.8"))
+    openai_api_key: Optional[str] = _env(default=None)
+    openai_model: str = _env(default="gpt-4o-mini")
+    openai_max_tokens: int = _env(default=2000)
+    openai_temperature: float = _env(default=0.8)
+    openai_base_url: Optional[str] = _env(default=None)
+    # Máximo de llamadas simultáneas al LLM por proceso
+    openai_max_concurrency: int = _env(default=50)
+
+    # Routing Configuration (varios backends compatibles con OpenAI)
+    # Lista JSON de backends: [{"name", "base_url", "model", "api_key", "weight",
+    # "max_concurrency", "cheap"}]; vacía usa OPENAI_BASE_URL y OPENAI_MODEL
+    llm_backends: Tuple[Dict[str, Any], ...] = _env(_parse_backends, default=())
+    # Segundos antes de duplicar una llamada lenta en otro backend (0 desactiva)
+    llm_hedge_delay: float = _env(default=0.0)
+    # Enviar historias cortas o "conservador" a los backends marcados como "cheap"
+    llm_cheap_routing: bool = _env(default=False)
+    llm_cheap_max_words: int = _env(default=200)
+    llm_router_ewma_alpha: float = _env(default=0.2)
+
+    # Token Budget (max_tokens por solicitud a partir de word_count)
+    # Tokens por palabra iniciales; se ajustan con el uso real de cada respuesta
+    tokens_per_word: float = _env(default=1.6)
+    # Margen sobre la estimación para no cortar historias que se alargan un poco
+    token_budget_headroom: float = _env(default=1.3)
+    token_budget_min_tokens: int = _env(default=64)
+    token_budget_ewma_alpha: float = _env(default=0.1)
+    # Continuaciones si la respuesta se corta por max_tokens (finish_reason=length)
+    llm_max_continuations: int = _env(default=2)
+
+    # Resilience Configuration (reintentos, plazos y circuit breaker)
+    llm_retry_max_attempts: int = _env(default=3)
+    llm_retry_base_delay: float = _env(default=0.5)
+    llm_retry_max_delay: float = _env(default=8.0)
+    # Segundos disponibles por solicitud si el cliente no envía X-Request-Timeout
+    llm_request_budget: float = _env(default=90.0)
+    breaker_window: int = _env(default=20)
+    breaker_min_requests: int = _env(default=10)
+    breaker_error_rate: float = _env(default=0.5)
+    breaker_open_seconds: float = _env(default=30.0)
+
+    # HTTP Connection Pool (cliente compartido con OpenAI)
+    openai_pool_max_connections: int = _env(default=100)
+    openai_pool_max_keepalive: int = _env(default=20)
+    openai_pool_keepalive_expiry: float = _env(default=30.0)
+    openai_http2: bool = _env(default=False)
+    openai_connect_timeout: float = _env(default=5.0)
+    openai_read_timeout: float = _env(default=120.0)
+
+    # Story Cache Configuration (desactivada por defecto)
+    cache_enabled: bool = _env(default=False)
+    # memory | redis; vacío usa SHARED_STATE_BACKEND (igual con la URL)
+    cache_backend: str = _env(default="")
+    cache_redis_url: str = _env(default="")
+    cache_ttl_seconds: float = _env(default=3600.0)
+    cache_max_entries: int = _env(default=1000)
+    cache_max_bytes: int = _env(default=10 * 1024 * 1024)
+
+    # Semantic Cache Configuration (sugerencias casi idénticas, desactivada por defecto)
+    semantic_cache_enabled: bool = _env(default=False)
+    # Similitud de Jaccard mínima entre los trigramas de las sugerencias normalizadas
+    semantic_cache_threshold: float = _env(default=0.85)
+    semantic_cache_max_entries: int = _env(default=10000)
+    semantic_cache_max_bytes: int = _env(default=50 * 1024 * 1024)
+
+    # Story Store Configuration (historias generadas en SQLite, desactivado por defecto)
+    story_store_enabled: bool = _env(default=False)
+    story_store_path: str = _env(default="stories.db")
+    # Historias por inserción y segundos máximos antes de escribir las pendientes
+    story_store_batch_size: int = _env(default=100)
+    story_store_flush_interval: float = _env(default=0.5)
+    # Historias pendientes de escribir; si se llena, las nuevas no se guardan
+    story_store_max_pending: int = _env(default=10000)
+
+    # Post-processing Configuration (título, palabras reales y contenido por categoría)
+    # Desviación relativa aceptada entre las palabras pedidas y las generadas
+    postprocess_word_tolerance: float = _env(default=0.25)
+    # Llamadas de corrección por historia fuera de tolerancia (0 = solo analizar)
+    postprocess_max_repairs: int = _env(default=1)
+
+    # Story Pool Configuration (historias pregeneradas, desactivado por defecto)
+    story_pool_enabled: bool = _env(default=False)
+    story_pool_depth: int = _env(default=3)
+    story_pool_low_watermark: int = _env(default=1)
+    story_pool_refill_rate: float = _env(default=0.5)
+    story_pool_max_age_seconds: float = _env(default=86400.0)
+    story_pool_word_buckets: Tuple[int, ...] = _env(
+        _parse_ints, default=(100, 300, 500, 1000, 2000)
+    )
+    story_pool_word_tolerance: float = _env(default=0.2)
+    story_pool_max_keys: int = _env(default=100)
+
+    # Coalescing Configuration (una sola llamada al LLM por solicitud idéntica en curso)
+    coalescing_enabled: bool = _env(default=True)
+
+    # Batch Configuration
+    batch_max_items: int = _env(default=500)
+    batch_concurrency: int = _env(default=8)
+
+    # Jobs Configuration (cola de trabajos asíncronos)
+    jobs_workers: int = _env(default=4)
+    jobs_max_queue: int = _env(default=1000)
+    jobs_ttl_seconds: float = _env(default=3600.0)
+    jobs_callback_timeout: float = _env(default=10.0)
+    # Hosts admitidos en callback_url (y sus subdominios); vacío: cualquier host público
+    jobs_callback_allowed_hosts: Tuple[str, ...] = _env(_parse_hosts, default=())
+    jobs_backend: str = _env(default="")
+    jobs_redis_url: str = _env(default="")
+
+    # Rate Limit Configuration (admisión por cliente y global en los endpoints de generación)
+    rate_limit_enabled: bool = _env(default=False)
+    # Token bucket por cliente (API key o IP): solicitudes por segundo y ráfaga máxima
+    rate_limit_client_rate: float = _env(default=1.0)
+    rate_limit_client_burst: int = _env(default=10)
+    rate_limit_client_concurrency: int = _env(default=5)
+    # Token bucket global, dimensionado según la cuota del proveedor
+    rate_limit_global_rate: float = _env(default=50.0)
+    rate_limit_global_burst: int = _env(default=100)
+    # API keys válidas: solo estas identifican al cliente; las demás se limitan por IP
+    rate_limit_api_keys: Tuple[str, ...] = _env(_parse_list, default=())
+    # Usar la última IP de X-Forwarded-For, la que añade el proxy de confianza
+    rate_limit_trust_forwarded: bool = _env(default=False)
+    rate_limit_backend: str = _env(default="")
+    rate_limit_redis_url: str = _env(default="")
+
+    # Prompts Configuration
+    # Segundos entre comprobaciones de cambios en prompts.yaml (0 desactiva la vigilancia)
+    prompts_watch_interval: float = _env(default=5.0)
+    # Copia ya parseada de prompts.yaml para arrancar sin el parser de YAML (vacío desactiva)
+    prompts_cache_file: Optional[str] = _env(default=None)
+    # Token para los endpoints /admin (sin token, los endpoints están desactivados)
+    admin_token: Optional[str] = _env(default=None)
+
+    # Logging Configuration
+    log_level: str = _env(default="INFO")
+    # text | json (una línea JSON por registro)
+    log_format: str = _env(default="text")
+    # Proporción de registros que se conservan por nivel, p. ej. "DEBUG=0.01,INFO=0.1"
+    log_sample_rates: str = _env(default="")
+    # Registros pendientes de escribir; si se llena, los nuevos se descartan
+    log_queue_size: int = _env(default=10000)
+
+    # Segundos entre mediciones del retraso del event loop (0 desactiva)
+    loop_lag_interval: float = _env(default=0.5)
+
+    # Health Configuration (sonda del proveedor y disponibilidad del worker)
+    # Segundos entre comprobaciones de los backends del LLM (0 desactiva la sonda)
+    health_probe_interval: float = _env(default=15.0)
+    health_probe_timeout: float = _env(default=5.0)
+    # Umbrales a partir de los que /health/ready responde 503 (0 desactiva cada uno)
+    readiness_max_in_flight: int = _env(default=200)
+    readiness_max_loop_lag: float = _env(default=0.5)
+    # No estar listo si ningún backend del LLM responde a la sonda
+    readiness_require_upstream: bool = _env(default=True)
+
+    # Shared State Configuration (caché, límites y trabajos compartidos entre workers)
+    # memory (por proceso) | redis; cada componente puede cambiarlo con su *_BACKEND
+    shared_state_backend: str = _env(default="memory")
+    shared_state_redis_url: str = _env(default="redis://localhost:6379/0")
 
     # Server Configuration
-    host: str = os.getenv("HOST", "0.0.0.0")
-    port: int = int(os.getenv("PORT", "8000"))
-
-    # CORS Configuration - Permitir todos los orígenes para desarrollo
-    def _get_cors_origins(self) -> list:
-        """Obtiene los orígenes CORS - permite todos para desarrollo"""
-        cors_env = os.getenv("CORS_ORIGINS", "*")
-
-        if cors_env == "*":
-            # En desarrollo, permitir TODOS los orígenes
-            result = ["*"]
-            logger.info(f"CORS configurado para permitir todos: {result}")
-            return result
-        else:
-            # Usar los orígenes específicos configurados
-            result = [origin.strip() for origin in cors_env.split(",")]
-            logger.info(f"CORS configurado con orígenes específicos: {result}")
-            return result
-
-    @property
-    def cors_origins(self) -> list:
-        """Obtiene los orígenes CORS"""
-        return self._get_cors_origins()
+    host: str = _env(default="0.0.0.0")
+    port: int = _env(default=8000)
+    # Procesos de `python server.py`; cada uno tiene su event loop y su estado local
+    workers: int = _env(default=1)
+    # Segundos que se deja terminar a las solicitudes en curso al apagar
+    shutdown_timeout: float = _env(default=90.0)
+    # Segundos entre la señal de apagado y el cierre del socket, con /health/ready en
+    # 503, para que el balanceador deje de enviar tráfico
+    shutdown_drain_delay: float = _env(default=0.0)
+
+    # CORS Configuration - "*" permite todos los orígenes (desarrollo)
+    cors_origins: Tuple[str, ...] = _env(_parse_origins, default=("*",))
+
+    def __post_init__(self):
+        errors = []
+        positive = (
+            "openai_max_tokens",
+            "openai_max_concurrency",
+            "llm_cheap_max_words",
+            "tokens_per_word",
+            "token_budget_headroom",
+            "token_budget_min_tokens",
+            "llm_retry_max_attempts",
+            "llm_request_budget",
+            "breaker_window",
+            "breaker_min_requests",
+            "openai_pool_max_connections",
+            "openai_connect_timeout",
+            "openai_read_timeout",
+            "cache_ttl_seconds",
+            "cache_max_entries",
+            "cache_max_bytes",
+            "semantic_cache_max_entries",
+            "semantic_cache_max_bytes",
+            "story_store_batch_size",
+            "story_store_flush_interval",
+            "story_store_max_pending",
+            "story_pool_depth",
+            "story_pool_refill_rate",
+            "story_pool_max_age_seconds",
+            "story_pool_max_keys",
+            "batch_max_items",
+            "batch_concurrency",
+            "jobs_workers",
+            "jobs_max_queue",
+            "jobs_ttl_seconds",
+            "jobs_callback_timeout",
+            "rate_limit_client_rate",
+            "rate_limit_client_burst",
+            "rate_limit_client_concurrency",
+            "rate_limit_global_rate",
+            "rate_limit_global_burst",
+            "log_queue_size",
+            "health_probe_timeout",
+            "workers",
+        )
+        for name in positive:
+            if getattr(self, name) <= 0:
+                errors.append(f"{name.upper()} debe ser mayor que 0")
+        non_negative = (
+            "llm_hedge_delay",
+            "llm_max_continuations",
+            "llm_retry_base_delay",
+            "llm_retry_max_delay",
+            "breaker_open_seconds",
+            "openai_pool_max_keepalive",
+            "openai_pool_keepalive_expiry",
+            "prompts_watch_interval",
+            "loop_lag_interval",
+            "health_probe_interval",
+            "readiness_max_in_flight",
+            "readiness_max_loop_lag",
+            "postprocess_max_repairs",
+            "story_pool_low_watermark",
+            "story_pool_word_tolerance",
+            "shutdown_timeout",
+            "shutdown_drain_delay",
+        )
+        for name in non_negative:
+            if getattr(self, name) < 0:
+                errors.append(f"{name.upper()} no puede ser negativo")
+        for name in (
+            "llm_router_ewma_alpha",
+            "token_budget_ewma_alpha",
+            "breaker_error_rate",
+            "semantic_cache_threshold",
+            "postprocess_word_tolerance",
+        ):
+            if not 0 < getattr(self, name) <= 1:
+                errors.append(f"{name.upper()} debe estar entre 0 y 1")
+        if not 0 <= self.openai_temperature <= 2:
+            errors.append("OPENAI_TEMPERATURE debe estar entre 0 y 2")
+        if not 0 < self.port <= 65535:
+            errors.append("PORT debe estar entre 1 y 65535")
+        if not all(bucket > 0 for bucket in self.story_pool_word_buckets):
+            errors.append("STORY_POOL_WORD_BUCKETS solo admite valores mayores que 0")
+        for index, backend in enumerate(self.llm_backends):
+            errors.extend(_backend_errors(index, backend))
+        if self.shared_state_backend not in ("memory", "redis"):
+            errors.append("SHARED_STATE_BACKEND debe ser 'memory' o 'redis'")
+        for name in ("cache_backend", "jobs_backend", "rate_limit_backend"):
+            if getattr(self, name) not in ("", "memory", "redis"):
+                errors.append(f"{name.upper()} debe ser 'memory' o 'redis'")
+        if self.log_format not in ("text", "json"):
+            errors.append("LOG_FORMAT debe ser 'text' o 'json'")
+        if not isinstance(logging.getLevelName(self.log_level.upper()), int):
+            errors.append(f"LOG_LEVEL desconocido: {self.log_level}")
+        if errors:
+            raise ConfigError(errors)
 
     @classmethod
-    def validate_openai_config(cls) -> bool:
+    def from_env(cls, environ: Mapping[str, str] = os.environ) -> "Settings":
+        """
+        Crea la configuración a partir de las variables de entorno. Informa en un solo
+        error de todas las variables que no se pueden leer y de los valores fuera de
+        rango de las demás.
+        """
+        types = get_type_hints(cls)
+        values = {}
+        errors = []
+        for setting in dataclasses.fields(cls):
+            name = setting.name.upper()
+            raw = environ.get(name)
+            if raw is None:
+                continue
+            parse = setting.metadata.get("parse") or _PARSERS[types[setting.name]]
+            try:
+                values[setting.name] = parse(raw.strip())
+            except ValueError as e:
+                errors.append(f"valor inválido para {name}: {raw!r} ({e})")
+        try:
+            # Las variables que no se pudieron leer toman su valor por defecto
+            parsed = cls(**values)
+        except ConfigError as e:
+            raise ConfigError(errors + e.errors) from None
+        if errors:
+            raise ConfigError(errors)
+        return parsed
+
+    def validate_openai_config(self) -> bool:
         """Valida que la configuración de OpenAI esté completa"""
-        if not cls.openai_api_key:
+        backends_have_keys = bool(self.llm_backends) and all(
+            backend.get("api_key") for backend in self.llm_backends
+        )
+        if not self.openai_api_key and not backends_have_keys:
             raise ValueError(
                 "OPENAI_API_KEY no está configurada. "
                 "Por favor, establece la variable de entorno OPENAI_API_KEY"
@@ -69,5 +422,35 @@ class Settings:
         return True
 
 
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """Carga `.env` y crea la configuración una sola vez por proceso"""
+    # Dependencia solo necesaria al arrancar
+    from dotenv import load_dotenv
+
+    env_loaded = load_dotenv()
+    logger.debug(
+        "Archivo .env %s en %s", "cargado" if env_loaded else "no encontrado", os.getcwd()
+    )
+    return Settings.from_env()
+
+
+@contextlib.contextmanager
+def override_settings(**changes: Any) -> Iterator[Settings]:
+    """
+    Cambia temporalmente campos de la configuración global. Solo para pruebas y
+    benchmarks: los componentes leen la configuración al crearse o al arrancar la app.
+    """
+    current = get_settings()
+    previous = {name: getattr(current, name) for name in changes}
+    for name, value in changes.items():
+        object.__setattr__(current, name, value)
+    try:
+        yield current
+    finally:
+        for name, value in previous.items():
+            object.__setattr__(current, name, value)
+
+
 # Instancia global de configuración
-settings = Settings()
+settings = get_settings()
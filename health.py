@@ -0,0 +1,228 @@
+"""
+Sonda periódica del proveedor del LLM, comprobaciones de vida y disponibilidad, y
+drenaje de solicitudes al apagar el worker
+"""
+
+# Python imports.
+import json
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Project imports.
+from config import settings
+from metrics import REQUESTS_IN_FLIGHT, LoopLagMonitor, loop_lag_monitor
+from router import Backend, Router
+
+# Configuración de logging.
+logger = logging.getLogger(__name__)
+
+
+class UpstreamProber:
+    """
+    Comprueba cada `interval` segundos que los backends del LLM responden, con una
+    llamada sin coste, y guarda el resultado para que `/health` lo sirva sin esperar
+    """
+
+    def __init__(
+        self,
+        get_router: Callable[[], Optional[Router]],
+        interval: float = 15,
+        timeout: float = 5,
+    ):
+        self.get_router = get_router
+        self.interval = interval
+        self.timeout = timeout
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.checked_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Arranca la sonda en segundo plano (la primera comprobación es inmediata)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Detiene la sonda"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await self.probe_once()
+            await asyncio.sleep(self.interval)
+
+    async def probe_once(self) -> None:
+        """Comprueba todos los backends a la vez y sustituye el resultado guardado"""
+        router = self.get_router()
+        if router is None:
+            return
+        results = await asyncio.gather(*(self._probe(backend) for backend in router.backends))
+        self.results = {backend.name: result for backend, result in zip(router.backends, results)}
+        self.checked_at = time.time()
+
+    async def _probe(self, backend: Backend) -> Dict[str, Any]:
+        try:
+            latency = await backend.probe(self.timeout)
+        except Exception as e:
+            # Un 404 indica que el servidor responde aunque no implemente /models
+            if getattr(e, "status_code", None) != 404:
+                logger.warning("La sonda de %s falló: %s", backend.name, e)
+                return {"status": "error", "error": type(e).__name__}
+            latency = None
+        return {"status": "ok", "latency": round(latency, 4) if latency is not None else None}
+
+    @property
+    def status(self) -> str:
+        """
+        `not_configured` sin backends, `unknown` antes de la primera comprobación,
+        `connected` si todos responden, `degraded` si solo algunos y `error` si ninguno
+        """
+        if self.get_router() is None:
+            return "not_configured"
+        if self.checked_at is None:
+            return "unknown"
+        healthy = sum(result["status"] == "ok" for result in self.results.values())
+        if healthy == len(self.results):
+            return "connected"
+        return "degraded" if healthy else "error"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Último resultado de la sonda"""
+        return {
+            "status": self.status,
+            "checked_at": (
+                datetime.utcfromtimestamp(self.checked_at).isoformat()
+                if self.checked_at is not None
+                else None
+            ),
+            "backends": self.results,
+        }
+
+
+class DrainState:
+    """
+    Apagado ordenado del worker: desde `start()` deja de estar listo y rechaza las
+    solicitudes nuevas, mientras las que estaban en curso terminan
+    """
+
+    def __init__(self):
+        self.started_at: Optional[float] = None
+
+    @property
+    def draining(self) -> bool:
+        return self.started_at is not None
+
+    def start(self) -> None:
+        """Empieza el drenaje (idempotente)"""
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+            logger.info(
+                "Drenando el worker: %.0f solicitudes en curso",
+                REQUESTS_IN_FLIGHT.labels().value,
+            )
+
+    def reset(self) -> None:
+        self.started_at = None
+
+
+class DrainMiddleware:
+    """
+    Middleware ASGI que, durante el drenaje, responde 503 con `Connection: close` a las
+    solicitudes nuevas que llegan por conexiones ya abiertas, salvo las de `/health`,
+    para que el cliente o el balanceador las repitan en otro worker
+    """
+
+    def __init__(self, app, state: "DrainState"):
+        self.app = app
+        self.state = state
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not self.state.draining
+            or scope["path"].startswith("/health")
+        ):
+            await self.app(scope, receive, send)
+            return
+        body = json.dumps({"detail": "El servidor se está apagando"}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", b"1"),
+                    (b"connection", b"close"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+class ReadinessCheck:
+    """
+    Decide si el worker debe recibir tráfico: deja de estar listo si se está apagando,
+    si tiene demasiadas solicitudes en curso, si su event loop va con retraso o si
+    ningún backend responde
+    """
+
+    def __init__(
+        self,
+        prober: Optional[UpstreamProber],
+        monitor: LoopLagMonitor,
+        max_in_flight: int = 0,
+        max_loop_lag: float = 0,
+        drain: Optional[DrainState] = None,
+    ):
+        self.prober = prober
+        self.monitor = monitor
+        self.drain = drain
+        self.max_in_flight = max_in_flight
+        self.max_loop_lag = max_loop_lag
+
+    def check(self) -> Tuple[bool, List[str]]:
+        """Devuelve si el worker está listo y, si no, los motivos"""
+        reasons = []
+        if self.drain is not None and self.drain.draining:
+            reasons.append("draining")
+        # La propia solicitud de la sonda de disponibilidad también está en curso
+        in_flight = REQUESTS_IN_FLIGHT.labels().value - 1
+        if self.max_in_flight and in_flight >= self.max_in_flight:
+            reasons.append(f"in_flight={in_flight:.0f} >= {self.max_in_flight}")
+        if self.max_loop_lag and self.monitor.last >= self.max_loop_lag:
+            reasons.append(f"loop_lag={self.monitor.last:.3f}s >= {self.max_loop_lag}s")
+        if self.prober is not None and self.prober.status == "error":
+            reasons.append("upstream=error")
+        return not reasons, reasons
+
+
+def build_prober(get_router: Callable[[], Optional[Router]]) -> Optional[UpstreamProber]:
+    """Crea la sonda según la configuración, o None si HEALTH_PROBE_INTERVAL=0"""
+    if settings.health_probe_interval <= 0:
+        return None
+    return UpstreamProber(
+        get_router,
+        interval=settings.health_probe_interval,
+        timeout=settings.health_probe_timeout,
+    )
+
+
+def build_readiness(prober: Optional[UpstreamProber]) -> ReadinessCheck:
+    """Crea la comprobación de disponibilidad con los umbrales configurados"""
+    return ReadinessCheck(
+        prober if settings.readiness_require_upstream else None,
+        loop_lag_monitor,
+        max_in_flight=settings.readiness_max_in_flight,
+        max_loop_lag=settings.readiness_max_loop_lag,
+        drain=drain_state,
+    )
+
+
+# Estado de drenaje del worker (lo activa server.py al recibir la señal de apagado)
+drain_state = DrainState()
@@ -0,0 +1,95 @@
+"""Pool de conexiones HTTP compartido para el cliente de OpenAI"""
+
+# Python imports.
+import logging
+import importlib.util
+from typing import Any, Dict
+import httpx
+
+# Project imports.
+from config import settings
+
+# Configuración de logging.
+logger = logging.getLogger(__name__)
+
+# Eventos de httpcore que indican el envío de una petición por una conexión.
+_SEND_EVENTS = (
+    "http11.send_request_headers.started",
+    "http2.send_request_headers.started",
+)
+
+
+class PoolStats:
+    """Contadores de reutilización de conexiones del pool"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, new_connection: bool) -> None:
+        """Registra una petición servida por una conexión nueva o reutilizada"""
+        if new_connection:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Devuelve los contadores y el ratio de reutilización"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reuse_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# Contadores globales del pool compartido
+pool_stats = PoolStats()
+
+
+async def _track_connection_reuse(request: httpx.Request) -> None:
+    """Hook de httpx que detecta si la petición abrió una conexión TCP nueva"""
+    state = {"new_connection": False}
+
+    async def trace(event_name: str, info: Dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.started":
+            state["new_connection"] = True
+        elif event_name in _SEND_EVENTS:
+            pool_stats.record(state["new_connection"])
+            state["new_connection"] = False
+
+    request.extensions["trace"] = trace
+
+
+def _http2_available() -> bool:
+    """Indica si está instalado el paquete opcional `h2`"""
+    return importlib.util.find_spec("h2") is not None
+
+
+def build_http_client() -> httpx.AsyncClient:
+    """Crea el cliente httpx de larga duración con la configuración del pool"""
+    http2 = settings.openai_http2
+    if http2 and not _http2_available():
+        logger.warning("OPENAI_HTTP2 activado pero falta el paquete 'h2'; se usa HTTP/1.1")
+        http2 = False
+
+    # Importación diferida: el SDK solo hace falta al crear los clientes
+    import openai
+
+    return openai.DefaultAsyncHttpxClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.openai_pool_max_connections,
+            max_keepalive_connections=settings.openai_pool_max_keepalive,
+            keepalive_expiry=settings.openai_pool_keepalive_expiry,
+        ),
+        timeout=build_timeout(),
+        event_hooks={"request": [_track_connection_reuse]},
+    )
+
+
+def build_timeout() -> httpx.Timeout:
+    """Timeouts de conexión y lectura configurados para OpenAI"""
+    return httpx.Timeout(
+        settings.openai_read_timeout, connect=settings.openai_connect_timeout
+    )
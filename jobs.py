@@ -0,0 +1,368 @@
+"""Cola de trabajos asíncronos para historias largas (enviar → consultar / webhook)"""
+
+# Python imports.
+import time
+import uuid
+import socket
+import asyncio
+import logging
+import ipaddress
+import itertools
+from datetime import datetime
+from urllib.parse import urlsplit
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import httpx
+
+# Project imports.
+from models import Job, StoryRequest, StoryResponse
+from config import settings
+from shared_state import state_client
+
+# Configuración de logging.
+logger = logging.getLogger(__name__)
+
+# Orden de atención de las prioridades (menor primero)
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+
+class QueueFullError(Exception):
+    """La cola alcanzó su profundidad máxima"""
+
+
+class CallbackNotAllowedError(ValueError):
+    """La URL de callback no es http(s) o apunta a un host no permitido"""
+
+
+def _is_public(address: str) -> bool:
+    """Si la dirección IP es pública (no privada, de loopback, local ni reservada)"""
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global
+
+
+def check_callback_url(url: str, allowed_hosts: Sequence[str] = ()) -> None:
+    """
+    Comprueba que la URL de callback sea http(s) y que su host esté en `allowed_hosts`
+    (o sea un subdominio suyo) o, sin lista, que no sea `localhost` ni una dirección IP
+    no pública. Los nombres se comprueban de nuevo al resolverlos antes de notificar.
+    Lanza CallbackNotAllowedError.
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if parts.scheme not in ("http", "https") or not host:
+        raise CallbackNotAllowedError("callback_url debe ser una URL http(s) con host")
+    if allowed_hosts:
+        if not any(host == allowed or host.endswith("." + allowed) for allowed in allowed_hosts):
+            raise CallbackNotAllowedError(f"El host {host} de callback_url no está permitido")
+        return
+    if host == "localhost" or host.endswith(".localhost"):
+        raise CallbackNotAllowedError(f"El host {host} de callback_url no está permitido")
+    try:
+        public = _is_public(host)
+    except ValueError:
+        # Es un nombre: se comprueba con sus direcciones antes de cada notificación
+        return
+    if not public:
+        raise CallbackNotAllowedError(f"El host {host} de callback_url no es público")
+
+
+async def check_callback_host(host: str, port: int) -> None:
+    """Lanza CallbackNotAllowedError si el nombre resuelve a alguna dirección no pública"""
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    for info in infos:
+        if not _is_public(info[4][0]):
+            raise CallbackNotAllowedError(
+                f"El host {host} de callback_url resuelve a una dirección no pública"
+            )
+
+
+class JobStore:
+    """Interfaz de almacenamiento del estado de los trabajos"""
+
+    async def save(self, job: Job, ttl: float) -> None:
+        """Guarda (o actualiza) un trabajo con un tiempo de vida en segundos"""
+        raise NotImplementedError
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        """Obtiene un trabajo o None si no existe o expiró"""
+        raise NotImplementedError
+
+    async def purge_expired(self) -> int:
+        """Elimina los trabajos expirados y devuelve cuántos se eliminaron"""
+        return 0
+
+    async def close(self) -> None:
+        """Libera los recursos del almacenamiento"""
+
+
+class InMemoryJobStore(JobStore):
+    """Almacenamiento en memoria del proceso (por defecto)"""
+
+    def __init__(self):
+        self._jobs: Dict[str, Tuple[float, Job]] = {}
+
+    async def save(self, job: Job, ttl: float) -> None:
+        self._jobs[job.job_id] = (time.monotonic() + ttl, job)
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        entry = self._jobs.get(job_id)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    async def purge_expired(self) -> int:
+        now = time.monotonic()
+        expired = [job_id for job_id, (exp, _) in self._jobs.items() if exp <= now]
+        for job_id in expired:
+            del self._jobs[job_id]
+        return len(expired)
+
+
+class KeyValueJobStore(JobStore):
+    """
+    Almacenamiento sobre un almacén clave-valor externo con la interfaz de
+    `redis.asyncio`; la expiración la gestiona el propio almacén
+    """
+
+    def __init__(self, client: Any, prefix: str = "story-job:"):
+        self.client = client
+        self.prefix = prefix
+
+    async def save(self, job: Job, ttl: float) -> None:
+        await self.client.set(
+            self.prefix + job.job_id, job.model_dump_json(), ex=max(1, int(ttl))
+        )
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        value = await self.client.get(self.prefix + job_id)
+        if value is None:
+            return None
+        return Job.model_validate_json(value)
+
+    async def close(self) -> None:
+        close = getattr(self.client, "aclose", None) or getattr(self.client, "close", None)
+        if close is not None:
+            await close()
+
+
+class JobQueue:
+    """Cola con prioridades y pool de workers que ejecutan las generaciones"""
+
+    def __init__(
+        self,
+        store: JobStore,
+        workers: int = 4,
+        max_depth: int = 1000,
+        ttl: float = 3600,
+        callback_timeout: float = 10,
+        callback_allowed_hosts: Sequence[str] = (),
+    ):
+        self.store = store
+        self.workers = workers
+        self.max_depth = max_depth
+        self.ttl = ttl
+        self.callback_timeout = callback_timeout
+        self.callback_allowed_hosts = tuple(callback_allowed_hosts)
+
+        self._queue: "asyncio.PriorityQueue[Tuple[int, int, str]]" = (
+            asyncio.PriorityQueue()
+        )
+        self._sequence = itertools.count()
+        self._tasks: List[asyncio.Task] = []
+        self._generate: Optional[Callable[[StoryRequest], Awaitable[StoryResponse]]] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._running = 0
+        self._active: Set[str] = set()
+        self._stopping = False
+
+    @property
+    def depth(self) -> int:
+        """Trabajos en espera de un worker"""
+        return self._queue.qsize()
+
+    async def submit(
+        self,
+        request: StoryRequest,
+        priority: str = "normal",
+        callback_url: Optional[str] = None,
+    ) -> Job:
+        """
+        Registra un trabajo y lo encola.
+        Lanza QueueFullError si la cola está llena, para responder 429, y
+        CallbackNotAllowedError si `callback_url` no está permitida, para responder 422.
+        """
+        if callback_url is not None:
+            check_callback_url(callback_url, self.callback_allowed_hosts)
+        if self.depth >= self.max_depth:
+            raise QueueFullError(f"La cola de trabajos está llena ({self.max_depth})")
+
+        job = Job(
+            job_id=uuid.uuid4().hex,
+            status="queued",
+            priority=priority,
+            request=request,
+            callback_url=callback_url,
+            created_at=datetime.utcnow().isoformat(),
+        )
+        await self.store.save(job, self.ttl)
+        self._queue.put_nowait((PRIORITIES[priority], next(self._sequence), job.job_id))
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        """Obtiene el estado de un trabajo"""
+        return await self.store.get(job_id)
+
+    async def start(
+        self, generate: Callable[[StoryRequest], Awaitable[StoryResponse]]
+    ) -> None:
+        """Arranca los workers y la limpieza periódica de trabajos expirados"""
+        if self._tasks:
+            return
+        self._generate = generate
+        self._http = httpx.AsyncClient(timeout=self.callback_timeout)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._cleanup()))
+
+    async def stop(self, timeout: float = 0) -> None:
+        """
+        Detiene los workers y libera los recursos. Con `timeout`, los workers dejan de
+        tomar trabajos nuevos y se espera hasta ese tiempo a que terminen los que están
+        en ejecución. La cola vive en este proceso y se pierde al detenerlo, así que los
+        trabajos que siguen en ella o que no terminaron a tiempo quedan `cancelled` en el
+        almacenamiento (y se notifican) en lugar de seguir `queued` o `running` hasta
+        que expiren.
+        """
+        self._stopping = True
+        deadline = time.monotonic() + timeout
+        while self._running and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        # Los workers olvidan su trabajo al cancelarse; se anotan antes
+        unfinished = set(self._active)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while not self._queue.empty():
+            unfinished.add(self._queue.get_nowait()[2])
+        # La cola queda ligada al event loop que termina
+        self._queue = asyncio.PriorityQueue()
+        await self._cancel(unfinished)
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        await self.store.close()
+        self._stopping = False
+
+    async def _worker(self) -> None:
+        """Atiende los trabajos de la cola por orden de prioridad"""
+        while True:
+            item = await self._queue.get()
+            if self._stopping:
+                # Apagando: el trabajo vuelve a la cola sin empezar
+                self._queue.put_nowait(item)
+                return
+            job_id = item[2]
+            self._running += 1
+            self._active.add(job_id)
+            try:
+                job = await self.store.get(job_id)
+                if job is not None:
+                    await self._run(job)
+            except Exception as e:
+                # Un fallo del almacenamiento no debe detener al worker
+                logger.error("Error al procesar el trabajo %s: %s", job_id, e)
+            finally:
+                self._running -= 1
+                self._active.discard(job_id)
+
+    async def _cancel(self, job_ids: Iterable[str]) -> None:
+        """Marca como cancelados los trabajos que no van a terminar y los notifica"""
+        cancelled = []
+        for job_id in job_ids:
+            try:
+                job = await self.store.get(job_id)
+                if job is None or job.status not in ("queued", "running"):
+                    continue
+                job.status = "cancelled"
+                job.error = "El servidor se detuvo antes de completar el trabajo"
+                job.completed_at = datetime.utcnow().isoformat()
+                await self.store.save(job, self.ttl)
+            except Exception as e:
+                logger.error("Error al cancelar el trabajo %s: %s", job_id, e)
+                continue
+            cancelled.append(job)
+        if cancelled:
+            logger.warning("%s trabajos cancelados al detener la cola", len(cancelled))
+        if self._http is not None:
+            await asyncio.gather(*(self._notify(job) for job in cancelled if job.callback_url))
+
+    async def _run(self, job: Job) -> None:
+        """Ejecuta un trabajo y guarda su resultado"""
+        job.status = "running"
+        job.started_at = datetime.utcnow().isoformat()
+        await self.store.save(job, self.ttl)
+        try:
+            job.result = await self._generate(job.request)
+            job.status = "completed"
+        except Exception as e:
+            logger.error("Error en el trabajo %s: %s", job.job_id, e)
+            job.status = "failed"
+            job.error = str(e)
+        job.completed_at = datetime.utcnow().isoformat()
+        await self.store.save(job, self.ttl)
+
+        if job.callback_url:
+            await self._notify(job)
+
+    async def _notify(self, job: Job) -> None:
+        """
+        Envía el trabajo terminado a la URL de callback (sin reintentos ni redirecciones).
+        Sin lista de hosts permitidos, antes se comprueba a qué direcciones resuelve.
+        """
+        try:
+            if not self.callback_allowed_hosts:
+                parts = urlsplit(job.callback_url)
+                port = parts.port or (443 if parts.scheme == "https" else 80)
+                await check_callback_host(parts.hostname, port)
+            response = await self._http.post(
+                job.callback_url,
+                content=job.model_dump_json(),
+                headers={"Content-Type": "application/json"},
+            )
+            response.raise_for_status()
+        except Exception as e:
+            logger.warning("No se pudo notificar el trabajo %s: %s", job.job_id, e)
+
+    async def _cleanup(self) -> None:
+        """Elimina periódicamente los trabajos cuyo TTL expiró"""
+        while True:
+            await asyncio.sleep(min(self.ttl, 60))
+            purged = await self.store.purge_expired()
+            if purged:
+                logger.info("Eliminados %s trabajos expirados", purged)
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado de la cola"""
+        return {"depth": self.depth, "max_depth": self.max_depth, "workers": self.workers}
+
+
+def build_job_queue() -> JobQueue:
+    """Crea la cola de trabajos con el almacenamiento configurado"""
+    client = state_client("jobs")
+    if client is not None:
+        store = KeyValueJobStore(client)
+    else:
+        store = InMemoryJobStore()
+    return JobQueue(
+        store,
+        workers=settings.jobs_workers,
+        max_depth=settings.jobs_max_queue,
+        ttl=settings.jobs_ttl_seconds,
+        callback_timeout=settings.jobs_callback_timeout,
+        callback_allowed_hosts=settings.jobs_callback_allowed_hosts,
+    )
+
+
+# Instancia global de la cola de trabajos
+job_queue = build_job_queue()
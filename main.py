@@ -1,29 +1,123 @@
 """Implementación de la API para generar historias únicas usando OpenAI GPT-4o-mini"""
 
 # Python imports.
+import json
 import time
+import hmac
 import logging
+from contextlib import asynccontextmanager
 from datetime import datetime
-from fastapi import FastAPI, HTTPException
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from fastapi import FastAPI, Header, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import ValidationError
 
 # Project imports.
-from models import StoryRequest, StoryResponse, RootResponse, HealthResponse
-from services import generate_story_with_llm
+from models import (
+    StoryRequest,
+    StoryResponse,
+    RootResponse,
+    HealthResponse,
+    ReadinessResponse,
+    StoredStory,
+    StoryPage,
+    PromptReloadResponse,
+    BatchStoryRequest,
+    Job,
+    JobRequest,
+)
+from services import (
+    generate_story_with_llm,
+    stream_story_with_llm,
+    init_llm_client,
+    close_llm_client,
+    get_router_stats,
+    current_llm_router,
+)
 from config import settings
+from http_pool import pool_stats
+from cache import make_request_key, story_cache
+from semantic_cache import semantic_cache
+from postprocess import StoryAnalyzer, analyze_story, postprocess_story
+from story_store import story_archive
+from coalescing import story_flight
+from rate_limit import RateLimitMiddleware, rate_limiter
+from story_pool import story_pool
+from prompt_manager import prompt_manager
+from batch import run_batch
+from jobs import job_queue, CallbackNotAllowedError, QueueFullError
+from resilience import RequestBudgetMiddleware, ServiceUnavailableError, llm_caller
+from token_budget import token_budget
+from health import DrainMiddleware, build_prober, build_readiness, drain_state
+from metrics import (
+    FunctionGauge,
+    MetricsMiddleware,
+    loop_lag_monitor,
+    observe_validation,
+    render_metrics,
+)
+from structured_logging import RequestLogMiddleware, annotate, logging_setup
 
 # Configuración de logging.
-logging.basicConfig(level=logging.INFO)
+logging_setup.configure()
 logger = logging.getLogger(__name__)
 
+# Sonda de los backends del LLM (None si HEALTH_PROBE_INTERVAL=0) y disponibilidad
+upstream_prober = build_prober(current_llm_router)
+readiness = build_readiness(upstream_prober)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Crea los recursos compartidos al arrancar y los libera al apagar"""
+    await init_llm_client()
+    if story_pool is not None:
+        await story_pool.start()
+    if settings.prompts_watch_interval > 0:
+        await prompt_manager.start_watching(settings.prompts_watch_interval)
+    drain_state.reset()
+    await job_queue.start(build_story_response)
+    if story_archive is not None:
+        await story_archive.start()
+    if settings.loop_lag_interval > 0:
+        await loop_lag_monitor.start()
+    if upstream_prober is not None:
+        await upstream_prober.start()
+    yield
+    if upstream_prober is not None:
+        await upstream_prober.stop()
+    await loop_lag_monitor.stop()
+    # Los trabajos en ejecución terminan antes de apagar, como las solicitudes en curso
+    await job_queue.stop(timeout=settings.shutdown_timeout)
+    if story_archive is not None:
+        await story_archive.stop()
+    await prompt_manager.stop_watching()
+    if story_pool is not None:
+        await story_pool.stop()
+    await close_llm_client()
+    if story_cache is not None:
+        await story_cache.close()
+    if rate_limiter is not None:
+        await rate_limiter.close()
+
+
 # Configuración de FastAPI.
 app = FastAPI(
     title="Generador de Historias API",
     description="API para generar historias únicas usando OpenAI GPT-4o-mini",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
+# Admisión por cliente y global (desactivada si RATE_LIMIT_ENABLED=false).
+# Se añade antes que CORS para que los 429 también lleven las cabeceras CORS.
+app.add_middleware(RateLimitMiddleware, get_limiter=lambda: rate_limiter)
+
+# Durante el apagado ordenado, 503 para las solicitudes nuevas (ver server.py).
+app.add_middleware(DrainMiddleware, state=drain_state)
+
 # Configuración de CORS.
 app.add_middleware(
     CORSMiddleware,
@@ -32,6 +126,43 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestLogMiddleware)
+# Plazo de la solicitud según la cabecera X-Request-Timeout.
+app.add_middleware(RequestBudgetMiddleware)
+
+# Métricas derivadas de los contadores que ya exponen los componentes
+FunctionGauge(
+    "http_pool_connection_reuse_ratio",
+    "Proporción de solicitudes al LLM que reutilizaron una conexión",
+    lambda: pool_stats.as_dict()["reuse_ratio"],
+)
+FunctionGauge(
+    "story_cache_hit_ratio",
+    "Proporción de aciertos de la caché de historias",
+    lambda: story_cache.stats()["hit_ratio"] if story_cache is not None else 0,
+)
+FunctionGauge("jobs_queue_depth", "Trabajos en espera de un worker", lambda: job_queue.depth)
+FunctionGauge(
+    "llm_circuit_breaker_open",
+    "1 si el circuit breaker del LLM no está cerrado",
+    lambda: llm_caller.breaker.state != "closed",
+)
+FunctionGauge(
+    "log_records_dropped",
+    "Registros de log descartados por tener la cola llena",
+    lambda: logging_setup.dropped,
+)
+FunctionGauge(
+    "llm_upstream_up",
+    "1 si todos los backends del LLM respondieron a la última sonda",
+    lambda: upstream_prober is not None and upstream_prober.status == "connected",
+)
+FunctionGauge(
+    "llm_tokens_per_word",
+    "Tokens por palabra usados para calcular max_tokens",
+    lambda: token_budget.tokens_per_word,
+)
 
 
 @app.get("/")
@@ -49,17 +180,63 @@ async def root() -> RootResponse:
             "root": "/",
             "docs": "/docs",
             "generate_story": "/generate-story",
+            "generate_story_stream": "/generate-story/stream",
+            "generate_stories": "/generate-stories",
+            "jobs": "/jobs",
+            "stories": "/stories",
             "health": "/health",
+            "health_live": "/health/live",
+            "health_ready": "/health/ready",
+            "metrics": "/metrics",
         },
     )
 
 
+def _build_metadata(
+    request: StoryRequest,
+    processing_time: float,
+    model: str,
+    prompt_version: str,
+    **extra: Any,
+) -> Dict[str, Any]:
+    """
+    Construye los metadatos comunes de una historia generada; `model` es el del backend
+    que la generó, que con varios backends no tiene por qué ser `OPENAI_MODEL`, y
+    `prompt_version` la de las plantillas con las que se generó su prompt
+    """
+    return {
+        "word_count": request.word_count,
+        "genre": request.genre,
+        "category": request.category,
+        "creativity_level": request.creativity_level,
+        "generated_at": datetime.utcnow().isoformat(),
+        "processing_time": round(processing_time, 2),
+        "model": model,
+        "prompt_version": prompt_version,
+        **extra,
+    }
+
+
 @app.get("/health")
 async def health_check() -> HealthResponse:
     """
     Endpoint de salud de la API.
-    Verifica el estado general de la API y la configuración de OpenAI.
-    - **openai_status**: Puede ser "connected", "not_configured" o "error".
+    Verifica el estado general de la API y de los backends del LLM. No llama al
+    proveedor: sirve el último resultado de la sonda periódica (`HEALTH_PROBE_INTERVAL`).
+    - **status**: "healthy", o "degraded" si ningún backend responde a la sonda.
+    - **openai_status**: "connected", "degraded" (algunos backends fallan), "error",
+      "unknown" (sonda aún sin resultado) o "not_configured".
+    - **upstream**: Último resultado de la sonda y latencia de cada backend.
+    - **connection_pool**: Conexiones reutilizadas (hits) y nuevas (misses).
+    - **cache**: Aciertos, fallos y expulsiones de la caché de historias (si está activa).
+    - **semantic_cache**: Aciertos y ocupación de la caché de sugerencias casi idénticas.
+    - **story_store**: Historias escritas, pendientes y descartadas del almacén (si está activo).
+    - **story_pool**: Profundidad y recargas del pool de historias pregeneradas (si está activo).
+    - **prompt_version**: Hash de las plantillas de `prompts.yaml` en uso.
+    - **jobs**: Profundidad de la cola de trabajos asíncronos.
+    - **resilience**: Reintentos realizados y estado del circuit breaker del LLM.
+    - **routing**: Latencia (EWMA), tasa de error y carga de cada backend del LLM.
+    - **coalescing**: Solicitudes idénticas que compartieron una llamada al LLM (si está activo).
     """
     try:
         # Validar configuración de OpenAI
@@ -69,12 +246,147 @@ async def health_check() -> HealthResponse:
         openai_status = "not_configured"
     except Exception:
         openai_status = "error"
+    upstream = upstream_prober.snapshot() if upstream_prober is not None else None
+    if upstream is not None and openai_status == "connected":
+        openai_status = upstream["status"]
 
     return HealthResponse(
-        status="healthy",
+        status="degraded" if openai_status == "error" else "healthy",
         openai_status=openai_status,
         timestamp=datetime.utcnow().isoformat(),
+        connection_pool=pool_stats.as_dict(),
+        cache=story_cache.stats() if story_cache is not None else None,
+        semantic_cache=semantic_cache.stats() if semantic_cache is not None else None,
+        story_store=story_archive.stats() if story_archive is not None else None,
+        story_pool=story_pool.stats() if story_pool is not None else None,
+        prompt_version=prompt_manager.version,
+        jobs=job_queue.stats(),
+        resilience=llm_caller.stats(),
+        routing=get_router_stats(),
+        coalescing=story_flight.stats() if story_flight is not None else None,
+        upstream=upstream,
+    )
+
+
+@app.get("/health/live")
+async def liveness() -> Dict[str, str]:
+    """
+    Liveness: el proceso responde. No depende del proveedor ni de la carga; si falla,
+    el orquestador debe reiniciar el worker.
+    """
+    return {"status": "alive"}
+
+
+@app.get("/health/ready", response_model=ReadinessResponse)
+async def readiness_check():
+    """
+    Readiness: el worker puede recibir tráfico. Responde 503 con los motivos si tiene
+    demasiadas solicitudes en curso (`READINESS_MAX_IN_FLIGHT`), si el event loop va
+    con retraso (`READINESS_MAX_LOOP_LAG`) o si ningún backend del LLM responde.
+    """
+    ready, reasons = readiness.check()
+    response = ReadinessResponse(ready=ready, reasons=reasons)
+    if not ready:
+        return JSONResponse(response.model_dump(), status_code=503)
+    return response
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """
+    Métricas en formato de texto de Prometheus: histogramas de latencia por etapa
+    (`validation`, `prompt_build`, `queue`, `ttft`, `completion`) etiquetados por género,
+    categoría, creatividad y modelo; solicitudes y llamadas al LLM en curso; tokens
+    consumidos y errores por tipo de excepción.
+    """
+    return PlainTextResponse(
+        render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+async def produce_story(request: StoryRequest) -> Tuple[str, str, str, Dict[str, Any]]:
+    """
+    Obtiene la historia del pool de pregeneradas, de la caché, de la caché semántica
+    (sugerencias casi idénticas) o del LLM, en ese orden, junto con el modelo y la
+    versión de las plantillas que la generaron y los metadatos adicionales sobre su
+    origen. Las solicitudes idénticas que
+    llegan mientras otra está en curso comparten su llamada al LLM.
+    """
+    extra_metadata = {}
+    entry = None
+    if story_pool is not None:
+        entry = story_pool.take(request)
+        if entry is not None:
+            extra_metadata["pool"] = "hit"
+
+    if entry is None and story_cache is not None:
+        entry = await story_cache.get(request)
+        extra_metadata["cache"] = "hit" if entry is not None else "miss"
+
+    if entry is None and semantic_cache is not None and semantic_cache.handles(request):
+        match = semantic_cache.get(request)
+        extra_metadata["semantic_cache"] = "hit" if match is not None else "miss"
+        if match is not None:
+            story, model, prompt_version, similarity = match
+            entry = story, model, prompt_version
+            extra_metadata["similarity"] = round(similarity, 3)
+
+    if entry is None:
+        if story_flight is None:
+            entry = await generate_and_cache(request)
+        else:
+            entry, shared = await story_flight.do(
+                make_request_key(request), lambda: generate_and_cache(request)
+            )
+            if shared:
+                extra_metadata["coalesced"] = True
+    annotate(**extra_metadata)
+    story, model, prompt_version = entry
+    return story, model, prompt_version, extra_metadata
+
+
+async def generate_and_cache(request: StoryRequest) -> Tuple[str, str, str]:
+    """
+    Genera la historia con el LLM, la corrige si está fuera de tolerancia y la guarda
+    en la caché, de modo que la versión corregida es la que se comparte y se reutiliza.
+    Devuelve la historia, el modelo y la versión de las plantillas que la generaron.
+    """
+    story, model, prompt_version = await generate_story_with_llm(request)
+    story, report = await postprocess_story(request, story)
+    if report.repairs:
+        annotate(postprocess_repairs=report.repairs)
+    if story_cache is not None:
+        await story_cache.set(request, story, model, prompt_version)
+    if semantic_cache is not None:
+        semantic_cache.set(request, story, model, prompt_version)
+    return story, model, prompt_version
+
+
+async def build_story_response(request: StoryRequest) -> StoryResponse:
+    """Genera la historia y construye la respuesta completa con sus metadatos"""
+    start_time = time.time()
+    story, model, prompt_version, extra_metadata = await produce_story(request)
+    processing_time = time.time() - start_time
+    metadata = _build_metadata(
+        request, processing_time, model, prompt_version, **extra_metadata
     )
+    metadata.update(analyze_story(request, story).as_metadata())
+    _archive_story(request, story, metadata)
+    return StoryResponse(story=story, metadata=metadata)
+
+
+def _archive_story(request: StoryRequest, story: str, metadata: Dict[str, Any]) -> None:
+    """
+    Encola la historia para guardarla y añade su `story_id` a los metadatos. No se
+    guardan las servidas desde una caché ni las compartidas con otra solicitud idéntica.
+    """
+    if story_archive is None or metadata.get("coalesced"):
+        return
+    if metadata.get("cache") == "hit" or metadata.get("semantic_cache") == "hit":
+        return
+    story_id = story_archive.record(request, story, metadata)
+    if story_id is not None:
+        metadata["story_id"] = story_id
 
 
 @app.post("/generate-story")
@@ -90,47 +402,274 @@ async def generate_story(request: StoryRequest) -> StoryResponse:
         - **category (str)**: Categoría de la historia.
         - **creativity_level (float)**: Nivel de creatividad del modelo.
 
+    Cabeceras opcionales:
+    - **X-Request-Timeout**: Segundos que el cliente está dispuesto a esperar; limita
+      los reintentos y el timeout de cada intento.
+
     Errores:
         400: Error de validación de los datos de entrada.
+        429: Límite de solicitudes del cliente o global excedido (ver `Retry-After`).
+        503: OpenAI no disponible (reintentos agotados o circuit breaker abierto).
         500: Error interno al generar la historia.
     """
-    start_time = time.time()
-    logger.info(
-        "Recibida solicitud:"
-        f"word_count={request.word_count}, "
-        f"genre={request.genre}, "
-        f"creativity_level={request.creativity_level}, "
-        f"category={request.category}"
-    )
+    observe_validation(request)
+    _annotate_request(request)
 
     try:
-        story = await generate_story_with_llm(request)
-        processing_time = time.time() - start_time
-
-        response_data = StoryResponse(
-            story=story,
-            metadata={
-                "word_count": request.word_count,
-                "genre": request.genre,
-                "category": request.category,
-                "creativity_level": request.creativity_level,
-                "generated_at": datetime.utcnow().isoformat(),
-                "processing_time": round(processing_time, 2),
-                "model": settings.openai_model,
-            },
-        )
-
-        logger.info(f"Historia generada exitosamente en {processing_time:.2f}s")
-        return response_data
+        return await build_story_response(request)
 
     except ValidationError as ve:
-        logger.error(f"Error de validación: {ve}")
+        logger.error("Error de validación: %s", ve)
         raise HTTPException(status_code=400, detail=str(ve))
+    except ServiceUnavailableError as e:
+        logger.error("Servicio no disponible al generar historia: %s", e)
+        headers = None
+        if e.retry_after:
+            headers = {"Retry-After": str(max(1, round(e.retry_after)))}
+        raise HTTPException(status_code=503, detail=str(e), headers=headers)
     except Exception as e:
-        logger.error(f"Error al generar historia: {str(e)}")
+        logger.error("Error al generar historia: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _annotate_request(request: StoryRequest) -> None:
+    """Añade los parámetros de la historia al evento de log de la solicitud"""
+    annotate(
+        word_count=request.word_count,
+        genre=request.genre,
+        category=request.category,
+        creativity_level=request.creativity_level,
+        suggestions=request.suggestions,
+    )
+
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Formatea un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/generate-story/stream")
+async def generate_story_stream(request: StoryRequest) -> StreamingResponse:
+    """
+    Genera una historia en streaming usando Server-Sent Events (text/event-stream).
+
+    Eventos emitidos:
+    - **token**: `{"text": "..."}` con cada fragmento de la historia según lo genera el modelo.
+    - **end**: `{"metadata": {...}}` con los mismos metadatos que `/generate-story`,
+      más `time_to_first_token` y `processing_time` en segundos. El análisis de la
+      historia (título, palabras reales, contenido) se hace por fragmentos durante el
+      stream; la historia ya enviada no se corrige.
+    - **error**: `{"detail": "..."}` si la generación falla a mitad del stream.
+
+    Errores:
+        400/422: Error de validación de los datos de entrada.
+        429: Límite de solicitudes del cliente o global excedido (ver `Retry-After`).
+    """
+    observe_validation(request)
+    _annotate_request(request)
+    start_time = time.time()
+
+    async def events() -> AsyncIterator[str]:
+        time_to_first_token = None
+        model = settings.openai_model
+        prompt_version = prompt_manager.version
+        # El texto completo solo hace falta para guardarlo en el almacén de historias
+        parts: Optional[List[str]] = [] if story_archive is not None else None
+        analyzer = StoryAnalyzer(request)
+        try:
+            async for text, model, prompt_version in stream_story_with_llm(request):
+                if time_to_first_token is None:
+                    time_to_first_token = time.time() - start_time
+                if parts is not None:
+                    parts.append(text)
+                analyzer.feed(text)
+                yield _sse_event("token", {"text": text})
+
+            processing_time = time.time() - start_time
+            metadata = _build_metadata(
+                request,
+                processing_time,
+                model,
+                prompt_version,
+                time_to_first_token=round(time_to_first_token or processing_time, 3),
+            )
+            metadata.update(analyzer.finish().as_metadata())
+            if parts is not None:
+                _archive_story(request, "".join(parts), metadata)
+            yield _sse_event("end", {"metadata": metadata})
+
+        except Exception as e:
+            logger.error("Error al transmitir historia: %s", e)
+            yield _sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/generate-stories")
+async def generate_stories(batch: BatchStoryRequest) -> StreamingResponse:
+    """
+    Genera un lote de historias y devuelve los resultados como NDJSON
+    (`application/x-ndjson`), una línea por resultado en orden de finalización.
+
+    Las solicitudes idénticas se generan una sola vez; cada línea indica en `indices`
+    qué posiciones del lote resuelve. Como mucho se generan `BATCH_CONCURRENCY`
+    historias a la vez, y un fallo solo afecta a su línea (`status: "error"`). Con
+    límites activos, cada historia distinta consume un token del bucket global y espera
+    a tenerlo, de modo que el lote no supera la cuota del proveedor.
+
+    Errores:
+        400: El lote supera `BATCH_MAX_ITEMS` solicitudes.
+        429: Límite de solicitudes del cliente o global excedido (ver `Retry-After`).
+    """
+    if len(batch.requests) > settings.batch_max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"El lote supera el máximo de {settings.batch_max_items} solicitudes",
+        )
+    annotate(batch_size=len(batch.requests))
+    limiter = rate_limiter
+
+    async def generate(request: StoryRequest) -> StoryResponse:
+        # La admisión cuenta el lote como una solicitud; cada historia paga su token global
+        if limiter is not None:
+            await limiter.throttle_global()
+        return await build_story_response(request)
+
+    async def lines() -> AsyncIterator[str]:
+        async for result in run_batch(batch.requests, generate, settings.batch_concurrency):
+            yield result.model_dump_json(exclude_none=True) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(job_request: JobRequest) -> Job:
+    """
+    Encola una historia para generarla en segundo plano y devuelve el trabajo de inmediato.
+    El resultado se consulta en `GET /jobs/{job_id}` o se recibe por POST en `callback_url`.
+
+    Errores:
+        422: `callback_url` no es http(s) o apunta a un host no permitido
+             (ver `JOBS_CALLBACK_ALLOWED_HOSTS`).
+        429: La cola está llena o se excedió el límite de solicitudes; reintentar
+             tras `Retry-After` segundos.
+    """
+    try:
+        job = await job_queue.submit(
+            job_request.request,
+            priority=job_request.priority,
+            callback_url=job_request.callback_url,
+        )
+    except CallbackNotAllowedError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except QueueFullError as e:
+        logger.warning(str(e))
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+
+    annotate(job_id=job.job_id, priority=job.priority)
+    return job
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str) -> Job:
+    """
+    Devuelve el estado de un trabajo: `queued`, `running`, `completed` (con `result`)
+    o `failed` (con `error`).
+
+    Errores:
+        404: El trabajo no existe o expiró.
+    """
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
+
+
+def _require_archive():
+    if story_archive is None:
+        raise HTTPException(
+            status_code=404, detail="Almacén de historias desactivado (STORY_STORE_ENABLED)"
+        )
+    return story_archive
+
+
+@app.get("/stories")
+async def list_stories(
+    genre: Optional[str] = None,
+    category: Optional[str] = None,
+    creativity_level: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+) -> StoryPage:
+    """
+    Historias guardadas, de la más reciente a la más antigua, filtradas opcionalmente
+    por género, categoría y nivel de creatividad. Se pagina por cursor: para la página
+    siguiente se envía el `next_cursor` de la anterior. El coste de cada página no
+    depende de su posición. Las historias recién generadas aparecen tras el siguiente
+    volcado (como mucho `STORY_STORE_FLUSH_INTERVAL` segundos).
+
+    Errores:
+        400: Cursor inválido.
+        404: Almacén de historias desactivado.
+    """
+    archive = _require_archive()
+    try:
+        stories, next_cursor = await archive.list(
+            limit, cursor, genre=genre, category=category, creativity_level=creativity_level
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StoryPage(stories=stories, next_cursor=next_cursor)
+
+
+@app.get("/stories/{story_id}")
+async def get_story(story_id: str) -> StoredStory:
+    """
+    Devuelve una historia guardada con su texto y sus metadatos. El `story_id` aparece
+    en los metadatos de la respuesta que la generó.
+
+    Errores:
+        404: La historia no existe o el almacén está desactivado.
+    """
+    story = await _require_archive().get(story_id)
+    if story is None:
+        raise HTTPException(status_code=404, detail="Historia no encontrada")
+    return story
+
+
+@app.post("/admin/reload-prompts")
+async def reload_prompts(
+    x_admin_token: Optional[str] = Header(None),
+) -> PromptReloadResponse:
+    """
+    Recarga y precompila `prompts.yaml` fuera del event loop.
+    La nueva versión sustituye a la anterior de forma atómica; las solicitudes en curso
+    terminan con la versión con la que empezaron.
+
+    Errores:
+        403: `ADMIN_TOKEN` no configurado o cabecera `X-Admin-Token` incorrecta.
+        400: El YAML no es válido; sigue activa la última versión correcta.
+    """
+    # Comparación en tiempo constante: no revela cuántos caracteres coinciden
+    if not settings.admin_token or not hmac.compare_digest(
+        (x_admin_token or "").encode("utf-8"), settings.admin_token.encode("utf-8")
+    ):
+        raise HTTPException(status_code=403, detail="Token de administración inválido")
+
+    previous_version = prompt_manager.version
+    try:
+        version = await asyncio.to_thread(prompt_manager.reload_prompts)
+    except (ValueError, FileNotFoundError) as e:
+        logger.error("Error al recargar las plantillas: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return PromptReloadResponse(prompt_version=version, previous_version=previous_version)
+
+
 if __name__ == "__main__":
     import uvicorn
 
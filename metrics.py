@@ -0,0 +1,329 @@
+"""Métricas en formato de exposición de Prometheus (sin dependencias externas)"""
+
+# Python imports.
+import os
+import time
+import bisect
+import asyncio
+import resource
+import contextvars
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Project imports.
+from models import StoryRequest
+from config import settings
+from structured_logging import record_stage
+
+# Límites por defecto de los histogramas de latencia, en segundos
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Instante (time.perf_counter) en que llegó la solicitud HTTP en curso
+request_started: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "request_started", default=None
+)
+
+
+def _escape(value: str) -> str:
+    """Escapa el valor de una etiqueta"""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """Formatea `{nombre="valor",...}` (vacío si no hay etiquetas)"""
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Metric:
+    """Base de las métricas con etiquetas; cada combinación de valores es un hijo"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        REGISTRY.append(self)
+
+    def labels(self, *values: str):
+        """Devuelve el hijo para los valores de etiqueta dados (en orden)"""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        """Líneas de exposición de la métrica"""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(_format_labels(self.labelnames, values), child))
+        return lines
+
+    def _render_child(self, labels: str, child) -> List[str]:
+        return [f"{self.name}{labels} {child.value}"]
+
+
+class _Value:
+    """Valor numérico de un contador o gauge"""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(Metric):
+    """Contador monótono"""
+
+    type_name = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+
+class Gauge(Metric):
+    """Valor que sube y baja"""
+
+    type_name = "gauge"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+
+class FunctionGauge(Metric):
+    """Gauge sin etiquetas cuyo valor se calcula al exportar"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], float]):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+            f"{self.name} {float(self.function())}",
+        ]
+
+
+class _HistogramValue:
+    """Cuentas por bucket, suma y total de observaciones"""
+
+    __slots__ = ("upper_bounds", "counts", "sum", "count")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(Metric):
+    """Histograma de latencias con buckets acumulados al exportar"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def _render_child(self, labels: str, child: _HistogramValue) -> List[str]:
+        prefix = labels[:-1] + "," if labels else "{"
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(float(bound))
+            lines.append(f'{self.name}_bucket{prefix}le="{le}"}} {cumulative}')
+        lines.append(f"{self.name}_sum{labels} {child.sum}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+# Registro global de métricas, en orden de creación
+REGISTRY: List[Metric] = []
+
+
+def render_metrics() -> str:
+    """Exporta todas las métricas en formato de texto de Prometheus"""
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Métricas de la aplicación
+STAGE_LATENCY = Histogram(
+    "story_stage_duration_seconds",
+    "Duración de cada etapa de la generación de historias",
+    ("stage", "genre", "category", "creativity_level", "model"),
+)
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Solicitudes HTTP en curso")
+LLM_CALLS_IN_FLIGHT = Gauge("llm_calls_in_flight", "Llamadas al LLM en curso")
+LLM_TOKENS = Counter(
+    "llm_tokens_total", "Tokens consumidos según el campo usage de OpenAI", ("kind", "model")
+)
+COALESCED_CALLS = Counter(
+    "story_coalesced_calls_total",
+    "Solicitudes que compartieron la llamada al LLM de otra idéntica en curso",
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    "rate_limit_rejections_total", "Solicitudes rechazadas con 429 por límite", ("reason",)
+)
+ERRORS = Counter(
+    "story_errors_total", "Errores al generar historias por tipo de excepción", ("exception",)
+)
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que cuenta las solicitudes en curso (hasta terminar de enviar el
+    cuerpo, incluidos los streams) y anota su instante de llegada
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = request_started.set(time.perf_counter())
+        in_flight = REQUESTS_IN_FLIGHT.labels()
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            in_flight.dec()
+            request_started.reset(token)
+
+
+# Instante de arranque del proceso (distingue a los workers al leer /metrics)
+PROCESS_START_TIME = time.time()
+
+
+def resident_memory_bytes(pid: str = "self") -> int:
+    """Memoria residente (RSS) de un proceso; si no hay /proc, el máximo del propio proceso"""
+    try:
+        with open(f"/proc/{pid}/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        if pid != "self":
+            return 0
+        # ru_maxrss está en KiB en Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Retraso del event loop al despertar una tarea periódica",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+FunctionGauge(
+    "process_resident_memory_bytes", "Memoria residente del proceso", resident_memory_bytes
+)
+FunctionGauge(
+    "process_start_time_seconds",
+    "Instante de arranque del proceso (epoch)",
+    lambda: PROCESS_START_TIME,
+)
+
+
+class LoopLagMonitor:
+    """
+    Mide cada `interval` segundos cuánto tarda el event loop en despertar una tarea
+    que debería despertar de inmediato; un retraso alto indica trabajo bloqueante
+    """
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.last = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Arranca la medición en segundo plano"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Detiene la medición"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        lag = EVENT_LOOP_LAG.labels()
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last = max(0.0, time.perf_counter() - expected)
+            lag.observe(self.last)
+
+
+# Instancia global del monitor del event loop
+loop_lag_monitor = LoopLagMonitor(settings.loop_lag_interval)
+
+
+def observe_stage(
+    stage: str, request: StoryRequest, seconds: float, model: Optional[str] = None
+) -> None:
+    """
+    Registra la duración de una etapa etiquetada con los parámetros de la historia y el
+    modelo que la atendió (por defecto `OPENAI_MODEL`)
+    """
+    STAGE_LATENCY.labels(
+        stage,
+        request.genre,
+        request.category,
+        request.creativity_level,
+        model or settings.openai_model,
+    ).observe(seconds)
+    record_stage(stage, seconds)
+
+
+def observe_validation(request: StoryRequest) -> None:
+    """Registra el tiempo desde la llegada de la solicitud hasta el handler (validación)"""
+    started = request_started.get()
+    if started is not None:
+        observe_stage("validation", request, time.perf_counter() - started)
+
+
+def record_usage(usage, model: str) -> None:
+    """Suma los tokens del campo `usage` de una respuesta de OpenAI"""
+    if usage is None:
+        return
+    LLM_TOKENS.labels("prompt", model).inc(usage.prompt_tokens or 0)
+    LLM_TOKENS.labels("completion", model).inc(usage.completion_tokens or 0)
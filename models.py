@@ -2,7 +2,21 @@
 
 # Python imports.
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+
+# Valores admitidos para los parámetros de la historia
+CREATIVITY_LEVELS = ("conservador", "creativo", "locura")
+GENRES = (
+    "fantasia",
+    "ciencia_ficcion",
+    "misterio",
+    "romance",
+    "aventura",
+    "terror",
+    "comedia",
+    "drama",
+)
+CATEGORIES = ("todos", "adolescente", "infantil")
 
 
 class StoryRequest(BaseModel):
@@ -13,17 +27,17 @@ class StoryRequest(BaseModel):
     )
     creativity_level: str = Field(
         ...,
-        pattern="^(conservador|creativo|locura)$",
+        pattern=f"^({'|'.join(CREATIVITY_LEVELS)})$",
         description="Nivel de creatividad",
     )
     genre: str = Field(
         ...,
-        pattern="^(fantasia|ciencia_ficcion|misterio|romance|aventura|terror|comedia|drama)$",
+        pattern=f"^({'|'.join(GENRES)})$",
         description="Género literario",
     )
     category: str = Field(
         ...,
-        pattern="^(todos|adolescente|infantil)$",
+        pattern=f"^({'|'.join(CATEGORIES)})$",
         description="Categoría de la historia",
     )
     suggestions: Optional[str] = Field(
@@ -47,7 +61,9 @@ class StoryResponse(BaseModel):
                     "creativity_level": 0.8,
                     "generated_at": "2024-06-07T12:35:10.123Z",
                     "processing_time": 1.23,
-                    "model": "openai_model_configurado",
+                    "model": "modelo_del_backend",
+                    "prompt_version": "3f9a1c0b7d2e",
+                    "cache": "miss",
                 },
             }
         }
@@ -85,12 +101,200 @@ class HealthResponse(BaseModel):
     status: str = Field(..., description="Estado general de la API")
     openai_status: str = Field(..., description="Estado de la conexión con OpenAI")
     timestamp: str = Field(..., description="Marca de tiempo de la verificación")
+    connection_pool: Optional[Dict[str, Any]] = Field(
+        None, description="Contadores de reutilización del pool de conexiones"
+    )
+    cache: Optional[Dict[str, Any]] = Field(
+        None, description="Estadísticas de la caché de historias (si está activa)"
+    )
+    story_pool: Optional[Dict[str, Any]] = Field(
+        None, description="Estado del pool de historias pregeneradas (si está activo)"
+    )
+    semantic_cache: Optional[Dict[str, Any]] = Field(
+        None, description="Estadísticas de la caché de sugerencias casi idénticas (si está activa)"
+    )
+    story_store: Optional[Dict[str, Any]] = Field(
+        None, description="Historias escritas y pendientes del almacén (si está activo)"
+    )
+    prompt_version: Optional[str] = Field(
+        None, description="Versión (hash) de las plantillas de prompts activas"
+    )
+    jobs: Optional[Dict[str, Any]] = Field(
+        None, description="Estado de la cola de trabajos asíncronos"
+    )
+    resilience: Optional[Dict[str, Any]] = Field(
+        None, description="Reintentos y estado del circuit breaker del LLM"
+    )
+    routing: Optional[Dict[str, Any]] = Field(
+        None, description="Latencia y errores de cada backend del LLM y llamadas duplicadas"
+    )
+    coalescing: Optional[Dict[str, Any]] = Field(
+        None, description="Solicitudes idénticas agrupadas en una sola llamada (si está activo)"
+    )
+    upstream: Optional[Dict[str, Any]] = Field(
+        None, description="Último resultado de la sonda de los backends del LLM (si está activa)"
+    )
     model_config = ConfigDict(
         json_schema_extra={
             "example": {
                 "status": "healthy",
                 "openai_status": "connected",
                 "timestamp": "2024-06-07T12:34:56.789Z",
+                "connection_pool": {"hits": 98, "misses": 2, "reuse_ratio": 0.98},
+                "cache": {"hits": 40, "misses": 60, "hit_ratio": 0.4, "evictions": 0},
+                "prompt_version": "3f9a1c0b7d2e",
+            }
+        }
+    )
+
+
+class ReadinessResponse(BaseModel):
+    """Modelo de respuesta para la disponibilidad del worker"""
+
+    ready: bool = Field(..., description="Si el worker puede recibir tráfico")
+    reasons: List[str] = Field(
+        default_factory=list, description="Umbrales superados si no está listo"
+    )
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {"ready": False, "reasons": ["loop_lag=0.812s >= 0.5s"]}
+        }
+    )
+
+
+class StorySummary(BaseModel):
+    """Historia guardada, sin el texto (listados)"""
+
+    story_id: str = Field(..., description="Identificador de la historia")
+    created_at: str = Field(..., description="Fecha de generación")
+    genre: str = Field(..., description="Género literario")
+    category: str = Field(..., description="Categoría de la historia")
+    creativity_level: str = Field(..., description="Nivel de creatividad")
+    word_count: int = Field(..., description="Número de palabras solicitado")
+    suggestions: Optional[str] = Field(None, description="Sugerencias de la solicitud")
+
+
+class StoredStory(StorySummary):
+    """Historia guardada con su texto y sus metadatos"""
+
+    story: str = Field(..., description="La historia generada")
+    metadata: Dict[str, Any] = Field(..., description="Metadatos de la generación")
+
+
+class StoryPage(BaseModel):
+    """Página de historias guardadas, de la más reciente a la más antigua"""
+
+    stories: List[StorySummary] = Field(..., description="Historias de la página")
+    next_cursor: Optional[str] = Field(
+        None, description="Cursor de la página siguiente (None si no hay más)"
+    )
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "stories": [
+                    {
+                        "story_id": "9b1deb4d3b7d4bad9bdd2b0d7b3dcb6d",
+                        "created_at": "2024-06-07T12:34:56.789",
+                        "genre": "fantasia",
+                        "category": "infantil",
+                        "creativity_level": "creativo",
+                        "word_count": 300,
+                        "suggestions": None,
+                    }
+                ],
+                "next_cursor": "MTcxNzc2MzY5Ni43ODk6NDI",
+            }
+        }
+    )
+
+
+class PromptReloadResponse(BaseModel):
+    """Modelo de respuesta para la recarga de plantillas de prompts"""
+
+    prompt_version: str = Field(..., description="Versión de las plantillas activas")
+    previous_version: str = Field(..., description="Versión activa antes de recargar")
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "prompt_version": "3f9a1c0b7d2e",
+                "previous_version": "8e21d4a9c0f7",
+            }
+        }
+    )
+
+
+class BatchStoryRequest(BaseModel):
+    """Modelo de solicitud para generar varias historias en un lote"""
+
+    requests: List[StoryRequest] = Field(
+        ..., min_length=1, description="Solicitudes de historias a generar"
+    )
+
+
+class BatchItemResult(BaseModel):
+    """Resultado de un elemento del lote (una línea NDJSON)"""
+
+    indices: List[int] = Field(
+        ..., description="Posiciones en el lote de las solicitudes idénticas resueltas"
+    )
+    status: str = Field(..., description="'ok' o 'error'")
+    story: Optional[str] = Field(None, description="La historia generada")
+    metadata: Optional[Dict[str, Any]] = Field(
+        None, description="Metadatos de la generación"
+    )
+    error: Optional[str] = Field(None, description="Detalle del error del elemento")
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "indices": [0, 3],
+                "status": "ok",
+                "story": "Había una vez un dragón que...",
+                "metadata": {"genre": "fantasia", "processing_time": 1.23},
+            }
+        }
+    )
+
+
+class JobRequest(BaseModel):
+    """Modelo de solicitud para encolar una historia como trabajo asíncrono"""
+
+    request: StoryRequest = Field(..., description="Parámetros de la historia")
+    priority: str = Field(
+        "normal", pattern="^(high|normal|low)$", description="Prioridad del trabajo"
+    )
+    callback_url: Optional[str] = Field(
+        None,
+        pattern="^https?://",
+        description="URL que recibirá un POST con el trabajo al terminar",
+    )
+
+
+class Job(BaseModel):
+    """Estado de un trabajo de generación"""
+
+    job_id: str = Field(..., description="Identificador del trabajo")
+    status: str = Field(..., description="queued, running, completed, failed o cancelled")
+    priority: str = Field(..., description="Prioridad del trabajo")
+    request: StoryRequest = Field(..., description="Parámetros de la historia")
+    callback_url: Optional[str] = Field(None, description="URL de notificación")
+    created_at: str = Field(..., description="Fecha de creación")
+    started_at: Optional[str] = Field(None, description="Inicio de la generación")
+    completed_at: Optional[str] = Field(None, description="Fin de la generación")
+    result: Optional[StoryResponse] = Field(None, description="Historia generada")
+    error: Optional[str] = Field(None, description="Detalle del error")
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "job_id": "5f0c3a9e2b7d4c1e8a6f9b2d3c4e5f60",
+                "status": "queued",
+                "priority": "normal",
+                "request": {
+                    "word_count": 2000,
+                    "creativity_level": "creativo",
+                    "genre": "fantasia",
+                    "category": "todos",
+                },
+                "created_at": "2024-06-07T12:34:56.789Z",
             }
         }
     )
@@ -0,0 +1,249 @@
+"""
+Post-procesado de las historias generadas: título, palabras reales y comprobación de
+contenido según la categoría. El análisis es incremental (`StoryAnalyzer.feed` por
+fragmento) para que en streaming no añada latencia tras el último token; solo las
+historias fuera de tolerancia se corrigen con una llamada dirigida al LLM.
+"""
+
+# Python imports.
+import re
+import string
+import logging
+import unicodedata
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+# Project imports.
+from models import StoryRequest
+from services import revise_story_with_llm
+from token_budget import token_budget
+from config import settings
+
+# Configuración de logging.
+logger = logging.getLogger(__name__)
+
+# Tilde combinada de la "ñ" tras la normalización NFKD
+_TILDE = "\u0303"
+
+
+def _fold(word: str) -> str:
+    """Minúsculas y sin acentos, conservando la "ñ" ("coño" no es "cono")"""
+    folded = unicodedata.normalize("NFKD", word.casefold())
+    kept = "".join(
+        char
+        for previous, char in zip(" " + folded, folded)
+        if not unicodedata.combining(char) or (char == _TILDE and previous == "n")
+    )
+    return unicodedata.normalize("NFC", kept)
+
+
+# Palabras no adecuadas por categoría (sin tildes; "todos" no tiene restricciones)
+_ADOLESCENT_TERMS = (
+    "porno pornografia pornografico pornografica cocaina heroinomano suicidarse "
+    "joder jodido coño puta puto cabron gilipollas"
+)
+_CHILD_TERMS = _ADOLESCENT_TERMS + (
+    " sangriento sangrienta sangrientos sangrientas degollar degollado decapitar "
+    "decapitado decapitada tortura torturar torturado cadaver cadaveres asesinato "
+    "asesinatos asesinar asesino asesina violacion violar sexo sexual desnudo desnuda "
+    "droga drogas borracho borracha suicidio mierda"
+)
+CATEGORY_TERMS: Dict[str, FrozenSet[str]] = {
+    "infantil": frozenset(_fold(term) for term in _CHILD_TERMS.split()),
+    "adolescente": frozenset(_fold(term) for term in _ADOLESCENT_TERMS.split()),
+}
+
+# Signos que rodean a las palabras y marcas de formato del título
+_PUNCTUATION = string.punctuation + "¡¿«»“”‘’—–…"
+_TITLE_PREFIX = re.compile(r"^(t[ií]tulo|title)\s*:\s*", re.IGNORECASE)
+# Una primera línea más larga no se considera título
+_MAX_TITLE_CHARS = 200
+_MAX_TITLE_WORDS = 15
+
+
+def _parse_title(line: str) -> Optional[str]:
+    """Título de la primera línea (con o sin `#`, `**` o "Título:"), o None si es texto"""
+    text = line.strip()
+    marked = text.startswith(("#", "*", "_")) or bool(_TITLE_PREFIX.match(text))
+    text = _TITLE_PREFIX.sub("", text.lstrip("#").strip().strip("*_").strip())
+    # Comillas que rodean todo el título
+    if len(text) > 1 and text[0] in "\"'«“" and text[-1] in "\"'»”":
+        text = text[1:-1].strip()
+    if not text or len(text.split()) > _MAX_TITLE_WORDS:
+        return None
+    # Sin marcas de formato, una línea que termina en punto es el primer párrafo
+    if not marked and text.endswith((".", ",", ";")):
+        return None
+    return text
+
+
+class StoryReport:
+    """Resultado del análisis de una historia"""
+
+    def __init__(
+        self, title: Optional[str], words: int, target: int, tolerance: float, flagged: List[str]
+    ):
+        self.title = title
+        self.words = words
+        self.target = target
+        self.tolerance = tolerance
+        self.flagged = flagged
+        self.repairs = 0
+
+    @property
+    def length_status(self) -> str:
+        """`ok`, `short` o `long` según la tolerancia sobre las palabras pedidas"""
+        if self.words < self.target * (1 - self.tolerance):
+            return "short"
+        if self.words > self.target * (1 + self.tolerance):
+            return "long"
+        return "ok"
+
+    @property
+    def acceptable(self) -> bool:
+        return self.length_status == "ok" and not self.flagged
+
+    @property
+    def score(self) -> float:
+        """Menor es mejor: el contenido no adecuado pesa más que la longitud"""
+        deviation = abs(self.words - self.target) / self.target
+        return len(self.flagged) * 10 + max(0.0, deviation - self.tolerance)
+
+    def as_metadata(self) -> Dict[str, Any]:
+        metadata: Dict[str, Any] = {
+            "title": self.title,
+            "actual_word_count": self.words,
+            "word_count_status": self.length_status,
+            "content_check": "flagged" if self.flagged else "ok",
+        }
+        if self.flagged:
+            metadata["flagged_terms"] = self.flagged
+        if self.repairs:
+            metadata["repairs"] = self.repairs
+        return metadata
+
+
+class StoryAnalyzer:
+    """
+    Analiza una historia por fragmentos según llega: la primera línea se evalúa como
+    título y cada palabra completa se cuenta y se compara con los términos de la
+    categoría. Solo se retiene la palabra cortada al final del último fragmento.
+    """
+
+    def __init__(self, request: StoryRequest, tolerance: Optional[float] = None):
+        self.request = request
+        self.tolerance = settings.postprocess_word_tolerance if tolerance is None else tolerance
+        self.terms = CATEGORY_TERMS.get(request.category, frozenset())
+        self.title: Optional[str] = None
+        self.words = 0
+        self._flagged: Dict[str, None] = {}
+        self._title_pending = True
+        self._buffer = ""
+
+    def feed(self, text: str) -> None:
+        """Procesa un fragmento de la historia"""
+        text = self._buffer + text
+        self._buffer = ""
+        if self._title_pending:
+            stripped = text.lstrip()
+            newline = stripped.find("\n")
+            if newline == -1 and len(stripped) <= _MAX_TITLE_CHARS:
+                # La primera línea aún no está completa
+                self._buffer = text
+                return
+            self._title_pending = False
+            line = stripped[:newline] if newline != -1 else ""
+            self.title = _parse_title(line) if line else None
+            if self.title is not None:
+                text = stripped[newline + 1:]
+        # La última palabra puede continuar en el siguiente fragmento
+        if text and not text[-1].isspace():
+            cut = max(text.rfind(" "), text.rfind("\n"), text.rfind("\t"))
+            self._buffer = text[cut + 1:]
+            text = text[:cut + 1]
+        self._count(text)
+
+    def _count(self, text: str) -> None:
+        words = text.split()
+        self.words += len(words)
+        if self.terms:
+            for word in words:
+                word = word.strip(_PUNCTUATION).casefold()
+                if word and not word.isascii():
+                    word = _fold(word)
+                if word in self.terms:
+                    self._flagged[word] = None
+
+    def finish(self) -> StoryReport:
+        """Procesa lo que quede pendiente y devuelve el informe"""
+        if self._title_pending:
+            self._title_pending = False
+            stripped = self._buffer.strip()
+            # Una historia de una sola línea no tiene título
+            self._buffer = stripped
+        self._count(self._buffer)
+        self._buffer = ""
+        return StoryReport(
+            self.title,
+            self.words,
+            self.request.word_count,
+            self.tolerance,
+            list(self._flagged),
+        )
+
+
+def analyze_story(request: StoryRequest, story: str) -> StoryReport:
+    """Analiza una historia completa"""
+    analyzer = StoryAnalyzer(request)
+    analyzer.feed(story)
+    return analyzer.finish()
+
+
+def _repair_instruction(request: StoryRequest, report: StoryReport) -> Tuple[str, int, bool]:
+    """Instrucción de la corrección, presupuesto de tokens y si el texto se añade al final"""
+    if report.flagged:
+        instruction = (
+            f"La historia no es adecuada para un público {request.category}: evita por "
+            f"completo palabras como {', '.join(report.flagged)} y lo que describen. "
+            f"Reescríbela completa con el mismo título y la misma trama, adecuada para ese "
+            f"público y con unas {report.target} palabras. Responde solo con la historia."
+        )
+        return instruction, token_budget.max_tokens_for(report.target), False
+    if report.length_status == "long":
+        instruction = (
+            f"La historia tiene {report.words} palabras y debían ser unas {report.target}. "
+            f"Reescríbela completa con el mismo título, los mismos personajes y el mismo "
+            f"final en unas {report.target} palabras. Responde solo con la historia."
+        )
+        return instruction, token_budget.max_tokens_for(report.target), False
+    missing = report.target - report.words
+    instruction = (
+        f"La historia tiene {report.words} palabras y debían ser unas {report.target}. "
+        f"Continúa la historia desde donde termina con unas {missing} palabras más y "
+        f"llévala a un final, sin repetir texto ni añadir título ni introducciones."
+    )
+    return instruction, token_budget.max_tokens_for(missing), True
+
+
+async def postprocess_story(request: StoryRequest, story: str) -> Tuple[str, StoryReport]:
+    """
+    Analiza la historia generada y, si está fuera de tolerancia, la corrige: continúa
+    las cortas y reescribe las largas o las no adecuadas para la categoría, hasta
+    `POSTPROCESS_MAX_REPAIRS` veces. Se queda con la mejor versión; un fallo de la
+    corrección no hace fallar la solicitud.
+    """
+    report = analyze_story(request, story)
+    repairs = 0
+    while not report.acceptable and repairs < settings.postprocess_max_repairs:
+        instruction, max_tokens, append = _repair_instruction(request, report)
+        try:
+            revised = await revise_story_with_llm(request, story, instruction, max_tokens)
+        except Exception as e:
+            logger.warning("No se pudo corregir la historia: %s", e)
+            break
+        repairs += 1
+        candidate = f"{story}\n\n{revised}" if append else revised
+        candidate_report = analyze_story(request, candidate)
+        if candidate_report.score < report.score:
+            story, report = candidate, candidate_report
+    report.repairs = repairs
+    return story, report
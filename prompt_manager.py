@@ -1,90 +1,305 @@
 """Gestor de prompts para la API"""
 
 # Python imports.
-import yaml
-from typing import Dict, Any
+import os
+import sys
+import asyncio
+import marshal
+import hashlib
+import logging
+from typing import Dict, Any, NamedTuple, Optional, Tuple
 
 # Project imports.
-from models import StoryRequest
+from models import StoryRequest, CATEGORIES
+from config import settings
+
+# Configuración de logging.
+logger = logging.getLogger(__name__)
+
+# Parámetros que cambian en cada solicitud; el resto se resuelve al cargar.
+VARIABLE_SLOTS = ("word_count", "suggestions")
+_SLOT_MARK = "\x00"
+
+# (genre, category, creativity_level)
+PromptKey = Tuple[str, str, str]
+
+# Cabecera de la caché compilada: marshal cambia de formato entre versiones de Python
+_CACHE_HEADER = ("prompts-cache", 1, sys.version_info[:2])
+
+
+def parse_yaml(text: str) -> Any:
+    """Parsea YAML con el parser en C de libyaml si está disponible"""
+    # PyYAML solo se importa si no hay caché válida
+    import yaml
+
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    try:
+        return yaml.load(text, Loader=loader)
+    except yaml.YAMLError as e:
+        raise ValueError(f"Error al parsear el archivo YAML: {e}")
+
+
+class CompiledPrompt:
+    """Plantilla ya resuelta salvo los huecos variables de cada solicitud"""
+
+    __slots__ = ("parts",)
+
+    def __init__(self, text: str):
+        """Divide el texto marcado en literales (posiciones pares) y huecos (impares)"""
+        self.parts = tuple(text.split(_SLOT_MARK))
+
+    def render(self, values: Dict[str, str]) -> str:
+        """Rellena los huecos variables con los valores de la solicitud"""
+        parts = list(self.parts)
+        for i in range(1, len(parts), 2):
+            parts[i] = values[parts[i]]
+        return "".join(parts)
+
+
+class PromptSet(NamedTuple):
+    """Versión inmutable de las plantillas cargadas desde el YAML"""
+
+    data: Dict[str, Any]
+    compiled: Dict[PromptKey, CompiledPrompt]
+    version: str
 
 
 class PromptManager:
     """Clase gestora de prompts para la API"""
 
-    def __init__(self, prompts_file: str = "prompts.yaml"):
-        """Inicializa el gestor de prompts cargando el archivo YAML"""
+    def __init__(self, prompts_file: str = "prompts.yaml", cache_file: Optional[str] = None):
+        """
+        Inicializa el gestor de prompts cargando y precompilando el archivo YAML.
+        Con `cache_file`, el YAML ya parseado se guarda en ese archivo y, mientras el
+        contenido del YAML no cambie, se lee de ahí sin cargar el parser de YAML.
+        """
         self.prompts_file = prompts_file
-        self.prompts_data = self._load_prompts()
+        self.cache_file = cache_file
+        self._prompt_set = self._build_prompt_set()
+        self._file_signature = self._stat_signature()
+        self._watch_task: Optional[asyncio.Task] = None
+
+    @property
+    def prompts_data(self) -> Dict[str, Any]:
+        """Datos del YAML de la versión activa"""
+        return self._prompt_set.data
+
+    @property
+    def compiled_prompts(self) -> Dict[PromptKey, CompiledPrompt]:
+        """Plantillas precompiladas de la versión activa"""
+        return self._prompt_set.compiled
+
+    @property
+    def version(self) -> str:
+        """Hash corto del contenido del YAML activo"""
+        return self._prompt_set.version
 
-    def _load_prompts(self) -> Dict[str, Any]:
-        """Carga las plantillas de prompts desde el archivo YAML"""
+    def _load_prompts(self) -> Tuple[Dict[str, Any], str]:
+        """Carga las plantillas de prompts desde el archivo YAML junto con su hash"""
         try:
-            with open(self.prompts_file, "r", encoding="utf-8") as file:
-                return yaml.safe_load(file)
+            with open(self.prompts_file, "rb") as file:
+                raw = file.read()
         except FileNotFoundError:
             raise FileNotFoundError(
                 f"No se encontró el archivo de prompts: {self.prompts_file}"
             )
-        except yaml.YAMLError as e:
-            raise ValueError(f"Error al parsear el archivo YAML: {e}")
+        version = hashlib.sha256(raw).hexdigest()[:12]
+        prompts_data = self._read_cache(version)
+        if prompts_data is not None:
+            return prompts_data, version
+
+        prompts_data = parse_yaml(raw.decode("utf-8"))
+        if not isinstance(prompts_data, dict):
+            raise ValueError("Error al parsear el archivo YAML: se esperaba un mapa")
+        self._write_cache(prompts_data, version)
+        return prompts_data, version
+
+    def _read_cache(self, version: str) -> Optional[Dict[str, Any]]:
+        """YAML ya parseado de la caché compilada, si corresponde a esta versión"""
+        if not self.cache_file:
+            return None
+        try:
+            with open(self.cache_file, "rb") as file:
+                header, cached_version, prompts_data = marshal.load(file)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if header != _CACHE_HEADER or cached_version != version:
+            return None
+        return prompts_data
+
+    def _write_cache(self, prompts_data: Dict[str, Any], version: str) -> None:
+        """Guarda el YAML parseado en la caché compilada (sin fallar si no se puede)"""
+        if not self.cache_file:
+            return
+        temporary = f"{self.cache_file}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, "wb") as file:
+                marshal.dump((_CACHE_HEADER, version, prompts_data), file)
+            # Reemplazo atómico: otro worker nunca lee una caché a medio escribir
+            os.replace(temporary, self.cache_file)
+        except (OSError, ValueError) as e:
+            logger.warning("No se pudo escribir la caché de prompts %s: %s", self.cache_file, e)
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+
+    def _build_prompt_set(self) -> PromptSet:
+        """Carga y precompila una nueva versión de las plantillas"""
+        prompts_data, version = self._load_prompts()
+        return PromptSet(prompts_data, self._compile_all(prompts_data), version)
+
+    def reload_prompts(self) -> str:
+        """
+        Recarga y precompila las plantillas de prompts desde el archivo.
+        La nueva versión sustituye a la anterior de forma atómica; si el YAML es
+        inválido se lanza la excepción y sigue activa la última versión correcta.
+        """
+        signature = self._stat_signature()
+        prompt_set = self._build_prompt_set()
+        self._file_signature = signature
+        if prompt_set.version != self.version:
+            logger.info("Plantillas recargadas: versión %s", prompt_set.version)
+        self._prompt_set = prompt_set
+        return prompt_set.version
+
+    def _stat_signature(self) -> Optional[Tuple[int, int]]:
+        """Fecha de modificación y tamaño del archivo, para detectar cambios"""
+        try:
+            stat = os.stat(self.prompts_file)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    async def start_watching(self, interval: float) -> None:
+        """Arranca la vigilancia periódica del archivo de prompts"""
+        if self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch(interval))
+
+    async def stop_watching(self) -> None:
+        """Detiene la vigilancia del archivo de prompts"""
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+    async def _watch(self, interval: float) -> None:
+        """Recarga el YAML en un hilo aparte cada vez que cambia el archivo"""
+        while True:
+            await asyncio.sleep(interval)
+            signature = self._stat_signature()
+            if signature is None or signature == self._file_signature:
+                continue
+            try:
+                await asyncio.to_thread(self.reload_prompts)
+            except Exception as e:
+                # Se conserva la última versión válida hasta el próximo cambio
+                self._file_signature = signature
+                logger.error("No se pudo recargar %s: %s", self.prompts_file, e)
+
+    def _compile_all(self, prompts_data: Dict[str, Any]) -> Dict[PromptKey, CompiledPrompt]:
+        """
+        Precompila todas las combinaciones de género, categoría y nivel de creatividad.
+        Una plantilla con parámetros desconocidos falla aquí, al cargar, y no por solicitud.
+        """
+        return {
+            (genre, category, creativity_level): self._compile(
+                prompts_data, genre, category, creativity_level
+            )
+            for genre in prompts_data.get("genres", {})
+            for category in CATEGORIES
+            for creativity_level in prompts_data.get("creativity_levels", {})
+        }
+
+    def _compile(
+        self,
+        prompts_data: Dict[str, Any],
+        genre: str,
+        category: str,
+        creativity_level: str,
+    ) -> CompiledPrompt:
+        """Resuelve ambas plantillas dejando marcados solo los huecos variables"""
+        genre_info = self._lookup(prompts_data, "genres", genre, "fantasia")
+        creativity_info = self._lookup(
+            prompts_data, "creativity_levels", creativity_level, "creativo"
+        )
+        slots = {name: f"{_SLOT_MARK}{name}{_SLOT_MARK}" for name in VARIABLE_SLOTS}
+
+        try:
+            # Primero formatear el base_prompt con los parámetros básicos
+            base_prompt = prompts_data.get("base_prompt", "").format(
+                genre=genre,
+                category=category,
+                creativity_level=creativity_level,
+                **slots,
+            )
+
+            # Generar el prompt final usando la plantilla
+            final_prompt = prompts_data.get("prompt_template", "").format(
+                base_prompt=base_prompt,
+                genre=genre,
+                genre_description=genre_info.get("description", ""),
+                genre_elements=genre_info.get("elements", ""),
+                genre_tone=genre_info.get("tone", ""),
+                creativity_level=creativity_level,
+                creativity_instructions=creativity_info.get("instructions", ""),
+            )
+        except KeyError as e:
+            raise ValueError(f"Error en la plantilla de prompt: parámetro faltante {e}")
+        except (IndexError, ValueError) as e:
+            raise ValueError(f"Error en la plantilla de prompt: {e}")
+
+        return CompiledPrompt(final_prompt)
 
-    def reload_prompts(self) -> None:
-        """Recarga las plantillas de prompts desde el archivo"""
-        self.prompts_data = self._load_prompts()
+    @staticmethod
+    def _lookup(
+        prompts_data: Dict[str, Any], section: str, name: str, fallback: str
+    ) -> Dict[str, str]:
+        """Obtiene una entrada de una sección del YAML, con valor por defecto"""
+        entries = prompts_data.get(section, {})
+        if name not in entries:
+            return entries.get(fallback, {})
+        return entries[name]
 
     def get_genre_info(self, genre: str) -> Dict[str, str]:
         """Obtiene la información específica de un género"""
-        genres = self.prompts_data.get("genres", {})
-        if genre not in genres:
-            # Fallback a fantasía si el género no existe
-            return genres.get("fantasia", {})
-        return genres[genre]
+        # Fallback a fantasía si el género no existe
+        return self._lookup(self.prompts_data, "genres", genre, "fantasia")
 
     def get_creativity_info(self, creativity_level: str) -> Dict[str, str]:
         """Obtiene la información específica de un nivel de creatividad"""
-        creativity_levels = self.prompts_data.get("creativity_levels", {})
-        if creativity_level not in creativity_levels:
-            # Fallback a creativo si el nivel no existe
-            return creativity_levels.get("creativo", {})
-        return creativity_levels[creativity_level]
+        # Fallback a creativo si el nivel no existe
+        return self._lookup(
+            self.prompts_data, "creativity_levels", creativity_level, "creativo"
+        )
 
     def generate_prompt(self, request: StoryRequest) -> str:
         """Genera el prompt completo basado en el request"""
-        # Obtener información del género y creatividad
-        genre_info = self.get_genre_info(request.genre)
-        creativity_info = self.get_creativity_info(request.creativity_level)
-
-        # Primero formatear el base_prompt con los parámetros básicos
-        base_prompt_params = {
-            "genre": request.genre,
-            "category": request.category,
-            "word_count": request.word_count,
-            "creativity_level": request.creativity_level,
-            "suggestions": request.suggestions or "Ninguna sugerencia específica",
-        }
-
-        base_prompt_template = self.prompts_data.get("base_prompt", "")
-        formatted_base_prompt = base_prompt_template.format(**base_prompt_params)
-
-        # Preparar los parámetros para la plantilla final
-        params = {
-            "base_prompt": formatted_base_prompt,
-            "genre": request.genre,
-            "genre_description": genre_info.get("description", ""),
-            "genre_elements": genre_info.get("elements", ""),
-            "genre_tone": genre_info.get("tone", ""),
-            "creativity_level": request.creativity_level,
-            "creativity_instructions": creativity_info.get("instructions", ""),
-        }
+        return self.render_prompt(request)[0]
 
-        # Generar el prompt final usando la plantilla
-        prompt_template = self.prompts_data.get("prompt_template", "")
+    def render_prompt(self, request: StoryRequest) -> Tuple[str, str]:
+        """
+        Genera el prompt completo y devuelve también la versión de las plantillas con
+        la que se generó, aunque entretanto se recargue `prompts.yaml`
+        """
+        key = (request.genre, request.category, request.creativity_level)
+        # Una sola lectura de la versión activa para todo el prompt
+        prompt_set = self._prompt_set
+        compiled = prompt_set.compiled.get(key)
+        if compiled is None:
+            # Combinación fuera del YAML: se compila con los valores por defecto
+            compiled = prompt_set.compiled[key] = self._compile(prompt_set.data, *key)
 
-        try:
-            final_prompt = prompt_template.format(**params)
-            return final_prompt
-        except KeyError as e:
-            raise ValueError(f"Error en la plantilla de prompt: parámetro faltante {e}")
+        prompt = compiled.render(
+            {
+                "word_count": str(request.word_count),
+                "suggestions": request.suggestions or "Ninguna sugerencia específica",
+            }
+        )
+        return prompt, prompt_set.version
 
     def get_available_genres(self) -> list:
         """Retorna la lista de géneros disponibles"""
@@ -96,4 +311,4 @@ class PromptManager:
 
 
 # Instancia global del gestor de prompts
-prompt_manager = PromptManager()
+prompt_manager = PromptManager(cache_file=settings.prompts_cache_file)
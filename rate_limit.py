@@ -0,0 +1,338 @@
+"""Límites de admisión por cliente y globales (token buckets y cuotas de concurrencia)"""
+
+# Python imports.
+import json
+import math
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, FrozenSet, Optional, Sequence, Tuple
+
+# Project imports.
+from config import settings
+from shared_state import state_client
+from metrics import RATE_LIMIT_REJECTIONS
+
+# Configuración de logging.
+logger = logging.getLogger(__name__)
+
+# Endpoints que generan historias y por tanto consumen cuota del proveedor
+LIMITED_PATHS = ("/generate-story", "/generate-story/stream", "/generate-stories", "/jobs")
+# Bucket compartido por todos los clientes (cuota del proveedor)
+GLOBAL_KEY = "global"
+
+# Token bucket atómico para almacenes compatibles con Redis; equivale a `refill_bucket`
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local tokens, updated = burst, now
+local state = redis.call('GET', KEYS[1])
+if state then
+  local sep = string.find(state, ' ')
+  tokens = tonumber(string.sub(state, 1, sep - 1))
+  updated = tonumber(string.sub(state, sep + 1))
+end
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= cost then
+  tokens = math.min(burst, tokens - cost)
+else
+  wait = (cost - tokens) / rate
+end
+redis.call('SET', KEYS[1], tokens .. ' ' .. now, 'EX', math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+def refill_bucket(
+    state: Optional[Tuple[float, float]], now: float, rate: float, burst: float, cost: float
+) -> Tuple[Tuple[float, float], float]:
+    """
+    Aplica un token bucket: recarga `rate` tokens por segundo hasta `burst` y consume
+    `cost` si hay suficientes. Devuelve el nuevo estado `(tokens, instante)` y los
+    segundos a esperar (0 si se admite). Un `cost` negativo devuelve tokens.
+    """
+    tokens, updated = state if state is not None else (burst, now)
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if tokens >= cost:
+        return (min(burst, tokens - cost), now), 0.0
+    return (tokens, now), (cost - tokens) / rate
+
+
+class RateLimitStore:
+    """Interfaz de almacenamiento de los buckets y contadores de concurrencia"""
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1) -> float:
+        """
+        Consume `cost` tokens del bucket; devuelve 0 o los segundos a esperar. Con
+        `cost` negativo devuelve tokens al bucket (sin superar `burst`).
+        """
+        raise NotImplementedError
+
+    async def acquire(self, key: str, limit: int) -> bool:
+        """Ocupa un hueco de concurrencia si quedan libres"""
+        raise NotImplementedError
+
+    async def release(self, key: str) -> None:
+        """Libera un hueco de concurrencia"""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        """Libera los recursos del almacenamiento"""
+
+
+class InMemoryRateLimitStore(RateLimitStore):
+    """
+    Almacenamiento en memoria del proceso (límites por worker). Con más de `max_keys`
+    buckets se olvidan los de uso menos reciente; el global nunca se olvida.
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._active: Dict[str, int] = {}
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1) -> float:
+        state, wait = refill_bucket(self._buckets.get(key), time.monotonic(), rate, burst, cost)
+        self._buckets[key] = state
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > max(self.max_keys, 1):
+            oldest, oldest_state = self._buckets.popitem(last=False)
+            if oldest == GLOBAL_KEY:
+                self._buckets[oldest] = oldest_state
+        return wait
+
+    async def acquire(self, key: str, limit: int) -> bool:
+        active = self._active.get(key, 0)
+        if active >= limit:
+            return False
+        self._active[key] = active + 1
+        return True
+
+    async def release(self, key: str) -> None:
+        active = self._active.get(key, 0) - 1
+        if active > 0:
+            self._active[key] = active
+        else:
+            self._active.pop(key, None)
+
+
+class KeyValueRateLimitStore(RateLimitStore):
+    """
+    Almacenamiento compartido entre workers sobre un almacén con la interfaz de
+    `redis.asyncio` (`eval`, `incr`, `decr`, `expire`). Los contadores de concurrencia
+    expiran a los `slot_ttl` segundos para no quedar ocupados si un worker muere.
+    """
+
+    def __init__(self, client: Any, prefix: str = "rate-limit:", slot_ttl: int = 300):
+        self.client = client
+        self.prefix = prefix
+        self.slot_ttl = slot_ttl
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1) -> float:
+        wait = await self.client.eval(
+            TOKEN_BUCKET_SCRIPT, 1, self.prefix + "bucket:" + key, rate, burst, cost, time.time()
+        )
+        return float(wait)
+
+    async def acquire(self, key: str, limit: int) -> bool:
+        slot_key = self.prefix + "active:" + key
+        active = await self.client.incr(slot_key)
+        await self.client.expire(slot_key, self.slot_ttl)
+        if active > limit:
+            await self.client.decr(slot_key)
+            return False
+        return True
+
+    async def release(self, key: str) -> None:
+        await self.client.decr(self.prefix + "active:" + key)
+
+    async def close(self) -> None:
+        close = getattr(self.client, "aclose", None) or getattr(self.client, "close", None)
+        if close is not None:
+            await close()
+
+
+class RateLimitExceeded(Exception):
+    """La solicitud supera un límite; `reason` indica cuál"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """Aplica el token bucket y la cuota de concurrencia del cliente y el bucket global"""
+
+    def __init__(
+        self,
+        store: RateLimitStore,
+        client_rate: float = 1,
+        client_burst: int = 10,
+        client_concurrency: int = 5,
+        global_rate: float = 50,
+        global_burst: int = 100,
+    ):
+        self.store = store
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.client_concurrency = client_concurrency
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+
+    async def admit(self, client: str) -> None:
+        """
+        Ocupa un hueco de concurrencia del cliente; lanza RateLimitExceeded si no hay
+        tokens o huecos. Tras admitir, hay que llamar a `release(client)`. Una solicitud
+        rechazada no consume nada: el hueco se ocupa primero y los tokens tomados se
+        devuelven si un paso posterior la rechaza.
+        """
+        key = "client:" + client
+        if not await self.store.acquire(key, self.client_concurrency):
+            raise RateLimitExceeded("client_concurrency", 1)
+        try:
+            wait = await self.store.take(key, self.client_rate, self.client_burst)
+            if wait:
+                raise RateLimitExceeded("client_rate", wait)
+            wait = await self.store.take(GLOBAL_KEY, self.global_rate, self.global_burst)
+            if wait:
+                await self.store.take(key, self.client_rate, self.client_burst, -1)
+                raise RateLimitExceeded("global_rate", wait)
+        except BaseException:
+            await self.store.release(key)
+            raise
+
+    async def throttle_global(self) -> None:
+        """
+        Espera a que el bucket global tenga un token y lo consume. Para cada historia
+        de un lote ya admitido: el lote avanza al ritmo de la cuota del proveedor.
+        """
+        while True:
+            wait = await self.store.take(GLOBAL_KEY, self.global_rate, self.global_burst)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    async def release(self, client: str) -> None:
+        """Libera el hueco de concurrencia ocupado por `admit`"""
+        await self.store.release("client:" + client)
+
+    async def close(self) -> None:
+        """Cierra el almacenamiento"""
+        await self.store.close()
+
+
+@lru_cache(maxsize=8)
+def _key_digests(api_keys: Tuple[str, ...]) -> FrozenSet[str]:
+    """Hashes de las API keys configuradas"""
+    return frozenset(hashlib.sha256(key.encode("utf-8")).hexdigest() for key in api_keys)
+
+
+def client_identity(
+    scope: Dict[str, Any], trust_forwarded: bool = False, api_keys: Sequence[str] = ()
+) -> str:
+    """
+    Identifica al cliente por su API key (hash) si está entre `api_keys` o, si no, por
+    su IP. Una clave desconocida no crea buckets nuevos: cuenta como su IP. Con
+    `trust_forwarded`, la IP es la última de `X-Forwarded-For`, la que añade el proxy
+    de confianza; las anteriores las controla el cliente.
+    """
+    headers = dict(scope.get("headers") or [])
+    api_key = headers.get(b"x-api-key")
+    if api_key:
+        digest = hashlib.sha256(api_key).hexdigest()
+        if digest in _key_digests(tuple(api_keys)):
+            return "key:" + digest[:16]
+    forwarded = headers.get(b"x-forwarded-for")
+    if trust_forwarded and forwarded:
+        address = forwarded.decode("latin-1").split(",")[-1].strip()
+        if address:
+            return "ip:" + address
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+class RateLimitMiddleware:
+    """
+    Middleware ASGI que admite o rechaza (429 con `Retry-After`) las solicitudes a
+    `LIMITED_PATHS`. El hueco de concurrencia se libera al terminar de enviar la
+    respuesta, de modo que los streams cuentan mientras están abiertos.
+    """
+
+    def __init__(self, app, get_limiter: Callable[[], Optional[RateLimiter]]):
+        self.app = app
+        self.get_limiter = get_limiter
+
+    async def __call__(self, scope, receive, send):
+        limiter = self.get_limiter()
+        if (
+            limiter is None
+            or scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in LIMITED_PATHS
+        ):
+            return await self.app(scope, receive, send)
+
+        client = client_identity(
+            scope, settings.rate_limit_trust_forwarded, settings.rate_limit_api_keys
+        )
+        try:
+            await limiter.admit(client)
+        except RateLimitExceeded as e:
+            RATE_LIMIT_REJECTIONS.labels(e.reason).inc()
+            logger.warning("Solicitud de %s rechazada por límite %s", client, e.reason)
+            return await self._reject(send, e)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            await limiter.release(client)
+
+    @staticmethod
+    async def _reject(send, error: RateLimitExceeded) -> None:
+        """Responde 429 con el mismo formato de error que HTTPException"""
+        body = json.dumps(
+            {"detail": f"Límite de solicitudes excedido ({error.reason})"},
+            ensure_ascii=False,
+        ).encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(max(1, math.ceil(error.retry_after))).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+def build_rate_limiter() -> Optional[RateLimiter]:
+    """Crea el limitador según la configuración, o None si está desactivado"""
+    if not settings.rate_limit_enabled:
+        return None
+
+    client = state_client("rate_limit")
+    if client is not None:
+        store = KeyValueRateLimitStore(client)
+    else:
+        store = InMemoryRateLimitStore()
+    return RateLimiter(
+        store,
+        client_rate=settings.rate_limit_client_rate,
+        client_burst=settings.rate_limit_client_burst,
+        client_concurrency=settings.rate_limit_client_concurrency,
+        global_rate=settings.rate_limit_global_rate,
+        global_burst=settings.rate_limit_global_burst,
+    )
+
+
+# Instancia global del limitador (None si RATE_LIMIT_ENABLED=false)
+rate_limiter = build_rate_limiter()
@@ -0,0 +1,306 @@
+"""Reintentos, plazos y circuit breaker alrededor de las llamadas al LLM"""
+
+# Python imports.
+import time
+import random
+import asyncio
+import logging
+import email.utils
+import contextvars
+from collections import deque
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple, Type, TypeVar
+
+# Project imports.
+from config import settings
+
+# Configuración de logging.
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Instante (time.monotonic) en que vence el presupuesto de tiempo del cliente.
+request_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "request_deadline", default=None
+)
+
+
+@lru_cache(maxsize=None)
+def retryable_errors() -> Tuple[Type[Exception], ...]:
+    """Errores transitorios del proveedor que merece la pena reintentar"""
+    # El SDK de OpenAI tarda en importarse: solo se carga cuando hace falta
+    import openai
+
+    return (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    )
+
+
+class ServiceUnavailableError(Exception):
+    """El proveedor no está disponible; el cliente puede reintentar más tarde"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(ServiceUnavailableError):
+    """Se agotó el presupuesto de tiempo del cliente"""
+
+
+class CircuitOpenError(ServiceUnavailableError):
+    """El circuit breaker está abierto y se falla sin llamar al proveedor"""
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Lee `retry-after-ms` o `Retry-After` (segundos o fecha HTTP) de la respuesta"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        return float(headers.get("retry-after-ms")) / 1000
+    except (TypeError, ValueError):
+        pass
+    retry_after = headers.get("retry-after")
+    if retry_after is None:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        parsed = email.utils.parsedate_tz(retry_after)
+        if parsed is None:
+            return None
+        return max(0.0, email.utils.mktime_tz(parsed) - time.time())
+
+
+class RetryPolicy:
+    """Backoff exponencial con jitter completo que respeta `Retry-After`"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Espera antes del reintento número `attempt` (empezando en 0)"""
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por tasa de error sobre una ventana de las últimas llamadas.
+    Abierto, falla de inmediato; pasado `open_seconds` deja pasar una llamada de
+    prueba (semiabierto) que decide si se cierra o vuelve a abrirse.
+    """
+
+    def __init__(
+        self,
+        window: int = 20,
+        min_requests: int = 10,
+        error_rate: float = 0.5,
+        open_seconds: float = 30,
+    ):
+        self.min_requests = min_requests
+        self.error_rate_threshold = error_rate
+        self.open_seconds = open_seconds
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        """closed, open o half_open"""
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.open_seconds:
+            return "open"
+        return "half_open"
+
+    @property
+    def error_rate(self) -> float:
+        """Proporción de fallos en la ventana actual"""
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def before_call(self) -> None:
+        """Lanza CircuitOpenError si la llamada no debe llegar al proveedor"""
+        state = self.state
+        if state == "open" or (state == "half_open" and self._probing):
+            remaining = self.open_seconds - (time.monotonic() - self._opened_at)
+            raise CircuitOpenError(
+                "El servicio de OpenAI no está disponible temporalmente",
+                retry_after=max(1.0, remaining),
+            )
+        if state == "half_open":
+            self._probing = True
+
+    def record_success(self) -> None:
+        """Registra una llamada correcta (cierra el circuito si estaba en prueba)"""
+        if self._opened_at is not None:
+            logger.info("Circuit breaker cerrado: el proveedor responde de nuevo")
+            self._opened_at = None
+            self._probing = False
+            self._outcomes.clear()
+        self._outcomes.append(True)
+
+    def release_probe(self) -> None:
+        """
+        Libera la llamada de prueba que terminó sin un resultado que valore al
+        proveedor (error no transitorio o cancelación): la siguiente llamada probará
+        """
+        self._probing = False
+
+    def record_failure(self) -> None:
+        """Registra un fallo transitorio y abre el circuito si se supera el umbral"""
+        self._outcomes.append(False)
+        if self._opened_at is not None:
+            # Falló la llamada de prueba: se vuelve a abrir
+            self._open()
+        elif (
+            len(self._outcomes) >= self.min_requests
+            and self.error_rate >= self.error_rate_threshold
+        ):
+            self._open()
+
+    def _open(self) -> None:
+        """Abre el circuito"""
+        self._opened_at = time.monotonic()
+        self._probing = False
+        self.times_opened += 1
+        logger.warning("Circuit breaker abierto (tasa de error %.0f%%)", self.error_rate * 100)
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado del circuito"""
+        return {
+            "state": self.state,
+            "error_rate": round(self.error_rate, 4),
+            "window_calls": len(self._outcomes),
+            "times_opened": self.times_opened,
+        }
+
+
+class ResilientCaller:
+    """Aplica reintentos, plazo por intento y circuit breaker a una operación"""
+
+    def __init__(
+        self,
+        policy: RetryPolicy,
+        breaker: CircuitBreaker,
+        budget: float = 90,
+        attempt_timeout: float = 120,
+    ):
+        self.policy = policy
+        self.breaker = breaker
+        self.budget = budget
+        self.attempt_timeout = attempt_timeout
+        self.retries = 0
+        self.exhausted = 0
+        self.deadline_exceeded = 0
+
+    async def call(self, operation: Callable[[float], Awaitable[T]]) -> T:
+        """
+        Ejecuta `operation(timeout)` reintentando los errores transitorios.
+        El timeout de cada intento es el menor entre el configurado y lo que queda del
+        presupuesto del cliente (cabecera `X-Request-Timeout` o `LLM_REQUEST_BUDGET`).
+        """
+        deadline = request_deadline.get() or time.monotonic() + self.budget
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.deadline_exceeded += 1
+                raise DeadlineExceededError(
+                    "Se agotó el tiempo disponible para generar la historia"
+                )
+            self.breaker.before_call()
+            try:
+                result = await operation(min(self.attempt_timeout, remaining))
+            except retryable_errors() as e:
+                self.breaker.record_failure()
+                delay = self.policy.delay(attempt, retry_after_seconds(e))
+                attempt += 1
+                if attempt >= self.policy.max_attempts:
+                    self.exhausted += 1
+                    raise
+                if time.monotonic() + delay >= deadline:
+                    self.deadline_exceeded += 1
+                    raise
+                self.retries += 1
+                logger.warning(
+                    "Error transitorio de OpenAI (%s), reintento %s en %.2fs",
+                    type(e).__name__,
+                    attempt,
+                    delay,
+                )
+                await asyncio.sleep(delay)
+            except BaseException:
+                # Incluye CancelledError: sin liberarla, la prueba bloquearía el circuito
+                self.breaker.release_probe()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de reintentos y estado del circuit breaker"""
+        return {
+            "retries": self.retries,
+            "retries_exhausted": self.exhausted,
+            "deadline_exceeded": self.deadline_exceeded,
+            "circuit_breaker": self.breaker.stats(),
+        }
+
+
+# Instancia global usada por los servicios del LLM
+class RequestBudgetMiddleware:
+    """
+    Middleware ASGI que fija el plazo de la solicitud a partir de la cabecera
+    `X-Request-Timeout` (segundos que el cliente está dispuesto a esperar)
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        timeout = None
+        if scope["type"] == "http":
+            for name, value in scope["headers"]:
+                if name == b"x-request-timeout":
+                    try:
+                        timeout = float(value)
+                    except ValueError:
+                        pass
+                    break
+        if timeout is None or not timeout > 0:
+            await self.app(scope, receive, send)
+            return
+        token = request_deadline.set(time.monotonic() + timeout)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_deadline.reset(token)
+
+
+llm_caller = ResilientCaller(
+    RetryPolicy(
+        max_attempts=settings.llm_retry_max_attempts,
+        base_delay=settings.llm_retry_base_delay,
+        max_delay=settings.llm_retry_max_delay,
+    ),
+    CircuitBreaker(
+        window=settings.breaker_window,
+        min_requests=settings.breaker_min_requests,
+        error_rate=settings.breaker_error_rate,
+        open_seconds=settings.breaker_open_seconds,
+    ),
+    budget=settings.llm_request_budget,
+    attempt_timeout=settings.openai_read_timeout,
+)
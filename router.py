@@ -0,0 +1,335 @@
+"""Enrutado de las llamadas al LLM entre varios backends compatibles con OpenAI"""
+
+# Python imports.
+import time
+import random
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+# Project imports.
+from models import StoryRequest
+from config import settings
+from http_pool import build_http_client, build_timeout
+
+if TYPE_CHECKING:
+    import openai
+
+# Configuración de logging.
+logger = logging.getLogger(__name__)
+
+# Segundos que suma a la puntuación una tasa de error de 1 (el coste de reintentar)
+ERROR_PENALTY = 5
+# Segundos en los que se olvida la mitad de la tasa de error sin nuevas muestras
+ERROR_HALF_LIFE = 30
+# Segundos en los que se olvida la mitad de la latencia sin nuevas muestras, para que
+# un backend que fue lento vuelva a probarse de vez en cuando
+LATENCY_HALF_LIFE = 60
+
+
+class Backend:
+    """
+    Backend compatible con OpenAI con su propio cliente, límite de concurrencia y
+    medias móviles exponenciales de latencia y tasa de error
+    """
+
+    def __init__(
+        self,
+        name: str,
+        model: str,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        weight: float = 1.0,
+        max_concurrency: int = 50,
+        cheap: bool = False,
+        alpha: float = 0.2,
+    ):
+        self.name = name
+        self.model = model
+        self.base_url = base_url
+        self.api_key = api_key
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        self.cheap = cheap
+        self.alpha = alpha
+
+        self.client: Optional["openai.AsyncOpenAI"] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._latency: Optional[float] = None
+        self._latency_updated = 0.0
+        self._error_rate = 0.0
+        self._error_updated = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+
+    def open(self) -> None:
+        """Crea el cliente y el semáforo del backend (dentro del event loop de la app)"""
+        # El SDK de OpenAI tarda en importarse: se carga al abrir el primer cliente
+        import openai
+
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.client = openai.AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            timeout=build_timeout(),
+            # Los reintentos los gestiona resilience.llm_caller
+            max_retries=0,
+            http_client=build_http_client(),
+        )
+
+    async def close(self) -> None:
+        """Cierra el cliente y su pool de conexiones"""
+        if self.client is not None:
+            await self.client.close()
+        self.client = None
+        self._semaphore = None
+
+    @property
+    def latency(self) -> Optional[float]:
+        """Latencia estimada (None sin muestras)"""
+        if self._latency is None:
+            return None
+        elapsed = time.monotonic() - self._latency_updated
+        return self._latency * 0.5 ** (elapsed / LATENCY_HALF_LIFE)
+
+    @latency.setter
+    def latency(self, value: Optional[float]) -> None:
+        self._latency = value
+        self._latency_updated = time.monotonic()
+
+    @property
+    def error_rate(self) -> float:
+        """Tasa de error que se va olvidando si el backend deja de fallar"""
+        elapsed = time.monotonic() - self._error_updated
+        return self._error_rate * 0.5 ** (elapsed / ERROR_HALF_LIFE)
+
+    def score(self) -> float:
+        """Coste estimado de enviar una llamada ahora (menor es mejor)"""
+        # Sin muestras se asume latencia mínima para que el backend se explore
+        latency = (self.latency or 0.0) + 0.001
+        load = 1 + self.in_flight / self.max_concurrency
+        return latency * load / self.weight + ERROR_PENALTY * self.error_rate
+
+    def record(self, latency: Optional[float] = None, failed: bool = False) -> None:
+        """Actualiza las medias con el resultado de una llamada"""
+        self.requests += 1
+        if self.requests == 1:
+            # La primera llamada incluye abrir la conexión: no es una muestra representativa
+            latency = None
+        if failed:
+            self.errors += 1
+            self._error_rate = self.error_rate + self.alpha * (1 - self.error_rate)
+        else:
+            self._error_rate = self.error_rate * (1 - self.alpha)
+        self._error_updated = time.monotonic()
+        if latency is not None:
+            current = self.latency
+            self.latency = latency if current is None else current + self.alpha * (latency - current)
+
+    async def acquire(self) -> None:
+        """Ocupa un hueco de concurrencia del backend"""
+        await self._semaphore.acquire()
+        self.in_flight += 1
+
+    def release(self) -> None:
+        """Libera el hueco ocupado con `acquire`"""
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    async def create(self, **params: Any) -> Any:
+        """Chat completion sin streaming con el modelo del backend"""
+        await self.acquire()
+        started = time.perf_counter()
+        try:
+            response = await self.client.chat.completions.create(
+                **{**params, "model": self.model}
+            )
+        except Exception:
+            self.record(failed=True)
+            raise
+        finally:
+            self.release()
+        self.record(latency=time.perf_counter() - started)
+        return response
+
+    async def open_stream(self, **params: Any) -> Any:
+        """
+        Abre un stream con el modelo del backend. El hueco de concurrencia queda
+        ocupado hasta que quien lo lee llame a `release`.
+        """
+        await self.acquire()
+        try:
+            stream = await self.client.chat.completions.create(
+                **{**params, "model": self.model, "stream": True}
+            )
+        except BaseException as e:
+            self.release()
+            if isinstance(e, Exception):
+                self.record(failed=True)
+            raise
+        # La apertura no es comparable con una completion entera: solo cuenta el éxito
+        self.record()
+        return stream
+
+    async def probe(self, timeout: float) -> float:
+        """
+        Comprueba que el backend responde con una llamada sin coste (listar modelos)
+        y devuelve su latencia. No cuenta para las medias del enrutado.
+        """
+        started = time.perf_counter()
+        await self.client.models.list(timeout=timeout)
+        return time.perf_counter() - started
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado del backend"""
+        return {
+            "name": self.name,
+            "model": self.model,
+            "latency_ewma": round(self.latency, 4) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 4),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+
+class Router:
+    """
+    Elige un backend por solicitud entre dos candidatos sorteados según su peso,
+    quedándose con el de menor puntuación (latencia, carga y errores). Opcionalmente
+    duplica (hedging) en otro backend las llamadas que tardan más de `hedge_delay`.
+    """
+
+    def __init__(
+        self,
+        backends: Sequence[Backend],
+        hedge_delay: float = 0,
+        cheap_routing: bool = False,
+        cheap_max_words: int = 200,
+    ):
+        if not backends:
+            raise ValueError("El router necesita al menos un backend")
+        self.backends = list(backends)
+        self.hedge_delay = hedge_delay
+        self.cheap_routing = cheap_routing
+        self.cheap_max_words = cheap_max_words
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def open(self) -> None:
+        """Crea los clientes de todos los backends"""
+        for backend in self.backends:
+            backend.open()
+
+    async def close(self) -> None:
+        """Cierra los clientes de todos los backends"""
+        for backend in self.backends:
+            await backend.close()
+
+    def wants_cheap(self, request: StoryRequest) -> bool:
+        """Las historias cortas o conservadoras pueden ir a un modelo más barato"""
+        return self.cheap_routing and (
+            request.word_count <= self.cheap_max_words
+            or request.creativity_level == "conservador"
+        )
+
+    def candidates(self, request: StoryRequest) -> List[Backend]:
+        """Backends adecuados para la solicitud"""
+        cheap = [b for b in self.backends if b.cheap]
+        regular = [b for b in self.backends if not b.cheap]
+        if self.wants_cheap(request) and cheap:
+            return cheap
+        return regular or cheap
+
+    def pick(self, request: StoryRequest, exclude: Sequence[Backend] = ()) -> Optional[Backend]:
+        """Elige un backend (None si todos están excluidos)"""
+        candidates = [b for b in self.candidates(request) if b not in exclude]
+        if not candidates:
+            # Para el hedging vale cualquier otro backend
+            candidates = [b for b in self.backends if b not in exclude]
+        if len(candidates) <= 2:
+            sample = candidates
+        else:
+            sample = set(random.choices(candidates, [b.weight for b in candidates], k=2))
+        if not sample:
+            return None
+        return min(sample, key=lambda b: b.score())
+
+    async def complete(self, request: StoryRequest, **params: Any) -> Tuple[Any, Backend]:
+        """Chat completion en el backend elegido; devuelve la respuesta y el backend"""
+        primary = self.pick(request)
+        if self.hedge_delay <= 0 or len(self.backends) < 2:
+            return await primary.create(**params), primary
+
+        first = asyncio.create_task(primary.create(**params))
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_delay)
+            if done:
+                return first.result(), primary
+
+            secondary = self.pick(request, exclude=[primary])
+            self.hedges += 1
+            logger.info(
+                "Hedging: %s tarda más de %ss, se duplica la llamada en %s",
+                primary.name,
+                self.hedge_delay,
+                secondary.name,
+            )
+            second = asyncio.create_task(secondary.create(**params))
+            tasks = {first: primary, second: secondary}
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result(), tasks[task]
+                    error = task.exception()
+            raise error
+        finally:
+            # La llamada perdedora (o todas, si se cancela quien espera) se cancela
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado de los backends y del hedging"""
+        return {
+            "backends": [backend.stats() for backend in self.backends],
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
+
+
+def build_router() -> Router:
+    """Crea el router con los backends de `LLM_BACKENDS` o el backend de OpenAI configurado"""
+    configs = settings.llm_backends or [
+        {
+            "name": "default",
+            "base_url": settings.openai_base_url,
+            "model": settings.openai_model,
+            "max_concurrency": settings.openai_max_concurrency,
+        }
+    ]
+    backends = [
+        Backend(
+            name=config.get("name", f"backend-{index}"),
+            model=config.get("model", settings.openai_model),
+            base_url=config.get("base_url"),
+            api_key=config.get("api_key") or settings.openai_api_key,
+            weight=float(config.get("weight", 1)),
+            max_concurrency=int(config.get("max_concurrency", settings.openai_max_concurrency)),
+            cheap=bool(config.get("cheap", False)),
+            alpha=settings.llm_router_ewma_alpha,
+        )
+        for index, config in enumerate(configs)
+    ]
+    return Router(
+        backends,
+        hedge_delay=settings.llm_hedge_delay,
+        cheap_routing=settings.llm_cheap_routing,
+        cheap_max_words=settings.llm_cheap_max_words,
+    )
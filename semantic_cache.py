@@ -0,0 +1,316 @@
+"""
+Caché de historias para solicitudes con sugerencias casi idénticas: las sugerencias
+se normalizan (minúsculas, sin acentos ni puntuación), se dividen en trigramas de
+caracteres y se indexan con MinHash y LSH por bandas; los candidatos se confirman
+con la similitud de Jaccard exacta
+"""
+
+# Python imports.
+import re
+import sys
+import time
+import hashlib
+import logging
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Tuple, Union
+
+# Project imports.
+from models import StoryRequest
+from cache import decode_entry, encode_entry, make_request_key
+from config import settings
+
+# Configuración de logging.
+logger = logging.getLogger(__name__)
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas, sin acentos ni diacríticos, sin puntuación y con espacios simples"""
+    folded = text.casefold()
+    if not folded.isascii():
+        folded = unicodedata.normalize("NFKD", folded)
+        folded = "".join(char for char in folded if not unicodedata.combining(char))
+    return " ".join(_NON_WORD.sub(" ", folded).split())
+
+
+def shingles(normalized: str, size: int = 3) -> FrozenSet[str]:
+    """Trigramas de caracteres del texto normalizado, incluidos los bordes de palabra"""
+    padded = f" {normalized} "
+    if len(padded) <= size:
+        return frozenset((padded,))
+    return frozenset(padded[i:i + size] for i in range(len(padded) - size + 1))
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """Similitud de Jaccard entre dos conjuntos de trigramas"""
+    if not a and not b:
+        return 1.0
+    common = len(a & b)
+    return common / (len(a) + len(b) - common)
+
+
+class MinHasher:
+    """
+    Firma MinHash de una sola permutación: cada trigrama se resume en un hash de 64
+    bits cuyos bits bajos eligen una de las `num_perm` posiciones y el resto es el
+    valor, y cada posición guarda el mínimo. Las posiciones vacías toman el valor de la
+    siguiente ocupada (densificación por rotación) para que la firma sirva para LSH.
+    Cuesta un hash por trigrama en lugar de `num_perm`.
+    """
+
+    # Trigramas distintos cuyo hash se recuerda (el alfabeto los limita)
+    MAX_CACHED_HASHES = 1 << 16
+
+    def __init__(self, num_perm: int = 32):
+        if num_perm & (num_perm - 1):
+            raise ValueError("num_perm debe ser potencia de 2")
+        self.num_perm = num_perm
+        self._mask = num_perm - 1
+        self._shift = num_perm.bit_length() - 1
+        # Desplazamiento que distingue los valores prestados según la distancia
+        self._offset = 1 << (64 - self._shift)
+        self._hashes: Dict[str, int] = {}
+
+    def _hash(self, item: str) -> int:
+        value = self._hashes.get(item)
+        if value is None:
+            if len(self._hashes) >= self.MAX_CACHED_HASHES:
+                self._hashes.clear()
+            digest = hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest()
+            value = self._hashes[item] = int.from_bytes(digest, "little")
+        return value
+
+    def signature(self, items: FrozenSet[str]) -> Tuple[int, ...]:
+        size, mask, shift = self.num_perm, self._mask, self._shift
+        empty = 1 << 64
+        bins = [empty] * size
+        for item in items:
+            value = self._hash(item)
+            position = value & mask
+            value >>= shift
+            if value < bins[position]:
+                bins[position] = value
+        if empty in bins:
+            original = bins[:]
+            following = None
+            # Dos vueltas de derecha a izquierda: la primera encuentra la siguiente ocupada
+            for index in range(2 * size - 1, -1, -1):
+                position = index % size
+                if original[position] != empty:
+                    following = position
+                elif index < size and following is not None:
+                    distance = (following - position) % size
+                    bins[position] = original[following] + distance * self._offset
+        return tuple(bins)
+
+
+# (scope, texto normalizado, historia, instante de expiración, bytes)
+_Entry = Tuple[str, str, str, float, int]
+
+
+class NearDuplicateIndex:
+    """
+    Índice LSH acotado de textos casi idénticos. La firma MinHash se parte en `bands`
+    bandas y dos textos son candidatos si coinciden en alguna; los candidatos se
+    confirman con la similitud de Jaccard exacta de sus trigramas. Solo se comparan
+    textos del mismo `scope`. Las entradas se expulsan por antigüedad de uso (LRU)
+    al superar `max_entries` o `max_bytes`, y expiran tras su TTL.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.85,
+        num_perm: int = 32,
+        bands: int = 8,
+        max_entries: int = 10000,
+        max_bytes: int = 50 * 1024 * 1024,
+        max_candidates: int = 64,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm debe ser múltiplo de bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_candidates = max_candidates
+        self.hasher = MinHasher(num_perm)
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        # Clave de banda -> id de entrada, o lista de ids si hay varias (ahorra memoria)
+        self._buckets: Dict[int, Union[int, List[int]]] = {}
+        self._next_id = 0
+        self._bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _band_keys(self, scope: str, items: FrozenSet[str]) -> List[int]:
+        signature = self.hasher.signature(items)
+        rows = self.rows
+        return [
+            hash((scope, band, signature[band * rows:(band + 1) * rows]))
+            for band in range(self.bands)
+        ]
+
+    def _candidates(self, keys: List[int]) -> Iterator[int]:
+        seen = set()
+        for key in keys:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                continue
+            for entry_id in bucket if isinstance(bucket, list) else (bucket,):
+                if entry_id in seen:
+                    continue
+                if len(seen) >= self.max_candidates:
+                    return
+                seen.add(entry_id)
+                yield entry_id
+
+    def lookup(self, scope: str, text: str) -> Optional[Tuple[str, float]]:
+        """Historia del texto más parecido del mismo scope y su similitud, si supera el umbral"""
+        items = shingles(normalize_text(text))
+        now = time.monotonic()
+        best: Optional[Tuple[int, float]] = None
+        expired = []
+        for entry_id in self._candidates(self._band_keys(scope, items)):
+            entry_scope, normalized, _, expires_at, _ = self._entries[entry_id]
+            if entry_scope != scope:
+                continue
+            if expires_at <= now:
+                expired.append(entry_id)
+                continue
+            similarity = jaccard(items, shingles(normalized))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (entry_id, similarity)
+        for entry_id in expired:
+            self._remove(entry_id)
+            self.expirations += 1
+        if best is None:
+            return None
+        self._entries.move_to_end(best[0])
+        return self._entries[best[0]][2], best[1]
+
+    def add(self, scope: str, text: str, value: str, ttl: float) -> None:
+        """Indexa el texto con su historia y expulsa las entradas menos usadas si hace falta"""
+        normalized = normalize_text(text)
+        size = len(normalized) + len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        entry_id = self._next_id
+        self._next_id += 1
+        # Las entradas del mismo scope comparten el objeto de la clave
+        scope = sys.intern(scope)
+        self._entries[entry_id] = (scope, normalized, value, time.monotonic() + ttl, size)
+        self._bytes += size
+        for key in self._band_keys(scope, shingles(normalized)):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                self._buckets[key] = entry_id
+            elif isinstance(bucket, list):
+                bucket.append(entry_id)
+            else:
+                self._buckets[key] = [bucket, entry_id]
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, entry_id: int) -> None:
+        """Elimina una entrada del índice; las claves de banda se recalculan del texto"""
+        scope, normalized, _, _, size = self._entries.pop(entry_id)
+        self._bytes -= size
+        for key in self._band_keys(scope, shingles(normalized)):
+            bucket = self._buckets.get(key)
+            if isinstance(bucket, list):
+                bucket.remove(entry_id)
+                if len(bucket) == 1:
+                    self._buckets[key] = bucket[0]
+            elif bucket == entry_id:
+                del self._buckets[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "buckets": len(self._buckets),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+def make_scope_key(request: StoryRequest, prompt_version: Optional[str] = None) -> str:
+    """
+    Clave de la solicitud sin las sugerencias: género, categoría, creatividad y
+    longitud, más el modelo y la versión de las plantillas, como en la caché exacta
+    """
+    return make_request_key(request.model_copy(update={"suggestions": None}), prompt_version)
+
+
+class SemanticStoryCache:
+    """Caché de historias para solicitudes con sugerencias, por similitud de las sugerencias"""
+
+    def __init__(self, index: NearDuplicateIndex, ttl: float = 3600):
+        self.index = index
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def handles(request: StoryRequest) -> bool:
+        """Solo las solicitudes con sugerencias; las demás usan la caché exacta"""
+        return bool(request.suggestions and request.suggestions.strip())
+
+    def get(self, request: StoryRequest) -> Optional[Tuple[str, str, str, float]]:
+        """
+        Historia de una solicitud casi idéntica, el modelo y la versión de las plantillas
+        que la generaron y la similitud de sus sugerencias
+        """
+        if not self.handles(request):
+            return None
+        match = self.index.lookup(make_scope_key(request), request.suggestions)
+        if match is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        value, similarity = match
+        story, model, prompt_version = decode_entry(value)
+        return story, model, prompt_version, similarity
+
+    def set(self, request: StoryRequest, story: str, model: str, prompt_version: str) -> None:
+        """Indexa la historia generada para las sugerencias de la solicitud"""
+        if self.handles(request):
+            self.index.add(
+                make_scope_key(request, prompt_version),
+                request.suggestions,
+                encode_entry(story, model, prompt_version),
+                self.ttl,
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de aciertos, fallos y ocupación del índice"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            **self.index.stats(),
+        }
+
+
+def build_semantic_cache() -> Optional[SemanticStoryCache]:
+    """Crea la caché según la configuración, o None si está desactivada"""
+    if not settings.semantic_cache_enabled:
+        return None
+    index = NearDuplicateIndex(
+        threshold=settings.semantic_cache_threshold,
+        max_entries=settings.semantic_cache_max_entries,
+        max_bytes=settings.semantic_cache_max_bytes,
+    )
+    return SemanticStoryCache(index, ttl=settings.cache_ttl_seconds)
+
+
+# Instancia global de la caché semántica (None si SEMANTIC_CACHE_ENABLED=false)
+semantic_cache = build_semantic_cache()
@@ -0,0 +1,206 @@
+"""
+Punto de entrada de producción: `python server.py`.
+
+Carga la aplicación una sola vez en el proceso maestro (módulos, configuración y
+plantillas) y crea `WORKERS` procesos con fork que comparten el socket; cada worker
+tiene su propio event loop, su cliente del LLM y el estado que no está en el backend
+compartido (ver `shared_state.py`). El maestro vuelve a crear los workers que terminan
+de forma inesperada.
+
+Apagado ordenado: con SIGTERM o SIGINT, cada worker deja de estar listo y responde 503
+a las solicitudes nuevas, espera `SHUTDOWN_DRAIN_DELAY` segundos para que el
+balanceador lo retire, cierra el socket y deja terminar las solicitudes y los trabajos
+en curso hasta `SHUTDOWN_TIMEOUT` segundos. Una segunda señal fuerza la salida.
+"""
+
+# Python imports.
+import os
+import sys
+import time
+import signal
+import socket
+import logging
+import multiprocessing
+from typing import Dict, List, Optional
+import uvicorn
+
+# Project imports.
+from config import settings
+from health import drain_state
+from shared_state import local_state
+
+# Configuración de logging.
+logger = logging.getLogger(__name__)
+
+# Margen para el arranque y el cierre de cada worker además de los plazos configurados
+_SHUTDOWN_MARGIN = 10.0
+# Segundos mínimos entre dos arranques del mismo worker si termina de forma inesperada
+_RESTART_BACKOFF = 1.0
+
+
+class DrainingServer(uvicorn.Server):
+    """
+    Servidor uvicorn cuya primera señal de apagado activa el drenaje y retrasa
+    `SHUTDOWN_DRAIN_DELAY` el cierre del socket. uvicorn espera después a las
+    conexiones abiertas hasta `timeout_graceful_shutdown`.
+    """
+
+    def __init__(self, config: uvicorn.Config, parent_pid: Optional[int] = None):
+        super().__init__(config)
+        self.parent_pid = parent_pid
+
+    def handle_exit(self, sig: int, frame) -> None:
+        if drain_state.draining:
+            # Segunda señal: salir sin esperar a las solicitudes en curso
+            self.should_exit = True
+            self.force_exit = True
+        else:
+            drain_state.start()
+
+    async def on_tick(self, counter: int) -> bool:
+        # Si el maestro desaparece, el worker se apaga igual que con una señal
+        if self.parent_pid is not None and os.getppid() != self.parent_pid:
+            drain_state.start()
+        if drain_state.draining and not self.should_exit:
+            waited = time.monotonic() - drain_state.started_at
+            self.should_exit = waited >= settings.shutdown_drain_delay
+        return await super().on_tick(counter)
+
+
+def build_config(app) -> uvicorn.Config:
+    """Configuración de uvicorn común a todos los workers"""
+    return uvicorn.Config(
+        app,
+        host=settings.host,
+        port=settings.port,
+        lifespan="on",
+        timeout_graceful_shutdown=settings.shutdown_timeout,
+        # Los registros de uvicorn pasan por el logging de la aplicación, que ya
+        # emite un evento por solicitud
+        log_config=None,
+        access_log=False,
+    )
+
+
+def _run_worker(config: uvicorn.Config, sock: socket.socket, parent_pid: int) -> None:
+    # Grupo de procesos propio: Ctrl+C en la terminal solo llega al maestro, que
+    # reenvía una única señal a cada worker
+    os.setpgrp()
+    DrainingServer(config, parent_pid).run(sockets=[sock])
+
+
+class WorkerSupervisor:
+    """Crea los workers, los repone si terminan y coordina su apagado"""
+
+    def __init__(self, config: uvicorn.Config, workers: int):
+        self.config = config
+        self.workers = workers
+        self.sock: Optional[socket.socket] = None
+        self.processes: Dict[int, multiprocessing.Process] = {}
+        self.started_at: Dict[int, float] = {}
+        self._signals: List[int] = []
+        # fork: los workers heredan la aplicación ya cargada en el maestro
+        self._context = multiprocessing.get_context("fork")
+
+    def _spawn(self, slot: int) -> None:
+        process = self._context.Process(
+            target=_run_worker,
+            args=(self.config, self.sock, os.getpid()),
+            name=f"worker-{slot}",
+        )
+        process.start()
+        self.processes[slot] = process
+        self.started_at[slot] = time.monotonic()
+
+    def _on_signal(self, sig: int, frame) -> None:
+        self._signals.append(sig)
+
+    def run(self) -> int:
+        """Sirve hasta recibir una señal de apagado y devuelve el código de salida"""
+        self.sock = self.config.bind_socket()
+        previous = {
+            sig: signal.signal(sig, self._on_signal) for sig in (signal.SIGINT, signal.SIGTERM)
+        }
+        try:
+            for slot in range(self.workers):
+                self._spawn(slot)
+            logger.info(
+                "%s workers atendiendo en %s:%s", self.workers, settings.host, settings.port
+            )
+            while not self._signals:
+                self._reap()
+                time.sleep(0.1)
+            return self._shutdown()
+        finally:
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+
+    def _reap(self) -> None:
+        """Vuelve a crear los workers que terminaron sin que se pidiera el apagado"""
+        for slot, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+            if time.monotonic() - self.started_at[slot] < _RESTART_BACKOFF:
+                continue
+            logger.warning(
+                "El worker %s (pid %s) terminó con código %s; se vuelve a crear",
+                slot, process.pid, process.exitcode,
+            )
+            self._spawn(slot)
+
+    def _shutdown(self) -> int:
+        """Propaga el apagado a los workers y espera a que terminen dentro del plazo"""
+        logger.info("Apagando %s workers", len(self.processes))
+        # Los workers conservan su copia del socket mientras drenan
+        self.sock.close()
+        for process in self.processes.values():
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+        deadline = (
+            time.monotonic()
+            + settings.shutdown_drain_delay
+            + settings.shutdown_timeout
+            + _SHUTDOWN_MARGIN
+        )
+        forwarded = 1
+        for process in self.processes.values():
+            while process.is_alive() and time.monotonic() < deadline:
+                # Una nueva señal al maestro fuerza la salida de los workers
+                if len(self._signals) > forwarded:
+                    forwarded = len(self._signals)
+                    for other in self.processes.values():
+                        if other.is_alive():
+                            os.kill(other.pid, signal.SIGTERM)
+                process.join(0.1)
+        exit_code = 0
+        for slot, process in self.processes.items():
+            if process.is_alive():
+                logger.error("El worker %s no terminó a tiempo; se detiene", slot)
+                process.kill()
+                process.join()
+                exit_code = 1
+        return exit_code
+
+
+def main(workers: Optional[int] = None) -> int:
+    """Arranca el servidor con `workers` procesos (por defecto `WORKERS`)"""
+    workers = workers or settings.workers
+    # Precarga: importar la aplicación aquí hace que los workers la hereden ya cargada
+    from main import app
+
+    config = build_config(app)
+    if workers == 1:
+        DrainingServer(config).run()
+        return 0
+    local = local_state()
+    if local:
+        logger.warning(
+            "Con %s workers, el estado de %s es propio de cada proceso "
+            "(SHARED_STATE_BACKEND=redis lo comparte)",
+            workers, ", ".join(local),
+        )
+    return WorkerSupervisor(config, workers).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
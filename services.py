@@ -1,88 +1,416 @@
 """Servicios para la API"""
 
 # Python imports.
-import openai
+import time
+import asyncio
 import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 # Project imports.
 from models import StoryRequest
 from prompt_manager import prompt_manager
 from config import settings
+from router import Router, build_router
+from resilience import (
+    ServiceUnavailableError,
+    llm_caller,
+    retry_after_seconds,
+    retryable_errors,
+)
+from token_budget import token_budget
+from metrics import ERRORS, LLM_CALLS_IN_FLIGHT, observe_stage, record_usage
+from structured_logging import annotate
 
 # Configuración de logging.
 logger = logging.getLogger(__name__)
 
+# Router de backends compartido por todo el proceso y límite de concurrencia.
+_router: Optional[Router] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+async def init_llm_client() -> None:
+    """Crea los clientes de los backends del LLM (se llama al arrancar la app)"""
+    global _router, _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(settings.openai_max_concurrency)
+    # Sin API key no se crean los clientes; generate_story_with_llm informará el error
+    if _router is None:
+        try:
+            settings.validate_openai_config()
+        except ValueError:
+            return
+        _router = build_router()
+        _router.open()
+
+
+async def close_llm_client() -> None:
+    """Cierra los clientes y sus pools de conexiones (se llama al apagar la app)"""
+    global _router, _semaphore
+    if _router is not None:
+        await _router.close()
+    _router = None
+    _semaphore = None
+
+
+async def get_llm_router() -> Router:
+    """Devuelve el router compartido, creándolo si la app no lo inicializó"""
+    if _router is None:
+        await init_llm_client()
+    return _router
+
+
+def current_llm_router() -> Optional[Router]:
+    """Router compartido si ya está inicializado, sin crearlo"""
+    return _router
+
+
+def get_router_stats() -> Optional[Dict[str, Any]]:
+    """Estado de los backends, o None si el router no está inicializado"""
+    return _router.stats() if _router is not None else None
+
+
+def _build_messages(prompt: str) -> List[Dict[str, str]]:
+    """Construye los mensajes de chat para el prompt dado"""
+    return [
+        {
+            "role": "system",
+            "content": (
+                "Eres un escritor creativo experto en narrativa. "
+                "Responde solo con la historia solicitada, sin "
+                "introducciones ni explicaciones adicionales."
+            ),
+        },
+        {"role": "user", "content": prompt},
+    ]
+
+
+def completion_params() -> Dict[str, object]:
+    """Parámetros de muestreo comunes a todas las llamadas al LLM"""
+    return {
+        "model": settings.openai_model,
+        "max_tokens": settings.openai_max_tokens,
+        "temperature": settings.openai_temperature,
+        "top_p": 0.9,
+        "frequency_penalty": 0.1,
+        "presence_penalty": 0.1,
+    }
+
+
+def _llm_error(error: Exception) -> Exception:
+    """Traduce una excepción del LLM a un error con mensaje para el cliente"""
+    ERRORS.labels(type(error).__name__).inc()
+    if isinstance(error, ServiceUnavailableError):
+        logger.error("Servicio de OpenAI no disponible: %s", error)
+        return error
+
+    # Importación diferida del SDK (ya cargado por el router si hubo llamadas)
+    import openai
+
+    if isinstance(error, openai.AuthenticationError):
+        logger.error("Error de autenticación con OpenAI - Verifica tu API key")
+        return Exception("Error de autenticación con OpenAI. Verifica tu API key.")
+
+    if isinstance(error, openai.RateLimitError):
+        logger.error("Límite de velocidad excedido en OpenAI")
+        return ServiceUnavailableError(
+            "Límite de velocidad excedido. Intenta de nuevo en unos momentos.",
+            retry_after=retry_after_seconds(error),
+        )
+
+    if isinstance(error, retryable_errors()):
+        # Errores transitorios que agotaron los reintentos
+        logger.error("Error transitorio de OpenAI tras reintentar: %s", error)
+        return ServiceUnavailableError(
+            f"Error en el servicio de OpenAI: {str(error)}",
+            retry_after=retry_after_seconds(error),
+        )
+
+    if isinstance(error, openai.APIError):
+        logger.error("Error de API de OpenAI: %s", error)
+        return Exception(f"Error en el servicio de OpenAI: {str(error)}")
+
+    logger.error("Error inesperado al generar historia: %s", error)
+    return Exception(f"Error inesperado al generar la historia: {str(error)}")
+
+
+_CONTINUE_INSTRUCTION = (
+    "Continúa la historia exactamente donde se quedó, sin repetir texto ni añadir introducciones."
+)
+# Caracteres finales de la historia que recibe una continuación en streaming
+_STREAM_CONTEXT_CHARS = 8000
+
+
+def _continuation_messages(
+    prompt: str, partial: str, instruction: str = _CONTINUE_INSTRUCTION
+) -> List[Dict[str, str]]:
+    """Mensajes para continuar (o corregir) una historia ya escrita total o parcialmente"""
+    return _build_messages(prompt) + [
+        {"role": "assistant", "content": partial},
+        {"role": "user", "content": instruction},
+    ]
+
+
+def _remaining_tokens(request: StoryRequest, words: int) -> int:
+    """Presupuesto de una continuación según las palabras que faltan"""
+    return token_budget.max_tokens_for(max(0, request.word_count - words))
+
+
+class _StreamTail:
+    """
+    Lo que una continuación en streaming necesita del texto ya emitido: el número de
+    palabras y los últimos `size` caracteres, sin retener la historia completa
+    """
+
+    def __init__(self, size: Optional[int] = None):
+        self.size = size or _STREAM_CONTEXT_CHARS
+        self.words = 0
+        self._text = ""
+        self._trimmed = False
+        self._in_word = False
+
+    def feed(self, text: str) -> None:
+        words = len(text.split())
+        # Una palabra cortada entre dos fragmentos se cuenta una sola vez
+        if words and self._in_word and not text[0].isspace():
+            words -= 1
+        self.words += words
+        self._in_word = not text[-1].isspace()
+        self._text += text
+        if len(self._text) > 2 * self.size:
+            self._text = self._text[-self.size:]
+            self._trimmed = True
+
+    @property
+    def empty(self) -> bool:
+        return not self._text
+
+    @property
+    def text(self) -> str:
+        """Final de la historia, empezando en una palabra completa si se recortó"""
+        if len(self._text) <= self.size and not self._trimmed:
+            return self._text
+        tail = self._text[-self.size:]
+        return tail[tail.find(" ") + 1:] if " " in tail else tail
+
+
+async def _complete(
+    router: Router, request: StoryRequest, messages: List[Dict[str, str]], max_tokens: int
+):
+    """Una llamada al LLM con reintentos, límite de concurrencia y métricas"""
+
+    async def attempt(timeout: float):
+        # Llamar a OpenAI sin bloquear el event loop, respetando el límite de concurrencia
+        queued_at = time.perf_counter()
+        async with _semaphore:
+            started = time.perf_counter()
+            observe_stage("queue", request, started - queued_at)
+            LLM_CALLS_IN_FLIGHT.labels().inc()
+            try:
+                # El router elige el backend (y su modelo) y aplica el hedging
+                response, backend = await router.complete(
+                    request,
+                    messages=messages,
+                    timeout=timeout,
+                    **{**completion_params(), "max_tokens": max_tokens},
+                )
+            finally:
+                LLM_CALLS_IN_FLIGHT.labels().dec()
+            observe_stage(
+                "completion", request, time.perf_counter() - started, model=backend.model
+            )
+            return response, backend
+
+    response, backend = await llm_caller.call(attempt)
+    record_usage(response.usage, backend.model)
+    return response, backend
+
 
 # Genera una historia usando OpenAI GPT-4o-mini con prompts dinámicos.
-async def generate_story_with_llm(request: StoryRequest) -> str:
+async def generate_story_with_llm(request: StoryRequest) -> Tuple[str, str, str]:
     """
-    Genera una historia usando OpenAI GPT-4o-mini con prompts dinámicos
+    Genera una historia usando OpenAI GPT-4o-mini con prompts dinámicos y devuelve la
+    historia, el modelo del backend que la generó y la versión de las plantillas del prompt.
+    `max_tokens` se calcula a partir de `word_count`; si la respuesta se corta
+    (`finish_reason == "length"`) se pide que continúe, hasta `LLM_MAX_CONTINUATIONS` veces.
     """
     try:
         # Validar configuración de OpenAI
         settings.validate_openai_config()
 
-        # Configurar OpenAI client (solo cuando se necesita)
-        client = openai.OpenAI(api_key=settings.openai_api_key)
+        # Obtener el router compartido (creado al arrancar la app)
+        router = await get_llm_router()
 
         # Generar el prompt usando el gestor de plantillas
-        prompt = prompt_manager.generate_prompt(request)
+        build_started = time.perf_counter()
+        prompt, prompt_version = prompt_manager.render_prompt(request)
+        observe_stage("prompt_build", request, time.perf_counter() - build_started)
+
+        messages = _build_messages(prompt)
+        max_tokens = token_budget.max_tokens_for(request.word_count)
+        annotate(max_tokens=max_tokens)
+
+        story = ""
+        completion_tokens: Optional[int] = 0
+        for continuation in range(settings.llm_max_continuations + 1):
+            response, backend = await _complete(router, request, messages, max_tokens)
+
+            # Extraer la historia de la respuesta
+            choice = response.choices[0]
+            if choice.message.content is None:
+                raise Exception("OpenAI no generó contenido en la respuesta")
+            story += choice.message.content
+            if response.usage is None or completion_tokens is None:
+                completion_tokens = None
+            else:
+                completion_tokens += response.usage.completion_tokens
+
+            if choice.finish_reason != "length":
+                break
+            if continuation == settings.llm_max_continuations:
+                logger.warning("Historia cortada por max_tokens tras agotar las continuaciones")
+                break
+            messages = _continuation_messages(prompt, story)
+            max_tokens = _remaining_tokens(request, len(story.split()))
 
-        # Logging específico de los parámetros
-        logger.info("PARÁMETROS DEL REQUEST:")
-        logger.info(f"  - word_count: {request.word_count}")
-        logger.info(f"  - creativity_level: {request.creativity_level}")
-        logger.info(f"  - genre: {request.genre}")
-        logger.info(f"  - category: {request.category}")
-        logger.info(f"  - suggestions: {request.suggestions or 'Ninguna'}")
-        logger.info("=" * 80)
-
-        # Llamar a OpenAI usando la nueva sintaxis
-        response = client.chat.completions.create(
-            model=settings.openai_model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "Eres un escritor creativo experto en narrativa. "
-                        "Responde solo con la historia solicitada, sin "
-                        "introducciones ni explicaciones adicionales."
-                    ),
-                },
-                {"role": "user", "content": prompt},
-            ],
-            max_tokens=settings.openai_max_tokens,
-            temperature=settings.openai_temperature,
-            top_p=0.9,
-            frequency_penalty=0.1,
-            presence_penalty=0.1,
+        story = story.strip()
+        words = len(story.split())
+        # Solo las historias completas reflejan la proporción real de tokens por palabra
+        if choice.finish_reason == "stop" and completion_tokens:
+            token_budget.observe(words, completion_tokens)
+        annotate(
+            words=words,
+            model=backend.model,
+            finish_reason=choice.finish_reason,
+            continuations=continuation,
         )
 
-        # Extraer la historia de la respuesta
+        return story, backend.model, prompt_version
+
+    except Exception as e:
+        raise _llm_error(e)
+
+
+async def revise_story_with_llm(
+    request: StoryRequest, story: str, instruction: str, max_tokens: int
+) -> str:
+    """
+    Pide al LLM un cambio concreto sobre una historia ya generada (continuarla o
+    reescribirla) con la conversación original como contexto, y devuelve el texto nuevo
+    """
+    try:
+        settings.validate_openai_config()
+        router = await get_llm_router()
+        prompt = prompt_manager.generate_prompt(request)
+        messages = _continuation_messages(prompt, story, instruction)
+        response, _ = await _complete(router, request, messages, max_tokens)
         content = response.choices[0].message.content
         if content is None:
             raise Exception("OpenAI no generó contenido en la respuesta")
+        return content.strip()
 
-        story = content.strip()
+    except Exception as e:
+        raise _llm_error(e)
 
-        logger.info(f"Historia generada exitosamente con {len(story.split())} palabras")
 
-        return story
+# Genera una historia en streaming, entregando los fragmentos según llegan.
+async def stream_story_with_llm(request: StoryRequest) -> AsyncIterator[Tuple[str, str, str]]:
+    """
+    Genera una historia en streaming y devuelve cada fragmento de texto según llega,
+    junto con el modelo del backend que lo generó y la versión de las plantillas del
+    prompt. Si el stream se corta por `max_tokens` se abre otro que continúa la
+    historia, igual que en `generate_story_with_llm`, pero con solo el final del texto
+    ya emitido como contexto: la historia completa no se retiene en memoria.
+    """
+    try:
+        settings.validate_openai_config()
+        router = await get_llm_router()
 
-    except openai.AuthenticationError:
-        logger.error("Error de autenticación con OpenAI - Verifica tu API key")
-        raise Exception("Error de autenticación con OpenAI. Verifica tu API key.")
+        build_started = time.perf_counter()
+        prompt, prompt_version = prompt_manager.render_prompt(request)
+        observe_stage("prompt_build", request, time.perf_counter() - build_started)
 
-    except openai.RateLimitError:
-        logger.error("Límite de velocidad excedido en OpenAI")
-        raise Exception(
-            "Límite de velocidad excedido. Intenta de nuevo en unos momentos."
-        )
+        messages = _build_messages(prompt)
+        max_tokens = token_budget.max_tokens_for(request.word_count)
+        annotate(max_tokens=max_tokens)
+
+        queued_at = time.perf_counter()
+        async with _semaphore:
+            started = time.perf_counter()
+            observe_stage("queue", request, started - queued_at)
+            LLM_CALLS_IN_FLIGHT.labels().inc()
+            try:
+                # Las continuaciones necesitan el final del texto ya emitido
+                emitted = _StreamTail()
+                completion_tokens: Optional[int] = 0
+                for continuation in range(settings.llm_max_continuations + 1):
+
+                    async def open_stream(timeout: float):
+                        # Cada reintento vuelve a elegir backend
+                        backend = router.pick(request)
+                        stream = await backend.open_stream(
+                            messages=messages,
+                            stream_options={"include_usage": True},
+                            timeout=timeout,
+                            **{**completion_params(), "max_tokens": max_tokens},
+                        )
+                        return stream, backend
+
+                    # Solo se reintenta el establecimiento del stream, no su lectura
+                    stream, backend = await llm_caller.call(open_stream)
+                    finish_reason = None
+                    usage = None
+                    try:
+                        async with stream:
+                            async for chunk in stream:
+                                if chunk.usage is not None:
+                                    usage = chunk.usage
+                                    record_usage(usage, backend.model)
+                                if not chunk.choices:
+                                    continue
+                                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                                text = chunk.choices[0].delta.content
+                                if text:
+                                    if emitted.empty:
+                                        observe_stage(
+                                            "ttft",
+                                            request,
+                                            time.perf_counter() - started,
+                                            model=backend.model,
+                                        )
+                                    emitted.feed(text)
+                                    yield text, backend.model, prompt_version
+                    finally:
+                        backend.release()
+                    if usage is None or completion_tokens is None:
+                        completion_tokens = None
+                    else:
+                        completion_tokens += usage.completion_tokens
+
+                    if finish_reason != "length":
+                        break
+                    if continuation == settings.llm_max_continuations:
+                        logger.warning(
+                            "Historia cortada por max_tokens tras agotar las continuaciones"
+                        )
+                        break
+                    messages = _continuation_messages(prompt, emitted.text)
+                    max_tokens = _remaining_tokens(request, emitted.words)
 
-    except openai.APIError as e:
-        logger.error(f"Error de API de OpenAI: {e}")
-        raise Exception(f"Error en el servicio de OpenAI: {str(e)}")
+                observe_stage(
+                    "completion", request, time.perf_counter() - started, model=backend.model
+                )
+                words = emitted.words
+                if finish_reason == "stop" and completion_tokens:
+                    token_budget.observe(words, completion_tokens)
+                annotate(
+                    words=words,
+                    model=backend.model,
+                    finish_reason=finish_reason,
+                    continuations=continuation,
+                )
+            finally:
+                LLM_CALLS_IN_FLIGHT.labels().dec()
 
     except Exception as e:
-        logger.error(f"Error inesperado al generar historia: {e}")
-        raise Exception(f"Error inesperado al generar la historia: {str(e)}")
+        raise _llm_error(e)
@@ -0,0 +1,68 @@
+"""
+Estado compartido entre workers. La caché, los límites de solicitudes y los trabajos
+guardan su estado en memoria del proceso o en un almacén clave-valor externo con la
+interfaz de `redis.asyncio`; aquí se resuelve qué backend usa cada componente
+(el suyo propio o `SHARED_STATE_BACKEND`) y se crea su cliente.
+"""
+
+# Python imports.
+import logging
+from typing import Any, List, Optional, Tuple
+
+# Project imports.
+from config import settings
+
+# Configuración de logging.
+logger = logging.getLogger(__name__)
+
+# Componentes con backend configurable (prefijo de sus variables de entorno)
+COMPONENTS = ("cache", "jobs", "rate_limit")
+
+
+def state_backend(component: str) -> Tuple[str, str]:
+    """Backend y URL del componente: su propia configuración o la compartida"""
+    backend = getattr(settings, f"{component}_backend") or settings.shared_state_backend
+    url = getattr(settings, f"{component}_redis_url") or settings.shared_state_redis_url
+    return backend, url
+
+
+def state_client(component: str) -> Optional[Any]:
+    """
+    Cliente del almacén externo del componente, o None si guarda el estado en memoria.
+    El cliente no abre conexiones hasta el primer uso, así que puede crearse antes de
+    que el servidor cree los workers.
+    """
+    backend, url = state_backend(component)
+    if backend == "memory":
+        return None
+    # Dependencia opcional: solo se importa si se usa
+    try:
+        import redis.asyncio as redis
+    except ImportError:
+        raise ImportError(
+            f"{component.upper()}_BACKEND=redis requiere el paquete 'redis' (pip install redis)"
+        )
+    return redis.from_url(url)
+
+
+def local_state() -> List[str]:
+    """
+    Componentes activos cuyo estado es propio de cada proceso: con varios workers,
+    cada uno tiene su copia (aciertos de caché, límites y trabajos no compartidos)
+    """
+    enabled = {
+        "cache": settings.cache_enabled,
+        "jobs": True,
+        "rate_limit": settings.rate_limit_enabled,
+    }
+    local = [
+        component
+        for component in COMPONENTS
+        if enabled[component] and state_backend(component)[0] == "memory"
+    ]
+    # Sin backend externo: índices en memoria y agrupación de solicitudes por proceso
+    if settings.semantic_cache_enabled:
+        local.append("semantic_cache")
+    if settings.story_pool_enabled:
+        local.append("story_pool")
+    return local
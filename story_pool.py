@@ -0,0 +1,248 @@
+"""Pool de historias pregeneradas con recarga en segundo plano"""
+
+# Python imports.
+import time
+import asyncio
+import logging
+import itertools
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+# Project imports.
+from models import StoryRequest
+from services import generate_story_with_llm
+from postprocess import postprocess_story
+from prompt_manager import prompt_manager
+from config import settings
+
+# Configuración de logging.
+logger = logging.getLogger(__name__)
+
+# (genre, category, creativity_level, word_count del bucket)
+PoolKey = Tuple[str, str, str, int]
+
+
+async def generate_pool_story(request: StoryRequest) -> Optional[Tuple[str, str, str]]:
+    """
+    Genera una historia para el pool con el mismo post-procesado que las generadas bajo
+    demanda. Devuelve None si, tras las correcciones, sigue teniendo contenido no
+    adecuado para la categoría: esa historia no se guarda.
+    """
+    story, model, prompt_version = await generate_story_with_llm(request)
+    story, report = await postprocess_story(request, story)
+    if report.flagged:
+        logger.warning(
+            "Historia del pool descartada por contenido no adecuado: %s", report.flagged
+        )
+        return None
+    return story, model, prompt_version
+
+
+class StoryPool:
+    """
+    Mantiene historias listas por combinación de parámetros.
+    Las combinaciones se registran al recibir solicitudes, y un único worker de baja
+    prioridad las recarga, empezando por las más vacías y a una tasa limitada.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[
+            [StoryRequest], Awaitable[Optional[Tuple[str, str, str]]]
+        ] = generate_pool_story,
+        depth: int = 3,
+        low_watermark: int = 1,
+        refill_rate: float = 0.5,
+        max_age: float = 86400,
+        word_buckets: Optional[List[int]] = None,
+        word_tolerance: float = 0.2,
+        max_keys: int = 100,
+    ):
+        self.generate = generate
+        self.depth = depth
+        self.low_watermark = low_watermark
+        self.refill_rate = refill_rate
+        self.max_age = max_age
+        self.word_buckets = sorted(word_buckets or [100, 300, 500, 1000, 2000])
+        self.word_tolerance = word_tolerance
+        self.max_keys = max_keys
+
+        # Cada entrada: (instante de generación, historia, modelo, versión de plantillas)
+        self._pools: Dict[PoolKey, Deque[Tuple[float, str, str, str]]] = {}
+        self._queue: "asyncio.PriorityQueue[Tuple[int, int, PoolKey]]" = (
+            asyncio.PriorityQueue()
+        )
+        self._queued: Set[PoolKey] = set()
+        self._sequence = itertools.count()
+        self._next_refill_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.refill_errors = 0
+        self.rejected = 0
+        self.stale_dropped = 0
+
+    def key_for(self, request: StoryRequest) -> Optional[PoolKey]:
+        """Clave del pool para la solicitud, o None si no admite historias pregeneradas"""
+        if request.suggestions and request.suggestions.strip():
+            return None
+        bucket = min(self.word_buckets, key=lambda b: abs(b - request.word_count))
+        if abs(bucket - request.word_count) > bucket * self.word_tolerance:
+            return None
+        return (request.genre, request.category, request.creativity_level, bucket)
+
+    def take(self, request: StoryRequest) -> Optional[Tuple[str, str, str]]:
+        """
+        Entrega (y retira) una historia del pool para la solicitud, con su modelo y la
+        versión de las plantillas que la generaron.
+        Cada historia se sirve una sola vez; si el pool queda por debajo del
+        umbral se programa su recarga.
+        """
+        key = self.key_for(request)
+        if key is None:
+            return None
+
+        pool = self._pools.get(key)
+        if pool is None:
+            if len(self._pools) >= self.max_keys:
+                return None
+            pool = self._pools[key] = deque()
+
+        self._drop_stale(pool)
+        entry = pool.popleft()[1:] if pool else None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        if len(pool) < max(self.low_watermark, 1):
+            self._schedule(key)
+        return entry
+
+    def _drop_stale(self, pool: Deque[Tuple[float, str, str, str]]) -> None:
+        """
+        Descarta las historias más antiguas que `max_age` y las generadas con otra
+        versión de las plantillas (tras recargar `prompts.yaml`)
+        """
+        limit = time.monotonic() - self.max_age
+        version = prompt_manager.version
+        fresh = [entry for entry in pool if entry[0] >= limit and entry[3] == version]
+        if len(fresh) < len(pool):
+            self.stale_dropped += len(pool) - len(fresh)
+            pool.clear()
+            pool.extend(fresh)
+
+    def _schedule(self, key: PoolKey) -> None:
+        """Encola la recarga de un pool (los más vacíos tienen prioridad)"""
+        if key in self._queued:
+            return
+        self._queued.add(key)
+        self._queue.put_nowait((len(self._pools[key]), next(self._sequence), key))
+
+    async def start(self) -> None:
+        """Arranca el worker de recarga"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Detiene el worker de recarga"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # La cola queda ligada al event loop que termina; se traslada lo pendiente
+        pending = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        self._queue = asyncio.PriorityQueue()
+        for item in pending:
+            self._queue.put_nowait(item)
+
+    async def _run(self) -> None:
+        """Bucle del worker: atiende la cola de recargas de una en una"""
+        while True:
+            key = None
+            try:
+                _, _, key = await self._queue.get()
+                self._queued.discard(key)
+                await self._refill(key)
+            except Exception as e:
+                # Un fallo inesperado no debe detener al worker
+                self.refill_errors += 1
+                logger.error("Error en el worker del pool %s: %s", key, e)
+
+    async def _refill(self, key: PoolKey) -> None:
+        """Genera historias hasta completar la profundidad configurada del pool"""
+        genre, category, creativity_level, word_count = key
+        request = StoryRequest(
+            word_count=word_count,
+            genre=genre,
+            category=category,
+            creativity_level=creativity_level,
+        )
+        pool = self._pools.setdefault(key, deque())
+        self._drop_stale(pool)
+        while len(pool) < self.depth:
+            await self._throttle()
+            try:
+                entry = await self.generate(request)
+            except Exception as e:
+                self.refill_errors += 1
+                logger.warning("Error al recargar el pool %s: %s", key, e)
+                return
+            if entry is None:
+                # Historia descartada: se reintenta en la próxima recarga de la combinación
+                self.rejected += 1
+                return
+            # La versión es la del prompt: si cambia entretanto, se descarta al servirla
+            pool.append((time.monotonic(), *entry))
+            self.refills += 1
+
+    async def _throttle(self) -> None:
+        """Limita las generaciones de recarga a `refill_rate` por segundo"""
+        now = time.monotonic()
+        wait = self._next_refill_at - now
+        if wait > 0:
+            await asyncio.sleep(wait)
+        self._next_refill_at = max(now, self._next_refill_at) + 1 / self.refill_rate
+
+    def stats(self) -> Dict[str, Any]:
+        """Profundidad, aciertos y actividad de recarga del pool"""
+        now = time.monotonic()
+        oldest = [now - pool[0][0] for pool in self._pools.values() if pool]
+        return {
+            "keys": len(self._pools),
+            "stories": sum(len(pool) for pool in self._pools.values()),
+            "pending_refills": self._queue.qsize(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "refills": self.refills,
+            "refill_errors": self.refill_errors,
+            "rejected": self.rejected,
+            "stale_dropped": self.stale_dropped,
+            "oldest_story_age": round(max(oldest), 1) if oldest else 0.0,
+        }
+
+
+def build_story_pool() -> Optional[StoryPool]:
+    """Crea el pool según la configuración, o None si está desactivado"""
+    if not settings.story_pool_enabled:
+        return None
+    return StoryPool(
+        depth=settings.story_pool_depth,
+        low_watermark=settings.story_pool_low_watermark,
+        refill_rate=settings.story_pool_refill_rate,
+        max_age=settings.story_pool_max_age_seconds,
+        word_buckets=settings.story_pool_word_buckets,
+        word_tolerance=settings.story_pool_word_tolerance,
+        max_keys=settings.story_pool_max_keys,
+    )
+
+
+# Instancia global del pool (None si STORY_POOL_ENABLED=false)
+story_pool = build_story_pool()
@@ -0,0 +1,361 @@
+"""
+Almacén persistente de las historias generadas (SQLite por defecto) con escritura
+diferida por lotes y consulta paginada por cursor
+"""
+
+# Python imports.
+import json
+import time
+import uuid
+import base64
+import sqlite3
+import asyncio
+import logging
+import itertools
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Project imports.
+from models import StoredStory, StoryRequest, StorySummary
+from config import settings
+
+# Configuración de logging.
+logger = logging.getLogger(__name__)
+
+# Fila tal como se inserta: (story_id, created_at, genre, category, creativity_level,
+# word_count, suggestions, story, metadata JSON)
+StoryRow = Tuple[str, float, str, str, str, int, Optional[str], str, str]
+
+# Filtros admitidos por `StoryStore.list`, en el orden de las columnas del índice compuesto
+FILTERS = ("genre", "category", "creativity_level")
+
+
+def encode_cursor(created_at: float, seq: int) -> str:
+    """Cursor opaco con la posición de la última historia de la página"""
+    raw = f"{created_at!r}:{seq}".encode("ascii")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    """Posición codificada en el cursor; ValueError si no es válido"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+        created_at, seq = raw.split(":")
+        return float(created_at), int(seq)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"Cursor inválido: {cursor!r}")
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.utcfromtimestamp(timestamp).isoformat()
+
+
+class StoryStore:
+    """Interfaz del almacenamiento persistente de historias"""
+
+    async def save_many(self, rows: List[StoryRow]) -> None:
+        """Inserta un lote de historias en una sola transacción"""
+        raise NotImplementedError
+
+    async def get(self, story_id: str) -> Optional[StoredStory]:
+        """Obtiene una historia o None si no existe"""
+        raise NotImplementedError
+
+    async def list(
+        self, limit: int, cursor: Optional[str] = None, **filters: Optional[str]
+    ) -> Tuple[List[StorySummary], Optional[str]]:
+        """
+        Historias más recientes primero que cumplen los filtros, a partir del cursor,
+        y el cursor de la página siguiente (None si no hay más)
+        """
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        """Libera los recursos del almacenamiento"""
+
+
+class SQLiteStoryStore(StoryStore):
+    """
+    Almacén en un archivo SQLite. Todas las operaciones se ejecutan en un único hilo
+    propio para no bloquear el event loop. Los índices cubren cada filtro seguido de
+    `created_at`, de modo que la paginación por cursor lee solo las filas de la página
+    en cualquier posición de la tabla.
+    """
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS stories (
+            seq INTEGER PRIMARY KEY,
+            story_id TEXT NOT NULL UNIQUE,
+            created_at REAL NOT NULL,
+            genre TEXT NOT NULL,
+            category TEXT NOT NULL,
+            creativity_level TEXT NOT NULL,
+            word_count INTEGER NOT NULL,
+            suggestions TEXT,
+            story TEXT NOT NULL,
+            metadata TEXT NOT NULL
+        )
+        """,
+        # SQLite añade `seq` (rowid) al final de cada índice, lo que ordena los empates
+        "CREATE INDEX IF NOT EXISTS stories_created ON stories (created_at)",
+        "CREATE INDEX IF NOT EXISTS stories_genre ON stories (genre, created_at)",
+        "CREATE INDEX IF NOT EXISTS stories_category ON stories (category, created_at)",
+        "CREATE INDEX IF NOT EXISTS stories_creativity ON stories (creativity_level, created_at)",
+        "CREATE INDEX IF NOT EXISTS stories_params ON stories "
+        "(genre, category, creativity_level, created_at)",
+    )
+    SUMMARY_COLUMNS = (
+        "seq, story_id, created_at, genre, category, creativity_level, word_count, suggestions"
+    )
+
+    def __init__(self, path: str = "stories.db"):
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def _run(self, function: Callable[..., Any], *args: Any) -> Any:
+        """Ejecuta una operación en el hilo del almacén"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(1, thread_name_prefix="story-store")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, function, *args)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            # Varios workers pueden escribir en el mismo archivo: WAL y espera por el bloqueo
+            connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with connection:
+                for statement in self.SCHEMA:
+                    connection.execute(statement)
+            self._connection = connection
+        return self._connection
+
+    def _save_many(self, rows: List[StoryRow]) -> None:
+        connection = self._connect()
+        with connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO stories (story_id, created_at, genre, category, "
+                "creativity_level, word_count, suggestions, story, metadata) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def _get(self, story_id: str) -> Optional[StoredStory]:
+        row = self._connect().execute(
+            f"SELECT {self.SUMMARY_COLUMNS}, story, metadata FROM stories WHERE story_id = ?",
+            (story_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return StoredStory(
+            **self._summary_fields(row), story=row[8], metadata=json.loads(row[9])
+        )
+
+    @staticmethod
+    def _summary_fields(row: tuple) -> Dict[str, Any]:
+        return {
+            "story_id": row[1],
+            "created_at": _iso(row[2]),
+            "genre": row[3],
+            "category": row[4],
+            "creativity_level": row[5],
+            "word_count": row[6],
+            "suggestions": row[7],
+        }
+
+    def list_query(
+        self, limit: int, after: Optional[Tuple[float, int]], filters: Dict[str, str]
+    ) -> Tuple[str, List[Any]]:
+        """Consulta de una página y sus parámetros (pública para comprobar su plan)"""
+        conditions = [f"{name} = ?" for name in FILTERS if name in filters]
+        params: List[Any] = [filters[name] for name in FILTERS if name in filters]
+        if after is not None:
+            conditions.append("(created_at, seq) < (?, ?)")
+            params.extend(after)
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        query = (
+            f"SELECT {self.SUMMARY_COLUMNS} FROM stories {where}"
+            "ORDER BY created_at DESC, seq DESC LIMIT ?"
+        )
+        return query, params + [limit + 1]
+
+    def _list(
+        self, limit: int, after: Optional[Tuple[float, int]], filters: Dict[str, str]
+    ) -> Tuple[List[StorySummary], Optional[str]]:
+        query, params = self.list_query(limit, after, filters)
+        rows = self._connect().execute(query, params).fetchall()
+        # Se pide una fila de más para saber si hay página siguiente
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = encode_cursor(rows[limit - 1][2], rows[limit - 1][0])
+        return [StorySummary(**self._summary_fields(row)) for row in rows[:limit]], next_cursor
+
+    def _close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    async def save_many(self, rows: List[StoryRow]) -> None:
+        await self._run(self._save_many, rows)
+
+    async def get(self, story_id: str) -> Optional[StoredStory]:
+        return await self._run(self._get, story_id)
+
+    async def list(
+        self, limit: int, cursor: Optional[str] = None, **filters: Optional[str]
+    ) -> Tuple[List[StorySummary], Optional[str]]:
+        after = decode_cursor(cursor) if cursor else None
+        active = {name: value for name, value in filters.items() if value is not None}
+        unknown = set(active) - set(FILTERS)
+        if unknown:
+            raise ValueError(f"Filtros desconocidos: {', '.join(sorted(unknown))}")
+        return await self._run(self._list, limit, after, active)
+
+    async def close(self) -> None:
+        if self._executor is not None:
+            await self._run(self._close)
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+class StoryArchive:
+    """
+    Escritura diferida de las historias generadas: `record` solo añade la historia a un
+    búfer en memoria y un worker en segundo plano la inserta en lotes de `batch_size`,
+    cada `flush_interval` segundos o en cuanto se llena un lote. Si el búfer alcanza
+    `max_pending` (almacén caído o muy lento), las historias nuevas se descartan.
+    """
+
+    def __init__(
+        self,
+        store: StoryStore,
+        batch_size: int = 100,
+        flush_interval: float = 0.5,
+        max_pending: int = 10000,
+    ):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # Historias pendientes de escribir por id, en orden de llegada
+        self._pending: Dict[str, StoryRow] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    def record(self, request: StoryRequest, story: str, metadata: Dict[str, Any]) -> Optional[str]:
+        """Encola la historia para guardarla y devuelve su id (None si se descartó)"""
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return None
+        story_id = uuid.uuid4().hex
+        self._pending[story_id] = (
+            story_id,
+            time.time(),
+            request.genre,
+            request.category,
+            request.creativity_level,
+            request.word_count,
+            request.suggestions,
+            story,
+            json.dumps(metadata, ensure_ascii=False, default=str),
+        )
+        if len(self._pending) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+        return story_id
+
+    async def start(self) -> None:
+        """Arranca el worker de escritura"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Detiene el worker, escribe lo pendiente y cierra el almacén"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self._wakeup = None
+        await self.flush()
+        await self.store.close()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Escribe todas las historias pendientes en lotes"""
+        while self._pending:
+            batch = list(itertools.islice(self._pending.values(), self.batch_size))
+            try:
+                await self.store.save_many(batch)
+                self.written += len(batch)
+                self.batches += 1
+            except Exception as e:
+                # No se reintenta: un almacén caído no debe acumular memoria sin límite
+                self.failed += len(batch)
+                logger.error("Error al guardar %d historias: %s", len(batch), e)
+            # Se retiran después de escribirlas para que `get` las encuentre mientras tanto
+            for row in batch:
+                self._pending.pop(row[0], None)
+
+    async def get(self, story_id: str) -> Optional[StoredStory]:
+        """Historia guardada o pendiente de guardar"""
+        row = self._pending.get(story_id)
+        if row is not None:
+            return StoredStory(
+                story_id=row[0],
+                created_at=_iso(row[1]),
+                genre=row[2],
+                category=row[3],
+                creativity_level=row[4],
+                word_count=row[5],
+                suggestions=row[6],
+                story=row[7],
+                metadata=json.loads(row[8]),
+            )
+        return await self.store.get(story_id)
+
+    async def list(
+        self, limit: int, cursor: Optional[str] = None, **filters: Optional[str]
+    ) -> Tuple[List[StorySummary], Optional[str]]:
+        """Página de historias ya escritas (las pendientes aparecen tras el siguiente lote)"""
+        return await self.store.list(limit, cursor, **filters)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+def build_story_archive() -> Optional[StoryArchive]:
+    """Crea el almacén según la configuración, o None si está desactivado"""
+    if not settings.story_store_enabled:
+        return None
+    return StoryArchive(
+        SQLiteStoryStore(settings.story_store_path),
+        batch_size=settings.story_store_batch_size,
+        flush_interval=settings.story_store_flush_interval,
+        max_pending=settings.story_store_max_pending,
+    )
+
+
+# Instancia global del almacén de historias (None si STORY_STORE_ENABLED=false)
+story_archive = build_story_archive()
@@ -0,0 +1,251 @@
+"""Logging estructurado: un evento por solicitud, formateo diferido y escritura en un hilo"""
+
+# Python imports.
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import atexit
+import random
+import logging
+import contextvars
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+# Project imports.
+from config import settings
+
+# Configuración de logging.
+logger = logging.getLogger(__name__)
+
+# Identificador de la solicitud en curso (se añade a todos los registros)
+request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "request_id", default=None
+)
+# Evento de la solicitud en curso al que se añaden etapas y parámetros
+request_event: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar(
+    "request_event", default=None
+)
+
+# Rutas consultadas con mucha frecuencia por sondas y Prometheus: no generan evento
+QUIET_PATHS = ("/health", "/health/live", "/health/ready", "/metrics")
+
+# Campos estándar de LogRecord, para no repetirlos como campos extra
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def annotate(**fields: Any) -> None:
+    """Añade campos al evento de la solicitud en curso (sin efecto fuera de una solicitud)"""
+    event = request_event.get()
+    if event is not None:
+        event.update(fields)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Acumula la duración de una etapa en el evento de la solicitud en curso"""
+    event = request_event.get()
+    if event is not None:
+        stages = event.setdefault("stages", {})
+        stages[stage] = round(stages.get(stage, 0.0) + seconds, 4)
+
+
+def parse_sample_rates(text: str) -> Dict[int, float]:
+    """
+    Convierte `"DEBUG=0.01,INFO=0.1"` en proporciones por nivel; los niveles no
+    indicados se registran siempre
+    """
+    rates = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        name, _, rate = item.partition("=")
+        level = logging.getLevelName(name.strip().upper())
+        if not isinstance(level, int):
+            raise ValueError(f"Nivel de log desconocido en LOG_SAMPLE_RATES: {name}")
+        rates[level] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """Deja pasar cada registro con la proporción configurada para su nivel"""
+
+    def __init__(self, rates: Dict[int, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.levelno, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Encola los registros sin formatearlos: el mensaje se compone en el hilo del
+    `QueueListener`, no en el event loop. Si la cola está llena, el registro se
+    descarta y se cuenta en `dropped`.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # El contexto de la solicitud solo se puede leer en el hilo que registra
+        record.request_id = request_id.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _fields(record: logging.LogRecord) -> Dict[str, Any]:
+    """Campos extra del registro (`extra=...` y el identificador de solicitud)"""
+    return {
+        key: value
+        for key, value in vars(record).items()
+        if key not in _RECORD_FIELDS and value is not None
+    }
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro con los campos extra al mismo nivel"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **_fields(record),
+        }
+        if record.exc_info:
+            event["exception"] = self.formatException(record.exc_info)
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Formato de texto de `logging.basicConfig` seguido de los campos extra `clave=valor`"""
+
+    def __init__(self):
+        super().__init__("%(levelname)s:%(name)s:%(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        extra = " ".join(f"{key}={_text(value)}" for key, value in _fields(record).items())
+        return f"{line} {extra}" if extra else line
+
+
+def _text(value: Any) -> str:
+    """Valor de un campo extra en el formato de texto"""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return str(value)
+
+
+class RequestLogMiddleware:
+    """
+    Middleware ASGI que asigna un identificador a cada solicitud (o usa la cabecera
+    `X-Request-ID`), lo devuelve en la respuesta y, al terminar de enviarla, registra
+    un único evento con el método, la ruta, el estado, la duración, las etapas y los
+    parámetros anotados durante la solicitud
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in QUIET_PATHS:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        current_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64]
+        current_id = current_id or uuid.uuid4().hex
+        event: Dict[str, Any] = {}
+        id_token = request_id.set(current_id)
+        event_token = request_event.set(event)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-request-id", current_id.encode("latin-1")),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            duration = time.perf_counter() - started
+            logger.log(
+                logging.ERROR if status >= 500 else logging.INFO,
+                "Solicitud completada",
+                extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status,
+                    "duration": round(duration, 4),
+                    **event,
+                },
+            )
+            request_event.reset(event_token)
+            request_id.reset(id_token)
+
+
+class LoggingSetup:
+    """Handler de cola y listener que escribe en stderr desde un hilo propio"""
+
+    def __init__(self):
+        self.handler: Optional[NonBlockingQueueHandler] = None
+        self.listener: Optional[logging.handlers.QueueListener] = None
+        self._hooks_registered = False
+
+    @property
+    def dropped(self) -> int:
+        """Registros descartados por cola llena"""
+        return self.handler.dropped if self.handler is not None else 0
+
+    def configure(self) -> None:
+        """Sustituye los handlers del logger raíz por la cola (idempotente)"""
+        if self.listener is not None:
+            return
+        output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(JsonFormatter() if settings.log_format == "json" else TextFormatter())
+        self.handler = NonBlockingQueueHandler(queue.Queue(settings.log_queue_size))
+        self.handler.addFilter(SamplingFilter(parse_sample_rates(settings.log_sample_rates)))
+
+        root = logging.getLogger()
+        root.handlers = [self.handler]
+        root.setLevel(settings.log_level.upper())
+        # httpx registra cada llamada al LLM a nivel INFO; su duración ya va en el evento
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+        self.listener = logging.handlers.QueueListener(self.handler.queue, output)
+        self.listener.start()
+        if not self._hooks_registered:
+            self._hooks_registered = True
+            atexit.register(self.stop)
+            # El hilo del listener no sobrevive a fork (workers de server.py)
+            os.register_at_fork(after_in_child=self._restart_after_fork)
+
+    def _restart_after_fork(self) -> None:
+        """Crea en el proceso hijo una cola y un listener propios"""
+        if self.listener is not None:
+            self.listener = None
+            self.configure()
+
+    def stop(self) -> None:
+        """Escribe los registros pendientes y detiene el hilo del listener"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+
+# Instancia global de la configuración de logging
+logging_setup = LoggingSetup()
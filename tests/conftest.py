@@ -0,0 +1,17 @@
+"""
+Fixtures compartidas por las pruebas.
+"""
+import contextlib
+import pytest
+
+from config import override_settings as override
+
+
+@pytest.fixture
+def override_settings():
+    """
+    Devuelve una función que cambia campos de la configuración durante la prueba;
+    los valores originales se restauran al terminar.
+    """
+    with contextlib.ExitStack() as stack:
+        yield lambda **changes: stack.enter_context(override(**changes))
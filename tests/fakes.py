@@ -0,0 +1,46 @@
+"""
+Dobles de prueba compartidos por varias pruebas.
+"""
+
+
+class FakeKeyValueStore:
+    """
+    Doble local con la interfaz de `redis.asyncio` usada por los backends externos.
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+    async def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+    async def decr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) - 1
+        return self.data[key]
+
+    async def expire(self, key, seconds):
+        return key in self.data
+
+    async def eval(self, script, numkeys, *args):
+        """Ejecuta el token bucket de `rate_limit` con la misma semántica que su script Lua"""
+        from rate_limit import TOKEN_BUCKET_SCRIPT, refill_bucket
+
+        assert script == TOKEN_BUCKET_SCRIPT
+        key = args[0]
+        rate, burst, cost, now = (float(arg) for arg in args[numkeys:])
+        state = self.data.get(key)
+        if state is not None:
+            state = tuple(float(part) for part in state.split(" "))
+        (tokens, updated), wait = refill_bucket(state, now, rate, burst, cost)
+        self.data[key] = f"{tokens} {updated}"
+        return str(wait)
@@ -3,6 +3,7 @@ Pruebas unitarias para la API de Generador de Historias.
 Se utiliza pytest como runner y utilidades de unittest.mock para simular dependencias.
 Cada método de la clase prueba un endpoint o caso relevante.
 """
+import json
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import patch
@@ -46,11 +47,15 @@ class TestAPI:
         assert "openai_status" in data
         assert "timestamp" in data
 
-    @patch("main.generate_story_with_llm", return_value="Había una vez un dragón...")
-    def test_generate_story_success(self, mock_generate):
+    @patch(
+        "main.generate_story_with_llm",
+        return_value=("Había una vez un dragón...", "modelo-del-backend", "version-del-prompt"),
+    )
+    def test_generate_story_success(self, mock_generate, override_settings):
         """
         Prueba el endpoint `/generate-story` con datos válidos y verifica la respuesta.
         """
+        override_settings(postprocess_max_repairs=0)
         payload = {
             "word_count": 300,
             "creativity_level": "creativo",
@@ -67,6 +72,8 @@ class TestAPI:
         assert data["metadata"]["word_count"] == 300
         assert data["metadata"]["genre"] == "fantasia"
         assert data["metadata"]["category"] == "infantil"
+        assert data["metadata"]["model"] == "modelo-del-backend"
+        assert data["metadata"]["prompt_version"] == "version-del-prompt"
         assert (
             data["metadata"]["creativity_level"] == "creativo"
             or data["metadata"]["creativity_level"] == "creativo"
@@ -85,3 +92,36 @@ class TestAPI:
         client = TestClient(app)
         response = client.post("/generate-story", json=payload)
         assert response.status_code == 422 or response.status_code == 400
+
+    def test_generate_story_stream(self):
+        """
+        Prueba el endpoint `/generate-story/stream` y verifica los eventos SSE emitidos.
+        """
+        async def fake_stream(request):
+            for text in ["Había ", "una ", "vez..."]:
+                yield text, "modelo-stream", "version-stream"
+
+        payload = {
+            "word_count": 300,
+            "creativity_level": "creativo",
+            "genre": "fantasia",
+            "category": "infantil",
+        }
+        client = TestClient(app)
+        with patch("main.stream_story_with_llm", side_effect=fake_stream):
+            response = client.post("/generate-story/stream", json=payload)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [block for block in response.text.split("\n\n") if block]
+        assert [e.splitlines()[0] for e in events] == [
+            "event: token",
+            "event: token",
+            "event: token",
+            "event: end",
+        ]
+        metadata = json.loads(events[-1].splitlines()[1][len("data: "):])["metadata"]
+        assert metadata["genre"] == "fantasia"
+        assert metadata["model"] == "modelo-stream"
+        assert metadata["prompt_version"] == "version-stream"
+        assert "time_to_first_token" in metadata
+        assert "processing_time" in metadata
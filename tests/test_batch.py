@@ -0,0 +1,104 @@
+"""
+Pruebas de la generación por lotes (endpoint `/generate-stories` y modo offline).
+"""
+import json
+import asyncio
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from batch import run_batch, run_offline
+from main import app
+from models import StoryRequest, StoryResponse
+from prompt_manager import prompt_manager
+
+
+def make_payload(**overrides) -> dict:
+    values = {
+        "word_count": 300,
+        "creativity_level": "creativo",
+        "genre": "fantasia",
+        "category": "infantil",
+    }
+    values.update(overrides)
+    return values
+
+
+class TestBatch:
+    """
+    Pruebas de deduplicación, concurrencia y errores por elemento.
+    """
+
+    def test_fan_out_is_bounded_and_deduplicated(self):
+        """
+        Las solicitudes idénticas se generan una vez y nunca se supera la concurrencia.
+        """
+        requests = [StoryRequest(**make_payload(word_count=100 + i % 6)) for i in range(12)]
+        state = {"running": 0, "peak": 0, "calls": 0}
+
+        async def generate(request):
+            state["calls"] += 1
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+            await asyncio.sleep(0.01)
+            state["running"] -= 1
+            return StoryResponse(story=str(request.word_count), metadata={})
+
+        async def run():
+            return [r async for r in run_batch(requests, generate, concurrency=2)]
+
+        results = asyncio.run(run())
+        assert state["calls"] == 6
+        assert state["peak"] == 2
+        assert sorted(i for r in results for i in r.indices) == list(range(12))
+
+    @patch("main.generate_story_with_llm")
+    def test_endpoint_streams_ndjson_with_item_errors(self, mock_generate, override_settings):
+        """
+        El endpoint devuelve una línea por resultado y los fallos no rompen el lote.
+        """
+        override_settings(postprocess_max_repairs=0)
+
+        async def generate(request):
+            if request.genre == "terror":
+                raise Exception("Fallo del modelo")
+            return f"Historia de {request.genre}", "gpt-4o-mini", prompt_manager.version
+
+        mock_generate.side_effect = generate
+        payload = {
+            "requests": [
+                make_payload(),
+                make_payload(genre="terror"),
+                make_payload(),
+            ]
+        }
+        client = TestClient(app)
+        response = client.post("/generate-stories", json=payload)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        results = [json.loads(line) for line in response.text.splitlines()]
+        by_status = {r["status"]: r for r in results}
+        assert by_status["ok"]["indices"] == [0, 2]
+        assert by_status["ok"]["story"] == "Historia de fantasia"
+        assert by_status["error"]["indices"] == [1]
+        assert mock_generate.call_count == 2
+
+    @patch(
+        "main.generate_story_with_llm",
+        return_value=("Había una vez...", "gpt-4o-mini", prompt_manager.version),
+    )
+    def test_offline_mode_writes_jsonl(self, mock_generate, tmp_path, override_settings):
+        """
+        El modo offline lee solicitudes JSONL y escribe los resultados en JSONL.
+        """
+        override_settings(postprocess_max_repairs=0)
+        input_path = tmp_path / "entrada.jsonl"
+        output_path = tmp_path / "salida.jsonl"
+        input_path.write_text(
+            "\n".join(json.dumps(make_payload(word_count=n)) for n in (100, 200)),
+            encoding="utf-8",
+        )
+        failed = asyncio.run(run_offline(str(input_path), str(output_path), 4))
+        lines = output_path.read_text(encoding="utf-8").splitlines()
+        assert failed == 0
+        assert len(lines) == 2
+        assert all(json.loads(line)["story"] == "Había una vez..." for line in lines)
@@ -0,0 +1,152 @@
+"""
+Pruebas de la caché de historias.
+Se usa un almacén clave-valor falso en memoria en lugar de Redis.
+"""
+import asyncio
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from cache import (
+    KeyValueCacheBackend,
+    MemoryCacheBackend,
+    StoryCache,
+    make_request_key,
+)
+from main import app
+from models import StoryRequest
+from prompt_manager import prompt_manager
+from tests.fakes import FakeKeyValueStore
+
+
+def make_request(**overrides) -> StoryRequest:
+    values = {
+        "word_count": 300,
+        "creativity_level": "creativo",
+        "genre": "fantasia",
+        "category": "infantil",
+    }
+    values.update(overrides)
+    return StoryRequest(**values)
+
+
+class TestStoryCache:
+    """
+    Pruebas de los backends y de la integración con `/generate-story`.
+    """
+
+    def test_request_key_depends_on_parameters(self):
+        """
+        Solicitudes iguales comparten clave y cualquier parámetro distinto la cambia.
+        """
+        assert make_request_key(make_request()) == make_request_key(make_request())
+        assert make_request_key(make_request()) != make_request_key(
+            make_request(word_count=301)
+        )
+
+    def test_memory_backend_evicts_least_recently_used(self):
+        """
+        Al superar el máximo de entradas se expulsa la menos usada.
+        """
+        backend = MemoryCacheBackend(max_entries=2)
+
+        async def run():
+            await backend.set("a", "1", ttl=60)
+            await backend.set("b", "2", ttl=60)
+            await backend.get("a")
+            await backend.set("c", "3", ttl=60)
+            return await backend.get("a"), await backend.get("b")
+
+        assert asyncio.run(run()) == ("1", None)
+        assert backend.stats()["evictions"] == 1
+
+    def test_memory_backend_respects_ttl_and_bytes(self):
+        """
+        Las entradas expiradas no se devuelven y el tamaño total queda acotado.
+        """
+        backend = MemoryCacheBackend(max_entries=100, max_bytes=20)
+
+        async def run():
+            await backend.set("old", "x", ttl=0)
+            expired = await backend.get("old")
+            await backend.set("k1", "0123456789", ttl=60)
+            await backend.set("k2", "0123456789", ttl=60)
+            return expired
+
+        assert asyncio.run(run()) is None
+        stats = backend.stats()
+        assert stats["bytes"] <= 20
+        assert stats["entries"] == 1
+        assert stats["expirations"] == 1
+        assert stats["evictions"] == 1
+
+    def test_key_value_backend_with_fake_store(self):
+        """
+        El backend externo guarda y lee a través de la interfaz clave-valor.
+        """
+        store = FakeKeyValueStore()
+        story_cache = StoryCache(KeyValueCacheBackend(store), ttl=60)
+
+        entry = ("Había una vez...", "gpt-4o-mini", prompt_manager.version)
+
+        async def run():
+            await story_cache.set(make_request(), *entry)
+            return await story_cache.get(make_request())
+
+        assert asyncio.run(run()) == entry
+        assert len(store.data) == 1
+
+    def test_story_is_keyed_by_the_version_that_rendered_its_prompt(self):
+        """
+        Una historia cuyo prompt se generó con plantillas que se recargaron durante la
+        generación no se sirve con la versión nueva.
+        """
+        story_cache = StoryCache(MemoryCacheBackend(), ttl=60)
+
+        async def run():
+            await story_cache.set(make_request(), "Había una vez...", "gpt-4o-mini", "anterior")
+            return await story_cache.get(make_request())
+
+        assert asyncio.run(run()) is None
+
+    @patch(
+        "main.generate_story_with_llm",
+        return_value=("Había una vez un dragón...", "gpt-4o-mini", prompt_manager.version),
+    )
+    def test_generate_story_uses_cache(self, mock_generate, override_settings):
+        """
+        La segunda solicitud idéntica se sirve desde la caché sin llamar al LLM.
+        """
+        override_settings(postprocess_max_repairs=0)
+        story_cache = StoryCache(MemoryCacheBackend(), ttl=60)
+        payload = make_request().model_dump(exclude_none=True)
+        client = TestClient(app)
+        with patch("main.story_cache", story_cache):
+            first = client.post("/generate-story", json=payload).json()
+            second = client.post("/generate-story", json=payload).json()
+            health = client.get("/health").json()
+
+        assert first["metadata"]["cache"] == "miss"
+        assert second["metadata"]["cache"] == "hit"
+        assert second["story"] == first["story"]
+        assert mock_generate.call_count == 1
+        assert health["cache"]["hits"] == 1
+        assert health["cache"]["hit_ratio"] == 0.5
+
+    @patch(
+        "main.generate_story_with_llm",
+        return_value=("Una historia distinta", "gpt-4o-mini", prompt_manager.version),
+    )
+    def test_requests_with_suggestions_bypass_cache(self, mock_generate, override_settings):
+        """
+        Las solicitudes con sugerencias nunca se sirven desde la caché.
+        """
+        override_settings(postprocess_max_repairs=0)
+        story_cache = StoryCache(MemoryCacheBackend(), ttl=60)
+        payload = make_request(suggestions="Un dragón amable").model_dump()
+        client = TestClient(app)
+        with patch("main.story_cache", story_cache):
+            client.post("/generate-story", json=payload)
+            response = client.post("/generate-story", json=payload).json()
+
+        assert response["metadata"]["cache"] == "miss"
+        assert mock_generate.call_count == 2
@@ -0,0 +1,136 @@
+"""
+Pruebas de la agrupación (single-flight) de solicitudes idénticas en curso.
+"""
+import asyncio
+import httpx
+import pytest
+
+from benchmarks.fake_openai_server import FakeOpenAIServer, create_fake_openai_app
+from benchmarks.load_test import PAYLOAD
+from coalescing import SingleFlight
+from metrics import COALESCED_CALLS
+
+
+class TestSingleFlight:
+    """
+    Pruebas de la clase SingleFlight con operaciones simuladas.
+    """
+
+    def test_concurrent_calls_share_one_operation(self):
+        """
+        Las llamadas simultáneas con la misma clave ejecutan la operación una vez.
+        """
+        calls = []
+
+        async def operation():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "historia"
+
+        async def run():
+            flight = SingleFlight()
+            results = await asyncio.gather(*(flight.do("k", operation) for _ in range(5)))
+            return flight, results
+
+        before = COALESCED_CALLS.labels().value
+        flight, results = asyncio.run(run())
+        assert len(calls) == 1
+        assert [story for story, _ in results] == ["historia"] * 5
+        assert [shared for _, shared in results].count(True) == 4
+        assert flight.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 4}
+        assert COALESCED_CALLS.labels().value == before + 4
+
+    def test_cancelling_a_caller_does_not_cancel_the_shared_call(self):
+        """
+        Si el líder se cancela, los seguidores siguen recibiendo el resultado.
+        """
+
+        async def operation():
+            await asyncio.sleep(0.05)
+            return "historia"
+
+        async def run():
+            flight = SingleFlight()
+            leader = asyncio.create_task(flight.do("k", operation))
+            await asyncio.sleep(0)
+            follower = asyncio.create_task(flight.do("k", operation))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return leader, await follower
+
+        leader, (story, shared) = asyncio.run(run())
+        assert leader.cancelled()
+        assert story == "historia" and shared
+
+    def test_errors_are_shared_and_not_remembered(self):
+        """
+        Un error llega a todas las llamadas agrupadas y la siguiente vuelve a intentarlo.
+        """
+        calls = []
+
+        async def failing():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise RuntimeError("fallo")
+
+        async def run():
+            flight = SingleFlight()
+            results = await asyncio.gather(
+                flight.do("k", failing), flight.do("k", failing), return_exceptions=True
+            )
+            await asyncio.gather(flight.do("k", failing), return_exceptions=True)
+            return results
+
+        results = asyncio.run(run())
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert len(calls) == 2
+
+
+class TestCoalescedEndpoint:
+    """
+    Pruebas de `/generate-story` contra el servidor falso de OpenAI.
+    """
+
+    def test_identical_requests_make_one_upstream_call(self, override_settings, monkeypatch):
+        """
+        Cinco solicitudes idénticas simultáneas generan una sola completion.
+        """
+        from main import app, lifespan
+
+        async def run():
+            async with lifespan(app):
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+                    return await asyncio.gather(
+                        *(c.post("/generate-story", json=PAYLOAD) for _ in range(5))
+                    )
+
+        with FakeOpenAIServer(create_fake_openai_app(latency=0.2)) as server:
+            # Las historias del servidor falso son cortas: sin correcciones, una llamada por historia
+            override_settings(
+                openai_api_key="fake-key",
+                openai_base_url=server.base_url,
+                postprocess_max_repairs=0,
+            )
+            monkeypatch.setattr("main.story_flight", SingleFlight())
+            monkeypatch.setattr("main.story_cache", None)
+            monkeypatch.setattr("main.story_pool", None)
+            responses = asyncio.run(run())
+
+        assert server.app.state.requests == 1
+        assert {r.json()["story"] for r in responses} == {"Había una vez un dragón..."}
+        coalesced = [r.json()["metadata"].get("coalesced") for r in responses]
+        assert coalesced.count(True) == 4
+
+    @pytest.mark.parametrize("field", ["genre", "suggestions"])
+    def test_different_requests_are_not_coalesced(self, field):
+        """
+        Las solicitudes que difieren en algún parámetro no comparten llamada.
+        """
+        from cache import make_request_key
+        from models import StoryRequest
+
+        other = {"genre": "drama", "suggestions": "Un faro"}[field]
+        first = StoryRequest(**PAYLOAD)
+        second = StoryRequest(**{**PAYLOAD, field: other})
+        assert make_request_key(first) != make_request_key(second)
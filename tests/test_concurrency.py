@@ -0,0 +1,95 @@
+"""
+Pruebas de concurrencia contra un servidor falso de OpenAI.
+Verifican que las llamadas al LLM no bloquean el event loop.
+"""
+import time
+import asyncio
+import pytest
+
+from benchmarks.fake_openai_server import FakeOpenAIServer, create_fake_openai_app
+from benchmarks.load_test import PAYLOAD, run_concurrent_requests
+from http_pool import pool_stats
+
+
+class TestConcurrency:
+    """
+    Pruebas de la ruta asíncrona de generación de historias.
+    """
+
+    @pytest.fixture
+    def fake_openai(self, override_settings):
+        """
+        Levanta el servidor falso y apunta la configuración de OpenAI hacia él.
+        """
+        with FakeOpenAIServer(create_fake_openai_app(latency=0.5)) as server:
+            # Las historias del servidor falso son cortas: sin correcciones, una llamada por historia
+            override_settings(
+                openai_api_key="fake-key",
+                openai_base_url=server.base_url,
+                postprocess_max_repairs=0,
+            )
+            yield server
+
+    def test_concurrent_requests_take_one_completion_latency(self, fake_openai):
+        """
+        Diez solicitudes simultáneas deben tardar cerca de una sola completion.
+        """
+        elapsed = asyncio.run(run_concurrent_requests(10))
+        assert fake_openai.app.state.requests == 10
+        assert elapsed < 0.5 * 3
+
+    def test_connections_are_reused_between_requests(self, fake_openai, monkeypatch):
+        """
+        Dentro de la misma vida de la app, las conexiones del pool se reutilizan.
+        """
+        from main import app, lifespan
+
+        # La sonda de salud también usa el pool; se desactiva para contar solo las historias
+        monkeypatch.setattr("main.upstream_prober", None)
+        from services import generate_story_with_llm
+        from models import StoryRequest
+
+        request = StoryRequest(
+            word_count=100, creativity_level="creativo", genre="drama", category="todos"
+        )
+
+        async def run() -> None:
+            async with lifespan(app):
+                for _ in range(5):
+                    await generate_story_with_llm(request)
+
+        hits, misses = pool_stats.hits, pool_stats.misses
+        asyncio.run(run())
+        assert pool_stats.misses - misses == 1
+        assert pool_stats.hits - hits == 4
+
+    def test_stream_delivers_first_token_before_completion(self, override_settings):
+        """
+        El primer fragmento llega mucho antes de que termine la generación completa.
+        """
+        import httpx
+        from main import app
+
+        fake_app = create_fake_openai_app(
+            latency=0.05, content="uno dos tres cuatro cinco", token_delay=0.2
+        )
+
+        def run(base_url: str) -> tuple:
+            start = time.perf_counter()
+            first_chunk = None
+            with httpx.stream(
+                "POST", f"{base_url}/generate-story/stream", json=PAYLOAD
+            ) as response:
+                for line in response.iter_lines():
+                    if first_chunk is None and line == "event: token":
+                        first_chunk = time.perf_counter() - start
+            return first_chunk, time.perf_counter() - start
+
+        # ASGITransport acumula la respuesta, así que la API se sirve con uvicorn
+        with FakeOpenAIServer(fake_app) as upstream:
+            override_settings(openai_api_key="fake-key", openai_base_url=upstream.base_url)
+            with FakeOpenAIServer(app) as api:
+                first_chunk, total = run(f"http://{api.host}:{api.port}")
+
+        assert first_chunk < 0.5
+        assert total >= 0.2 * 5
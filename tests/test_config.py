@@ -0,0 +1,127 @@
+"""
+Pruebas de la configuración inmutable leída de las variables de entorno.
+"""
+import dataclasses
+import pytest
+
+from config import ConfigError, Settings, get_settings, settings
+
+
+class TestSettings:
+    """
+    Pruebas de la lectura, conversión y validación de la configuración.
+    """
+
+    def test_values_are_parsed_by_field_type(self):
+        """
+        Cada variable se convierte según el tipo del campo; las ausentes usan el defecto.
+        """
+        parsed = Settings.from_env(
+            {
+                "OPENAI_MAX_CONCURRENCY": "7",
+                "OPENAI_TEMPERATURE": "0.3",
+                "CACHE_ENABLED": "yes",
+                "OPENAI_BASE_URL": "",
+                "STORY_POOL_WORD_BUCKETS": "50,150",
+                "CORS_ORIGINS": "http://a, http://b",
+                "LLM_BACKENDS": '[{"name": "b1", "model": "m"}]',
+            }
+        )
+        assert parsed.openai_max_concurrency == 7
+        assert parsed.openai_temperature == 0.3
+        assert parsed.cache_enabled is True
+        assert parsed.openai_base_url is None
+        assert parsed.story_pool_word_buckets == (50, 150)
+        assert parsed.cors_origins == ("http://a", "http://b")
+        assert parsed.llm_backends == ({"name": "b1", "model": "m"},)
+        assert parsed.openai_model == "gpt-4o-mini"
+
+    def test_invalid_values_fail_at_startup(self):
+        """
+        Los valores con formato o rango incorrecto fallan al crear la configuración.
+        """
+        with pytest.raises(ValueError, match="OPENAI_MAX_TOKENS"):
+            Settings.from_env({"OPENAI_MAX_TOKENS": "muchos"})
+        with pytest.raises(ValueError, match="BATCH_CONCURRENCY.*CACHE_BACKEND"):
+            Settings.from_env({"BATCH_CONCURRENCY": "0", "CACHE_BACKEND": "disco"})
+
+    def test_all_invalid_values_are_reported_together(self):
+        """
+        Los errores de formato y de rango se informan juntos en un único error.
+        """
+        with pytest.raises(ConfigError) as error:
+            Settings.from_env(
+                {
+                    "OPENAI_MAX_TOKENS": "muchos",
+                    "CACHE_ENABLED": "true",
+                    "LLM_BACKENDS": "no es json",
+                    "BATCH_CONCURRENCY": "0",
+                }
+            )
+        assert len(error.value.errors) == 3
+        assert "OPENAI_MAX_TOKENS" in str(error.value)
+        assert "LLM_BACKENDS" in str(error.value)
+        assert "BATCH_CONCURRENCY" in str(error.value)
+
+    def test_ranges_booleans_and_backends_are_validated(self):
+        """
+        Se rechazan los números fuera de rango, los booleanos desconocidos y los
+        backends con campos inválidos, todos en el mismo error.
+        """
+        with pytest.raises(ConfigError) as error:
+            Settings.from_env(
+                {
+                    "STORY_POOL_REFILL_RATE": "0",
+                    "STORY_POOL_DEPTH": "-1",
+                    "CACHE_TTL_SECONDS": "-5",
+                    "BREAKER_OPEN_SECONDS": "-1",
+                    "OPENAI_READ_TIMEOUT": "0",
+                    "PORT": "-1",
+                    "CACHE_ENABLED": "ture",
+                    "LLM_BACKENDS": '[{"name": "a", "weight": 0}, {"max_concurrency": 0}]',
+                }
+            )
+        message = str(error.value)
+        assert len(error.value.errors) == 9
+        for name in (
+            "STORY_POOL_REFILL_RATE",
+            "STORY_POOL_DEPTH",
+            "CACHE_TTL_SECONDS",
+            "BREAKER_OPEN_SECONDS",
+            "OPENAI_READ_TIMEOUT",
+            "PORT",
+            "CACHE_ENABLED",
+            "LLM_BACKENDS[0]: 'weight'",
+            "LLM_BACKENDS[1]: 'max_concurrency'",
+        ):
+            assert name in message
+        assert Settings.from_env({"CACHE_ENABLED": "off"}).cache_enabled is False
+
+    def test_settings_are_immutable_and_cached(self):
+        """
+        La configuración global no se puede modificar y se crea una sola vez.
+        """
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            settings.openai_model = "otro"
+        assert get_settings() is settings
+
+    def test_components_inherit_shared_state_backend(self, override_settings):
+        """
+        Sin configuración propia, cada componente usa el backend y la URL compartidos;
+        los que quedan en memoria se informan como estado por proceso.
+        """
+        from shared_state import local_state, state_backend
+
+        override_settings(
+            shared_state_backend="redis",
+            shared_state_redis_url="redis://compartido:6379/1",
+            jobs_backend="memory",
+            rate_limit_redis_url="redis://limites:6379/0",
+            rate_limit_enabled=True,
+            semantic_cache_enabled=False,
+            story_pool_enabled=False,
+        )
+        assert state_backend("cache") == ("redis", "redis://compartido:6379/1")
+        assert state_backend("rate_limit") == ("redis", "redis://limites:6379/0")
+        assert state_backend("jobs")[0] == "memory"
+        assert local_state() == ["jobs"]
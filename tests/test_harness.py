@@ -0,0 +1,124 @@
+"""
+Pruebas del banco de pruebas de carga y de las métricas de proceso que lee.
+"""
+import time
+import asyncio
+import httpx
+import pytest
+
+from benchmarks.fake_openai_server import (
+    FakeOpenAIServer,
+    create_fake_openai_app,
+    lognormal_latency,
+)
+from benchmarks.harness import compare, histogram_quantile, parse_loop_lag, percentile
+from metrics import LoopLagMonitor, render_metrics, resident_memory_bytes
+
+
+class TestHarnessHelpers:
+    """
+    Pruebas de los cálculos del informe.
+    """
+
+    def test_percentile_interpolates(self):
+        """
+        Los percentiles interpolan entre muestras y toleran listas vacías.
+        """
+        values = [float(v) for v in range(1, 101)]
+        assert percentile(values, 50) == pytest.approx(50.5)
+        assert percentile(values, 99) == pytest.approx(99.01)
+        assert percentile([], 50) is None
+
+    def test_histogram_quantile_from_cumulative_buckets(self):
+        """
+        El cuantil se interpola dentro del bucket que lo contiene.
+        """
+        buckets = [(0.1, 50.0), (1.0, 100.0), (float("inf"), 100.0)]
+        assert histogram_quantile(buckets, 0.5) == pytest.approx(0.1)
+        assert histogram_quantile(buckets, 0.75) == pytest.approx(0.55)
+        assert histogram_quantile([(float("inf"), 0.0)], 0.5) is None
+
+    def test_parse_loop_lag_from_metrics_endpoint(self):
+        """
+        De la exposición se obtienen el arranque del worker y su retraso del event loop.
+        """
+        start_time, lag = parse_loop_lag(render_metrics())
+        assert start_time is not None and start_time <= time.time()
+        assert set(lag) == {"samples", "mean", "p99"}
+
+    def test_compare_reports_relative_change(self):
+        """
+        La comparación muestra la variación porcentual respecto a la ejecución anterior.
+        """
+
+        def result(rps, p50):
+            return {
+                "commit": "abc",
+                "timestamp": "t",
+                "results": {
+                    "requests_per_second": rps,
+                    "latency_seconds": {"p50": p50, "p95": None, "p99": None},
+                },
+            }
+
+        lines = compare(result(12, 0.5), result(10, 1.0))
+        assert any("requests_per_second" in line and "+20.0%" in line for line in lines)
+        assert any("p50" in line and "-50.0%" in line for line in lines)
+
+
+class TestProcessMetrics:
+    """
+    Pruebas del monitor del event loop, la memoria residente y el servidor falso.
+    """
+
+    def test_loop_lag_monitor_detects_blocking_work(self):
+        """
+        Un bloqueo síncrono del event loop aparece como retraso.
+        """
+
+        def lag_total():
+            _, lag = parse_loop_lag(render_metrics())
+            return lag["samples"], (lag["mean"] or 0) * lag["samples"]
+
+        async def run():
+            monitor = LoopLagMonitor(interval=0.01)
+            await monitor.start()
+            await asyncio.sleep(0.02)
+            time.sleep(0.1)
+            await asyncio.sleep(0.001)
+            blocked = monitor.last
+            await monitor.stop()
+            return monitor, blocked
+
+        samples_before, total_before = lag_total()
+        monitor, blocked = asyncio.run(run())
+        samples_after, total_after = lag_total()
+        assert blocked >= 0.05
+        assert samples_after > samples_before
+        assert total_after - total_before >= 0.05
+        assert monitor._task is None
+
+    def test_resident_memory_is_reported(self):
+        """
+        La memoria residente del propio proceso es positiva.
+        """
+        assert resident_memory_bytes() > 0
+
+    def test_fake_server_error_rate_and_latency_distribution(self):
+        """
+        El servidor falso falla con la probabilidad indicada y muestrea la latencia.
+        """
+        app = create_fake_openai_app(
+            latency=lognormal_latency(0.001, 0.1), error_rate=0.5, error_status=503
+        )
+        with FakeOpenAIServer(app) as server:
+            statuses = [
+                httpx.post(
+                    f"{server.base_url}/chat/completions",
+                    json={"model": "m", "messages": []},
+                    timeout=5,
+                ).status_code
+                for _ in range(40)
+            ]
+        assert set(statuses) == {200, 503}
+        assert app.state.requests == 40
@@ -0,0 +1,163 @@
+"""
+Pruebas de la sonda del proveedor y de los endpoints de vida y disponibilidad.
+"""
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks.fake_openai_server import FakeOpenAIServer, create_fake_openai_app
+from health import ReadinessCheck, UpstreamProber
+from main import app
+from metrics import REQUESTS_IN_FLIGHT, LoopLagMonitor
+from router import Backend, Router
+
+
+@pytest.fixture
+def fake_servers():
+    """
+    Dos servidores falsos de OpenAI que las pruebas pueden marcar como caídos.
+    """
+    servers = [FakeOpenAIServer(create_fake_openai_app()).__enter__() for _ in range(2)]
+    yield servers
+    for server in servers:
+        server.__exit__(None, None, None)
+
+
+def make_router(servers) -> Router:
+    return Router([
+        Backend(name=f"b{index}", model="modelo", base_url=server.base_url, api_key="fake-key")
+        for index, server in enumerate(servers)
+    ])
+
+
+class TestUpstreamProber:
+    """
+    Pruebas del estado que la sonda guarda para `/health`.
+    """
+
+    def test_status_follows_backend_health(self, fake_servers):
+        """
+        La sonda pasa de connected a degraded y a error según los backends que responden.
+        """
+        router = make_router(fake_servers)
+        prober = UpstreamProber(lambda: router, timeout=2)
+        statuses = []
+
+        async def run():
+            router.open()
+            try:
+                statuses.append(prober.status)
+                await prober.probe_once()
+                statuses.append(prober.status)
+                fake_servers[0].app.state.healthy = False
+                await prober.probe_once()
+                statuses.append(prober.status)
+                fake_servers[1].app.state.healthy = False
+                await prober.probe_once()
+                statuses.append(prober.status)
+            finally:
+                await router.close()
+
+        asyncio.run(run())
+        assert statuses == ["unknown", "connected", "degraded", "error"]
+        snapshot = prober.snapshot()
+        assert snapshot["backends"]["b0"] == {"status": "error", "error": "InternalServerError"}
+        assert all(server.app.state.probes == 3 for server in fake_servers)
+
+    def test_background_probe_does_not_count_as_routing(self, fake_servers):
+        """
+        La sonda en segundo plano se ejecuta sin alterar las medias del enrutado.
+        """
+        router = make_router(fake_servers)
+        prober = UpstreamProber(lambda: router, interval=0.01, timeout=2)
+
+        async def run():
+            router.open()
+            try:
+                await prober.start()
+                for _ in range(200):
+                    await asyncio.sleep(0.01)
+                    if fake_servers[0].app.state.probes >= 2:
+                        break
+                await prober.stop()
+            finally:
+                await router.close()
+
+        asyncio.run(run())
+        assert fake_servers[0].app.state.probes >= 2
+        assert prober.status == "connected"
+        assert all(backend.stats()["requests"] == 0 for backend in router.backends)
+
+    def test_without_router_is_not_configured(self):
+        """
+        Sin router inicializado la sonda no hace nada y lo indica.
+        """
+        prober = UpstreamProber(lambda: None)
+        asyncio.run(prober.probe_once())
+        assert prober.status == "not_configured"
+        assert prober.checked_at is None
+
+
+class TestHealthEndpoints:
+    """
+    Pruebas de `/health/live` y `/health/ready`.
+    """
+
+    def test_liveness_is_always_ok(self, monkeypatch):
+        """
+        La sonda de vida responde 200 aunque el worker no esté listo.
+        """
+        monitor = LoopLagMonitor()
+        monitor.last = 5.0
+        monkeypatch.setattr("main.readiness", ReadinessCheck(None, monitor, 0, 0.1))
+        client = TestClient(app)
+        assert client.get("/health/live").json() == {"status": "alive"}
+        assert client.get("/health/ready").status_code == 503
+
+    def test_ready_until_loop_lag_crosses_threshold(self, monkeypatch):
+        """
+        Con el event loop retrasado por encima del umbral, la disponibilidad es 503.
+        """
+        monitor = LoopLagMonitor()
+        monkeypatch.setattr("main.readiness", ReadinessCheck(None, monitor, 0, 0.5))
+        client = TestClient(app)
+        assert client.get("/health/ready").json() == {"ready": True, "reasons": []}
+
+        monitor.last = 0.8
+        response = client.get("/health/ready")
+        assert response.status_code == 503
+        assert response.json()["reasons"] == ["loop_lag=0.800s >= 0.5s"]
+
+    def test_not_ready_with_too_many_requests_in_flight(self, monkeypatch):
+        """
+        Las solicitudes en curso por encima del umbral (sin contar la propia) dan 503.
+        """
+        monkeypatch.setattr("main.readiness", ReadinessCheck(None, LoopLagMonitor(), 3, 0))
+        client = TestClient(app)
+        in_flight = REQUESTS_IN_FLIGHT.labels()
+        in_flight.inc(2)
+        try:
+            assert client.get("/health/ready").status_code == 200
+            in_flight.inc()
+            response = client.get("/health/ready")
+        finally:
+            in_flight.dec(3)
+        assert response.status_code == 503
+        assert response.json()["reasons"] == ["in_flight=3 >= 3"]
+
+    def test_health_reports_upstream_error(self, monkeypatch, override_settings):
+        """
+        Si ningún backend responde a la sonda, `/health` lo indica sin llamar al proveedor.
+        """
+        override_settings(openai_api_key="fake-key")
+        prober = UpstreamProber(lambda: object())
+        prober.results = {"default": {"status": "error", "error": "APITimeoutError"}}
+        prober.checked_at = 0.0
+        monkeypatch.setattr("main.upstream_prober", prober)
+        monkeypatch.setattr("main.readiness", ReadinessCheck(prober, LoopLagMonitor()))
+        client = TestClient(app)
+        body = client.get("/health").json()
+        assert body["status"] == "degraded"
+        assert body["openai_status"] == "error"
+        assert body["upstream"]["backends"]["default"]["error"] == "APITimeoutError"
+        assert client.get("/health/ready").json()["reasons"] == ["upstream=error"]
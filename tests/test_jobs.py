@@ -0,0 +1,258 @@
+"""
+Pruebas de la cola de trabajos asíncronos (`/jobs`).
+"""
+import time
+import asyncio
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from benchmarks.fake_openai_server import FakeOpenAIServer
+from jobs import (
+    CallbackNotAllowedError,
+    InMemoryJobStore,
+    JobQueue,
+    KeyValueJobStore,
+    QueueFullError,
+    check_callback_host,
+    check_callback_url,
+)
+from main import app
+from models import StoryRequest, StoryResponse
+from prompt_manager import prompt_manager
+from tests.fakes import FakeKeyValueStore
+
+
+def make_request(**overrides) -> StoryRequest:
+    values = {
+        "word_count": 2000,
+        "creativity_level": "creativo",
+        "genre": "fantasia",
+        "category": "todos",
+    }
+    values.update(overrides)
+    return StoryRequest(**values)
+
+
+async def fake_generate(request: StoryRequest) -> StoryResponse:
+    return StoryResponse(story=f"Historia de {request.genre}", metadata={})
+
+
+async def wait_for_status(queue: JobQueue, job_id: str, status: str):
+    for _ in range(200):
+        job = await queue.get(job_id)
+        if job.status == status:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"El trabajo no llegó al estado {status}")
+
+
+class TestJobs:
+    """
+    Pruebas de la cola, sus almacenamientos y los endpoints.
+    """
+
+    def test_jobs_run_in_priority_order(self):
+        """
+        Con un solo worker, los trabajos de prioridad alta se atienden antes.
+        """
+        order = []
+
+        async def generate(request):
+            order.append(request.genre)
+            return await fake_generate(request)
+
+        async def run():
+            queue = JobQueue(InMemoryJobStore(), workers=1)
+            await queue.submit(make_request(genre="drama"), priority="low")
+            await queue.submit(make_request(genre="terror"), priority="normal")
+            last = await queue.submit(make_request(genre="comedia"), priority="high")
+            await queue.start(generate)
+            await asyncio.sleep(0.05)
+            job = await queue.get(last.job_id)
+            await queue.stop()
+            return job
+
+        job = asyncio.run(run())
+        assert order == ["comedia", "terror", "drama"]
+        assert job.status == "completed"
+        assert job.result.story == "Historia de comedia"
+
+    def test_queue_depth_is_bounded(self):
+        """
+        Al alcanzar la profundidad máxima se rechazan nuevos trabajos.
+        """
+        async def run():
+            queue = JobQueue(InMemoryJobStore(), max_depth=1)
+            await queue.submit(make_request())
+            await queue.submit(make_request())
+
+        try:
+            asyncio.run(run())
+        except QueueFullError:
+            return
+        raise AssertionError("Se esperaba QueueFullError")
+
+    def test_expired_jobs_are_purged(self):
+        """
+        Los trabajos cuyo TTL expiró desaparecen del almacenamiento.
+        """
+        async def run():
+            store = InMemoryJobStore()
+            queue = JobQueue(store, ttl=0)
+            job = await queue.submit(make_request())
+            return await queue.get(job.job_id), await store.purge_expired()
+
+        assert asyncio.run(run()) == (None, 1)
+
+    def test_stop_waits_for_running_jobs(self):
+        """
+        Al detener la cola con plazo, el trabajo en ejecución termina y el que espera
+        en la cola no empieza y queda cancelado.
+        """
+        async def generate(request):
+            await asyncio.sleep(0.2)
+            return await fake_generate(request)
+
+        async def run():
+            queue = JobQueue(InMemoryJobStore(), workers=1)
+            await queue.start(generate)
+            running = await queue.submit(make_request())
+            queued = await queue.submit(make_request())
+            await asyncio.sleep(0.05)
+            await queue.stop(timeout=5)
+            return await queue.get(running.job_id), await queue.get(queued.job_id), queue.depth
+
+        running, queued, depth = asyncio.run(run())
+        assert running.status == "completed"
+        assert queued.status == "cancelled"
+        assert depth == 0
+
+    def test_stop_cancels_unfinished_jobs_in_shared_store(self):
+        """
+        Los trabajos que no terminan dentro del plazo quedan cancelados en el
+        almacenamiento compartido en lugar de seguir `running` hasta que expiren.
+        """
+        async def generate(request):
+            await asyncio.sleep(10)
+
+        async def run():
+            kv = FakeKeyValueStore()
+            queue = JobQueue(KeyValueJobStore(kv), workers=1)
+            await queue.start(generate)
+            job = await queue.submit(make_request())
+            await wait_for_status(queue, job.job_id, "running")
+            await queue.stop(timeout=0.05)
+            return await KeyValueJobStore(kv).get(job.job_id)
+
+        job = asyncio.run(run())
+        assert job.status == "cancelled"
+        assert job.error and job.completed_at
+
+    def test_key_value_store_and_callback(self):
+        """
+        El almacenamiento externo guarda el resultado y se notifica la URL de callback.
+        """
+        received = []
+        callback_app = FastAPI()
+
+        @callback_app.post("/done")
+        async def done(request: Request):
+            received.append(await request.json())
+            return {}
+
+        async def run(callback_url):
+            kv = FakeKeyValueStore()
+            # El servidor de callback escucha en loopback: se permite de forma explícita
+            queue = JobQueue(
+                KeyValueJobStore(kv), workers=1, callback_allowed_hosts=["127.0.0.1"]
+            )
+            await queue.start(fake_generate)
+            job = await queue.submit(make_request(), callback_url=callback_url)
+            job = await wait_for_status(queue, job.job_id, "completed")
+            for _ in range(100):
+                if received:
+                    break
+                await asyncio.sleep(0.01)
+            await queue.stop()
+            return job, kv
+
+        with FakeOpenAIServer(callback_app) as server:
+            job, kv = asyncio.run(run(f"http://{server.host}:{server.port}/done"))
+
+        assert f"story-job:{job.job_id}" in kv.data
+        assert received[0]["job_id"] == job.job_id
+        assert received[0]["result"]["story"] == "Historia de fantasia"
+
+    @patch(
+        "main.generate_story_with_llm",
+        return_value=("Una historia larga...", "gpt-4o-mini", prompt_manager.version),
+    )
+    def test_submit_and_poll_endpoints(self, mock_generate, override_settings):
+        """
+        `POST /jobs` responde 202 al instante y `GET /jobs/{id}` devuelve el resultado.
+        """
+        override_settings(postprocess_max_repairs=0)
+        payload = {"request": make_request().model_dump(exclude_none=True)}
+        with TestClient(app) as client:
+            response = client.post("/jobs", json=payload)
+            assert response.status_code == 202
+            job_id = response.json()["job_id"]
+            for _ in range(100):
+                job = client.get(f"/jobs/{job_id}").json()
+                if job["status"] == "completed":
+                    break
+                time.sleep(0.01)
+            assert job["result"]["story"] == "Una historia larga..."
+            assert client.get("/jobs/desconocido").status_code == 404
+
+    def test_full_queue_returns_429(self):
+        """
+        Con la cola llena, `POST /jobs` responde 429 con `Retry-After`.
+        """
+        payload = {"request": make_request().model_dump(exclude_none=True)}
+        full_queue = JobQueue(InMemoryJobStore(), max_depth=0)
+        client = TestClient(app)
+        with patch("main.job_queue", full_queue):
+            response = client.post("/jobs", json=payload)
+        assert response.status_code == 429
+        assert "retry-after" in response.headers
+
+    def test_callback_url_cannot_target_internal_hosts(self):
+        """
+        Sin lista de hosts se rechazan las URL de callback hacia direcciones internas o
+        no http(s); con lista, solo se admiten sus hosts y subdominios.
+        """
+        for url in (
+            "http://127.0.0.1:8000/done",
+            "http://localhost/done",
+            "http://169.254.169.254/latest/meta-data",
+            "http://10.0.0.5/done",
+            "http://[::1]/done",
+            "http://[::ffff:127.0.0.1]/done",
+            "file:///etc/passwd",
+        ):
+            with pytest.raises(CallbackNotAllowedError):
+                check_callback_url(url)
+        check_callback_url("https://8.8.8.8/done")
+        check_callback_url("https://hooks.example.com/done")
+
+        allowed = ["example.com"]
+        check_callback_url("https://hooks.example.com/done", allowed)
+        with pytest.raises(CallbackNotAllowedError):
+            check_callback_url("https://example.com.evil.net/done", allowed)
+        with pytest.raises(CallbackNotAllowedError):
+            asyncio.run(check_callback_host("localhost", 80))
+
+    def test_submit_rejects_internal_callback_with_422(self):
+        """
+        `POST /jobs` responde 422 si `callback_url` apunta a una dirección interna.
+        """
+        payload = {
+            "request": make_request().model_dump(exclude_none=True),
+            "callback_url": "http://169.254.169.254/latest/meta-data",
+        }
+        response = TestClient(app).post("/jobs", json=payload)
+        assert response.status_code == 422
+        assert "callback_url" in response.json()["detail"]
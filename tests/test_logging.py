@@ -0,0 +1,117 @@
+"""
+Pruebas del logging estructurado: evento por solicitud, formato JSON, muestreo y cola.
+"""
+import json
+import queue
+import asyncio
+import logging
+import httpx
+import pytest
+
+from benchmarks.fake_openai_server import FakeOpenAIServer, create_fake_openai_app
+from benchmarks.load_test import PAYLOAD
+from main import app, lifespan
+from structured_logging import (
+    JsonFormatter,
+    NonBlockingQueueHandler,
+    SamplingFilter,
+    parse_sample_rates,
+)
+
+
+def make_record(level: int = logging.INFO, msg: str = "Hola %s", args=("mundo",)):
+    return logging.LogRecord("prueba", level, __file__, 1, msg, args, None)
+
+
+class TestRequestEvent:
+    """
+    Pruebas del evento único que se registra por cada solicitud.
+    """
+
+    def test_one_event_per_request_with_stages_and_parameters(
+        self, override_settings, monkeypatch, caplog
+    ):
+        """
+        Una generación produce un solo evento con identificador, etapas y parámetros,
+        y el identificador recibido en `X-Request-ID` se devuelve en la respuesta.
+        """
+
+        async def run():
+            async with lifespan(app):
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+                    return await c.post(
+                        "/generate-story", json=PAYLOAD, headers={"X-Request-ID": "abc123"}
+                    )
+
+        with FakeOpenAIServer(create_fake_openai_app(latency=0.01)) as server:
+            override_settings(openai_api_key="fake-key", openai_base_url=server.base_url)
+            monkeypatch.setattr("main.story_cache", None)
+            monkeypatch.setattr("main.story_pool", None)
+            with caplog.at_level(logging.INFO):
+                response = asyncio.run(run())
+
+        assert response.status_code == 200
+        assert response.headers["X-Request-ID"] == "abc123"
+        events = [r for r in caplog.records if r.name == "structured_logging"]
+        assert len(events) == 1
+        event = events[0]
+        assert event.path == "/generate-story" and event.status == 200
+        assert event.word_count == PAYLOAD["word_count"]
+        assert event.genre == PAYLOAD["genre"]
+        assert {"validation", "prompt_build", "queue", "completion"} <= set(event.stages)
+        assert event.words > 0 and event.finish_reason == "stop"
+        # El resto de registros de la solicitud no se emiten a nivel INFO
+        assert not [r for r in caplog.records if r.name in ("main", "services")]
+
+    def test_generated_request_id_is_returned(self):
+        """
+        Sin cabecera se genera un identificador nuevo por solicitud.
+        """
+        from fastapi.testclient import TestClient
+
+        client = TestClient(app)
+        first = client.get("/").headers["X-Request-ID"]
+        second = client.get("/").headers["X-Request-ID"]
+        assert first and second and first != second
+
+
+class TestLogPipeline:
+    """
+    Pruebas del formateador JSON, el muestreo por nivel y la cola no bloqueante.
+    """
+
+    def test_json_formatter_includes_extra_fields(self):
+        """
+        Cada registro es una línea JSON con el mensaje compuesto y los campos extra.
+        """
+        record = make_record()
+        record.request_id = "abc"
+        record.stages = {"completion": 0.5}
+        line = json.loads(JsonFormatter().format(record))
+        assert line["message"] == "Hola mundo"
+        assert line["level"] == "INFO"
+        assert line["request_id"] == "abc"
+        assert line["stages"] == {"completion": 0.5}
+
+    def test_sampling_by_level(self):
+        """
+        Un nivel con proporción 0 se descarta y los niveles no indicados se conservan.
+        """
+        rates = parse_sample_rates("debug=0, INFO=0")
+        sampling = SamplingFilter(rates)
+        assert not sampling.filter(make_record(logging.INFO))
+        assert sampling.filter(make_record(logging.ERROR))
+        with pytest.raises(ValueError):
+            parse_sample_rates("VERBOSO=0.5")
+
+    def test_queue_handler_defers_formatting_and_drops_when_full(self):
+        """
+        Los registros se encolan sin formatear y, con la cola llena, se descartan.
+        """
+        handler = NonBlockingQueueHandler(queue.Queue(1))
+        handler.handle(make_record())
+        handler.handle(make_record())
+        queued = handler.queue.get_nowait()
+        assert queued.msg == "Hola %s" and queued.args == ("mundo",)
+        assert handler.dropped == 1
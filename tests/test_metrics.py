@@ -0,0 +1,123 @@
+"""
+Pruebas de las métricas de Prometheus y del endpoint `/metrics`.
+"""
+import asyncio
+import httpx
+import pytest
+
+from benchmarks.fake_openai_server import FakeOpenAIServer, create_fake_openai_app
+from benchmarks.load_test import PAYLOAD
+from config import settings
+from metrics import Counter, Histogram, LLM_TOKENS, STAGE_LATENCY, render_metrics
+import metrics
+
+
+def sample_value(text: str, sample: str) -> float:
+    """Valor de la muestra cuya línea empieza por `sample` en la exposición"""
+    for line in text.splitlines():
+        if line.startswith(sample + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"No se encontró la muestra {sample}")
+
+
+class TestMetricTypes:
+    """
+    Pruebas del formato de exposición de las métricas.
+    """
+
+    @pytest.fixture(autouse=True)
+    def isolated_registry(self, monkeypatch):
+        """Usa un registro vacío para no mezclar con las métricas de la app"""
+        monkeypatch.setattr(metrics, "REGISTRY", [])
+
+    def test_histogram_buckets_are_cumulative(self):
+        """
+        Los buckets se exportan acumulados, con +Inf, suma y total.
+        """
+        histogram = Histogram("latency_seconds", "Latencia", ("stage",), buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.5, 5):
+            histogram.labels("llm").observe(value)
+        text = metrics.render_metrics()
+
+        assert "# TYPE latency_seconds histogram" in text
+        assert sample_value(text, 'latency_seconds_bucket{stage="llm",le="0.1"}') == 1
+        assert sample_value(text, 'latency_seconds_bucket{stage="llm",le="1.0"}') == 3
+        assert sample_value(text, 'latency_seconds_bucket{stage="llm",le="+Inf"}') == 4
+        assert sample_value(text, 'latency_seconds_sum{stage="llm"}') == pytest.approx(6.05)
+        assert sample_value(text, 'latency_seconds_count{stage="llm"}') == 4
+
+    def test_label_values_are_escaped(self):
+        """
+        Las comillas y barras de los valores de etiqueta se escapan.
+        """
+        counter = Counter("errors_total", "Errores", ("exception",))
+        counter.labels('Mal "error"\\').inc()
+        assert 'errors_total{exception="Mal \\"error\\"\\\\"} 1.0' in metrics.render_metrics()
+
+
+class TestMetricsEndpoint:
+    """
+    Pruebas de la instrumentación de la generación de historias.
+    """
+
+    def test_generation_records_stages_and_tokens(self, override_settings, monkeypatch):
+        """
+        Tras generar una historia se exportan las etapas y los tokens consumidos.
+        """
+        from main import app, lifespan
+
+        async def run():
+            async with lifespan(app):
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(
+                    transport=transport, base_url="http://test"
+                ) as client:
+                    response = await client.post("/generate-story", json=PAYLOAD)
+                    assert response.status_code == 200
+                    return await client.get("/metrics")
+
+        completion = STAGE_LATENCY.labels(
+            "completion",
+            PAYLOAD["genre"],
+            PAYLOAD["category"],
+            PAYLOAD["creativity_level"],
+            settings.openai_model,
+        )
+        completions_before = completion.count
+        tokens_before = LLM_TOKENS.labels("prompt", settings.openai_model).value
+
+        with FakeOpenAIServer(create_fake_openai_app(latency=0.01)) as server:
+            # Las historias del servidor falso son cortas: sin correcciones, una llamada por historia
+            override_settings(
+                openai_api_key="fake-key",
+                openai_base_url=server.base_url,
+                postprocess_max_repairs=0,
+            )
+            monkeypatch.setattr("main.story_cache", None)
+            monkeypatch.setattr("main.story_pool", None)
+            response = asyncio.run(run())
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        text = response.text
+        for stage in ("validation", "prompt_build", "queue", "completion"):
+            assert f'story_stage_duration_seconds_count{{stage="{stage}"' in text
+        assert completion.count == completions_before + 1
+        assert LLM_TOKENS.labels("prompt", settings.openai_model).value == tokens_before + 100
+        assert sample_value(text, "http_requests_in_flight") == 1
+        assert sample_value(text, "llm_calls_in_flight") == 0
+
+    def test_errors_are_counted_by_exception_type(self, override_settings):
+        """
+        Los errores del LLM se cuentan por tipo de excepción original.
+        """
+        from services import generate_story_with_llm
+        from models import StoryRequest
+
+        override_settings(openai_api_key=None)
+        errors = metrics.ERRORS.labels("ValueError")
+        before = errors.value
+        with pytest.raises(Exception):
+            asyncio.run(generate_story_with_llm(StoryRequest(**PAYLOAD)))
+        assert errors.value == before + 1
+        assert 'story_errors_total{exception="ValueError"}' in render_metrics()
@@ -0,0 +1,142 @@
+"""
+Pruebas del post-procesado de historias: análisis incremental y correcciones dirigidas.
+"""
+import asyncio
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, patch
+
+from main import app
+from models import StoryRequest
+from postprocess import StoryAnalyzer, analyze_story, postprocess_story
+from prompt_manager import prompt_manager
+
+STORY = (
+    "## El dragón de «Aguasclaras»\n\n"
+    "Había una vez un dragón que vivía junto al río. Cada mañana saludaba a los "
+    "pescadores, y ellos le dejaban pan recién hecho en la orilla."
+)
+
+
+def make_request(word_count: int = 50, category: str = "infantil") -> StoryRequest:
+    return StoryRequest(
+        word_count=word_count, creativity_level="creativo", genre="fantasia", category=category
+    )
+
+
+class TestStoryAnalyzer:
+    """
+    Pruebas del análisis de título, palabras y contenido.
+    """
+
+    def test_chunked_analysis_matches_whole_story(self):
+        """
+        Analizar la historia en fragmentos de cualquier tamaño, cortando palabras y el
+        título, da el mismo resultado que analizarla completa.
+        """
+        whole = analyze_story(make_request(), STORY).as_metadata()
+        for size in (1, 3, 7, 40):
+            analyzer = StoryAnalyzer(make_request())
+            for start in range(0, len(STORY), size):
+                analyzer.feed(STORY[start:start + size])
+            assert analyzer.finish().as_metadata() == whole
+
+        assert whole == {
+            "title": "El dragón de «Aguasclaras»",
+            "actual_word_count": 26,
+            "word_count_status": "short",
+            "content_check": "ok",
+        }
+
+    def test_first_paragraph_is_not_a_title(self):
+        """
+        Una primera línea que termina en punto cuenta como texto; un "Título:" sí es título.
+        """
+        untitled = analyze_story(make_request(), STORY.split("\n\n", 1)[1])
+        titled = analyze_story(make_request(), "Título: La noche\nEra tarde.")
+        assert untitled.title is None and untitled.words == 26
+        assert titled.title == "La noche" and titled.words == 2
+
+    def test_terms_are_checked_per_category(self):
+        """
+        Los términos no adecuados se detectan sin importar acentos ni puntuación, y solo
+        en la categoría que los restringe.
+        """
+        story = "El CADÁVER apareció junto al río, ¡sangriento!"
+        flagged = analyze_story(make_request(), story).as_metadata()
+        assert flagged["content_check"] == "flagged"
+        assert flagged["flagged_terms"] == ["cadaver", "sangriento"]
+        assert analyze_story(make_request(category="todos"), story).flagged == []
+
+    def test_enye_is_not_folded(self):
+        """
+        La "ñ" distingue palabras: "coño" se detecta, pero "cono" no.
+        """
+        for category in ("infantil", "adolescente"):
+            harmless = analyze_story(make_request(category=category), "Un cono de helado.")
+            flagged = analyze_story(make_request(category=category), "¡CoÑo!, gritó.")
+            assert harmless.flagged == []
+            assert flagged.flagged == ["coño"]
+
+
+class TestPostprocessStory:
+    """
+    Pruebas de las correcciones de historias fuera de tolerancia.
+    """
+
+    def test_short_story_is_extended(self, override_settings):
+        """
+        Una historia corta se continúa y la continuación se añade al final.
+        """
+        override_settings(postprocess_max_repairs=2)
+        extension = " ".join(["palabra"] * 20)
+        revise = AsyncMock(return_value=extension)
+        with patch("postprocess.revise_story_with_llm", revise):
+            story, report = asyncio.run(postprocess_story(make_request(), STORY))
+
+        assert story == f"{STORY}\n\n{extension}"
+        assert report.as_metadata()["actual_word_count"] == 46
+        assert report.repairs == 1
+        assert "unas 24 palabras más" in revise.call_args.args[2]
+
+    def test_worse_or_failed_repair_keeps_original(self, override_settings):
+        """
+        Si la corrección empeora la historia o falla, se conserva la original.
+        """
+        override_settings(postprocess_max_repairs=1)
+        request = make_request()
+        story = "El cadáver apareció junto al río."
+        with patch("postprocess.revise_story_with_llm", AsyncMock(return_value="Un asesino.")):
+            worse, report = asyncio.run(postprocess_story(request, story))
+        with patch("postprocess.revise_story_with_llm", AsyncMock(side_effect=Exception("x"))):
+            failed, _ = asyncio.run(postprocess_story(request, story))
+
+        assert worse == failed == story
+        assert report.repairs == 1 and report.flagged == ["cadaver"]
+
+
+class TestPostprocessEndpoint:
+    """
+    Pruebas de los metadatos del post-procesado en `/generate-story`.
+    """
+
+    @patch(
+        "main.generate_story_with_llm",
+        return_value=(STORY, "gpt-4o-mini", prompt_manager.version),
+    )
+    def test_response_includes_analysis(self, mock_generate, override_settings):
+        """
+        La respuesta incluye el título y las palabras reales de la historia, aunque no
+        se corrija.
+        """
+        override_settings(postprocess_max_repairs=0)
+        payload = {
+            "word_count": 50, "creativity_level": "creativo", "genre": "fantasia",
+            "category": "infantil",
+        }
+        with patch("main.story_cache", None), patch("main.story_pool", None):
+            metadata = TestClient(app).post("/generate-story", json=payload).json()["metadata"]
+
+        assert metadata["title"] == "El dragón de «Aguasclaras»"
+        assert metadata["actual_word_count"] == 26
+        assert metadata["word_count_status"] == "short"
+        assert metadata["content_check"] == "ok"
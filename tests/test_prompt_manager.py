@@ -0,0 +1,137 @@
+"""
+Pruebas del gestor de prompts precompilados.
+"""
+import asyncio
+import shutil
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks.bench_prompts import build_requests, legacy_generate_prompt
+from main import app
+from models import StoryRequest
+from prompt_manager import PromptManager
+
+
+@pytest.fixture
+def prompts_copy(tmp_path):
+    """
+    Copia de `prompts.yaml` que las pruebas pueden modificar.
+    """
+    path = tmp_path / "prompts.yaml"
+    shutil.copy("prompts.yaml", path)
+    return path
+
+
+class TestPromptManager:
+    """
+    Pruebas de la compilación de plantillas al cargar el YAML.
+    """
+
+    def test_compiled_prompts_match_two_pass_format(self):
+        """
+        Las plantillas precompiladas producen exactamente el mismo prompt que antes.
+        """
+        manager = PromptManager()
+        for request in build_requests():
+            assert manager.generate_prompt(request) == legacy_generate_prompt(
+                manager, request
+            )
+
+    def test_all_combinations_are_compiled_at_load(self):
+        """
+        Se compila cada combinación de género, categoría y nivel de creatividad.
+        """
+        manager = PromptManager()
+        assert len(manager.compiled_prompts) == 8 * 3 * 3
+
+    def test_missing_placeholder_fails_at_load(self, tmp_path):
+        """
+        Un parámetro desconocido en la plantilla falla al cargar el archivo.
+        """
+        prompts_file = tmp_path / "prompts.yaml"
+        prompts_file.write_text(
+            "base_prompt: 'Historia de {genre} con {personaje}'\n"
+            "genres:\n  fantasia:\n    description: magia\n"
+            "creativity_levels:\n  creativo:\n    instructions: libre\n"
+            "prompt_template: '{base_prompt}'\n",
+            encoding="utf-8",
+        )
+        with pytest.raises(ValueError, match="personaje"):
+            PromptManager(str(prompts_file))
+
+    def test_invalid_yaml_keeps_last_good_version(self, prompts_copy):
+        """
+        Si el YAML nuevo no es válido, sigue activa la versión anterior.
+        """
+        manager = PromptManager(str(prompts_copy))
+        version = manager.version
+        prompts_copy.write_text("base_prompt: [sin cerrar", encoding="utf-8")
+        with pytest.raises(ValueError):
+            manager.reload_prompts()
+        assert manager.version == version
+        assert len(manager.compiled_prompts) == 8 * 3 * 3
+
+    def test_watcher_swaps_templates_on_change(self, prompts_copy):
+        """
+        La vigilancia del archivo recarga y activa la nueva versión.
+        """
+        manager = PromptManager(str(prompts_copy))
+        version = manager.version
+        request = StoryRequest(
+            word_count=100, creativity_level="creativo", genre="drama", category="todos"
+        )
+
+        async def run():
+            await manager.start_watching(0.01)
+            content = prompts_copy.read_text(encoding="utf-8")
+            prompts_copy.write_text(
+                content.replace("Ahora, crea una historia", "Ahora, escribe una historia"),
+                encoding="utf-8",
+            )
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                if manager.version != version:
+                    break
+            await manager.stop_watching()
+
+        asyncio.run(run())
+        assert manager.version != version
+        assert "Ahora, escribe una historia" in manager.generate_prompt(request)
+
+    def test_admin_reload_requires_token(self, override_settings):
+        """
+        El endpoint de recarga exige el token de administración.
+        """
+        client = TestClient(app)
+        override_settings(admin_token=None)
+        assert client.post("/admin/reload-prompts").status_code == 403
+
+        override_settings(admin_token="secreto")
+        response = client.post(
+            "/admin/reload-prompts", headers={"X-Admin-Token": "secreto"}
+        )
+        assert response.status_code == 200
+        version = response.json()["prompt_version"]
+        assert client.get("/health").json()["prompt_version"] == version
+
+    def test_compiled_cache_skips_yaml_parsing(self, prompts_copy, tmp_path, monkeypatch):
+        """
+        Con la caché compilada válida no se parsea el YAML; si el YAML cambia, sí.
+        """
+        cache_file = str(tmp_path / "prompts.cache")
+        first = PromptManager(str(prompts_copy), cache_file=cache_file)
+
+        def fail(text):
+            raise AssertionError("no debería parsearse el YAML")
+
+        monkeypatch.setattr("prompt_manager.parse_yaml", fail)
+        cached = PromptManager(str(prompts_copy), cache_file=cache_file)
+        assert cached.version == first.version
+        assert cached.prompts_data == first.prompts_data
+
+        monkeypatch.undo()
+        prompts_copy.write_text(
+            prompts_copy.read_text(encoding="utf-8") + "\n# cambio\n", encoding="utf-8"
+        )
+        changed = PromptManager(str(prompts_copy), cache_file=cache_file)
+        assert changed.version != first.version
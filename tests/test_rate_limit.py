@@ -0,0 +1,281 @@
+"""
+Pruebas de los límites de admisión por cliente y globales.
+"""
+import json
+import asyncio
+import httpx
+import pytest
+
+from benchmarks.load_test import PAYLOAD
+from prompt_manager import prompt_manager
+from rate_limit import (
+    GLOBAL_KEY,
+    InMemoryRateLimitStore,
+    KeyValueRateLimitStore,
+    RateLimiter,
+    RateLimitExceeded,
+    client_identity,
+    refill_bucket,
+)
+from tests.fakes import FakeKeyValueStore
+
+
+class TestTokenBucket:
+    """
+    Pruebas de los token buckets y los almacenes.
+    """
+
+    def test_bucket_allows_burst_then_asks_to_wait(self):
+        """
+        Se admiten `burst` solicitudes seguidas y luego hay que esperar a la recarga.
+        """
+        state = None
+        for _ in range(3):
+            state, wait = refill_bucket(state, now=0, rate=2, burst=3, cost=1)
+            assert wait == 0
+        state, wait = refill_bucket(state, now=0, rate=2, burst=3, cost=1)
+        assert wait == pytest.approx(0.5)
+        state, wait = refill_bucket(state, now=0.5, rate=2, burst=3, cost=1)
+        assert wait == 0
+
+    def test_in_memory_concurrency_slots(self):
+        """
+        Los huecos de concurrencia se ocupan hasta el límite y se liberan.
+        """
+
+        async def run():
+            store = InMemoryRateLimitStore()
+            results = [await store.acquire("c", 2) for _ in range(3)]
+            await store.release("c")
+            results.append(await store.acquire("c", 2))
+            return results
+
+        assert asyncio.run(run()) == [True, True, False, True]
+
+    def test_shared_store_holds_limits_across_workers(self):
+        """
+        Dos workers con el mismo almacén compartido comparten bucket y cuota.
+        """
+
+        async def run():
+            shared = FakeKeyValueStore()
+            first, second = KeyValueRateLimitStore(shared), KeyValueRateLimitStore(shared)
+            waits = [
+                await first.take("c", rate=0.001, burst=2),
+                await second.take("c", rate=0.001, burst=2),
+                await first.take("c", rate=0.001, burst=2),
+            ]
+            slots = [await first.acquire("c", 1), await second.acquire("c", 1)]
+            await first.release("c")
+            slots.append(await second.acquire("c", 1))
+            return waits, slots
+
+        waits, slots = asyncio.run(run())
+        assert waits[:2] == [0, 0] and waits[2] > 0
+        assert slots == [True, False, True]
+
+    def test_evicting_client_buckets_keeps_the_global_limit(self):
+        """
+        Con más clientes que `max_keys`, se olvidan los buckets de clientes menos
+        recientes pero no el global: rotar de cliente no salta la cuota del proveedor.
+        """
+
+        async def run():
+            limiter = RateLimiter(
+                InMemoryRateLimitStore(max_keys=5),
+                client_rate=0.001,
+                client_burst=10,
+                client_concurrency=10,
+                global_rate=0.001,
+                global_burst=20,
+            )
+            admitted = 0
+            for index in range(200):
+                try:
+                    await limiter.admit(f"cliente-{index}")
+                except RateLimitExceeded:
+                    continue
+                await limiter.release(f"cliente-{index}")
+                admitted += 1
+            return admitted, len(limiter.store._buckets)
+
+        assert asyncio.run(run()) == (20, 5)
+
+    def test_client_identity_ignores_spoofable_values(self):
+        """
+        Solo las API keys configuradas identifican al cliente, y de `X-Forwarded-For`
+        se usa la IP que añade el proxy de confianza (la última).
+        """
+
+        def identity(headers, **options):
+            scope = {
+                "headers": [(k.encode(), v.encode()) for k, v in headers.items()],
+                "client": ("10.0.0.1", 1234),
+            }
+            return client_identity(scope, **options)
+
+        assert identity({"x-api-key": "valida"}, api_keys=["valida"]).startswith("key:")
+        assert identity({"x-api-key": "inventada"}, api_keys=["valida"]) == "ip:10.0.0.1"
+        forwarded = {"x-forwarded-for": "1.2.3.4, 203.0.113.9"}
+        assert identity(forwarded, trust_forwarded=True) == "ip:203.0.113.9"
+        assert identity(forwarded) == "ip:10.0.0.1"
+
+    def test_rejected_requests_consume_nothing(self):
+        """
+        Una solicitud rechazada no gasta tokens propios ni globales ni ocupa huecos.
+        """
+
+        async def run():
+            store = InMemoryRateLimitStore()
+            limiter = RateLimiter(
+                store,
+                client_rate=0.001,
+                client_burst=5,
+                client_concurrency=1,
+                global_rate=0.001,
+                global_burst=2,
+            )
+            await limiter.admit("a")
+            for _ in range(3):
+                with pytest.raises(RateLimitExceeded, match="client_concurrency"):
+                    await limiter.admit("a")
+            await limiter.admit("b")
+            with pytest.raises(RateLimitExceeded, match="global_rate"):
+                await limiter.admit("c")
+            return (
+                await store.take("client:a", 0.001, 5, cost=4),
+                await store.take("client:c", 0.001, 5, cost=5),
+                await store.acquire("client:c", 1),
+            )
+
+        assert asyncio.run(run()) == (0, 0, True)
+
+
+class TestRateLimitMiddleware:
+    """
+    Pruebas del middleware sobre `/generate-story` con la generación simulada.
+    """
+
+    @pytest.fixture
+    def post(self, monkeypatch, override_settings):
+        """
+        Devuelve una función que envía solicitudes simultáneas con el limitador dado.
+        """
+        override_settings(rate_limit_api_keys=("a", "b", "c"), postprocess_max_repairs=0)
+
+        async def slow_generate(request):
+            await asyncio.sleep(0.1)
+            return "Había una vez un dragón...", "gpt-4o-mini", prompt_manager.version
+
+        monkeypatch.setattr("main.generate_story_with_llm", slow_generate)
+        monkeypatch.setattr("main.story_cache", None)
+        monkeypatch.setattr("main.story_pool", None)
+        monkeypatch.setattr("main.story_flight", None)
+
+        def post(limiter, api_keys):
+            from main import app
+
+            monkeypatch.setattr("main.rate_limiter", limiter)
+
+            async def run():
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+                    return await asyncio.gather(
+                        *(
+                            c.post("/generate-story", json=PAYLOAD, headers={"X-API-Key": key})
+                            for key in api_keys
+                        )
+                    )
+
+            return asyncio.run(run())
+
+        return post
+
+    def limiter(self, **limits) -> RateLimiter:
+        options = dict(
+            client_rate=0.01,
+            client_burst=10,
+            client_concurrency=10,
+            global_rate=0.01,
+            global_burst=100,
+        )
+        return RateLimiter(InMemoryRateLimitStore(), **{**options, **limits})
+
+    def test_client_over_its_bucket_gets_429_with_retry_after(self, post):
+        """
+        Un cliente que agota su ráfaga recibe 429 sin afectar a los demás.
+        """
+        responses = post(self.limiter(client_burst=2), ["a", "a", "a", "b"])
+        assert [r.status_code for r in responses].count(429) == 1
+        rejected = next(r for r in responses if r.status_code == 429)
+        assert int(rejected.headers["Retry-After"]) >= 1
+        assert "client_rate" in rejected.json()["detail"]
+        assert responses[3].status_code == 200
+
+    def test_concurrency_quota_per_client(self, post):
+        """
+        Un cliente no puede tener más generaciones simultáneas que su cuota.
+        """
+        responses = post(self.limiter(client_concurrency=1), ["a", "a", "b"])
+        assert sorted(r.status_code for r in responses) == [200, 200, 429]
+
+    def test_global_limit_applies_to_all_clients(self, post):
+        """
+        El bucket global limita el total aunque cada cliente esté dentro de su cuota.
+        """
+        responses = post(self.limiter(global_burst=2), ["a", "b", "c"])
+        assert sorted(r.status_code for r in responses) == [200, 200, 429]
+
+    def test_disabled_limiter_admits_everything(self, post):
+        """
+        Sin limitador configurado no se rechaza ninguna solicitud.
+        """
+        responses = post(None, ["a"] * 5)
+        assert all(r.status_code == 200 for r in responses)
+
+    def test_batch_items_pay_global_tokens(self, monkeypatch, override_settings):
+        """
+        Cada historia distinta de un lote consume un token global: el lote espera a la
+        recarga en lugar de saltarse la cuota del proveedor.
+        """
+        from main import app
+
+        async def generate(request):
+            return "Había una vez un dragón...", "gpt-4o-mini", prompt_manager.version
+
+        monkeypatch.setattr("main.generate_story_with_llm", generate)
+        monkeypatch.setattr("main.story_cache", None)
+        monkeypatch.setattr("main.story_pool", None)
+        monkeypatch.setattr("main.story_flight", None)
+        monkeypatch.setattr("main.story_archive", None)
+        monkeypatch.setattr("main.semantic_cache", None)
+        override_settings(postprocess_max_repairs=0)
+        limiter = self.limiter(global_rate=20, global_burst=2)
+        monkeypatch.setattr("main.rate_limiter", limiter)
+        charges = []
+        take = limiter.store.take
+
+        async def counting_take(key, rate, burst, cost=1):
+            wait = await take(key, rate, burst, cost)
+            if key == GLOBAL_KEY and cost > 0 and not wait:
+                charges.append(cost)
+            return wait
+
+        monkeypatch.setattr(limiter.store, "take", counting_take)
+        items = [{**PAYLOAD, "suggestions": f"Variante {i}"} for i in range(4)]
+
+        async def run():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+                start = asyncio.get_running_loop().time()
+                response = await c.post("/generate-stories", json={"requests": items})
+                return response, asyncio.get_running_loop().time() - start
+
+        response, elapsed = asyncio.run(run())
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.strip().splitlines()]
+        assert [line["status"] for line in lines] == ["ok"] * 4
+        # Un token por la admisión del lote y uno por cada historia
+        assert len(charges) == 1 + 4
+        # 1 token de admisión + 4 historias con ráfaga 2: al menos 3 recargas de 50 ms
+        assert elapsed >= 0.14
@@ -0,0 +1,196 @@
+"""
+Pruebas de reintentos, plazos y circuit breaker contra un servidor falso de OpenAI
+que inyecta fallos.
+"""
+import time
+import asyncio
+import httpx
+import pytest
+from unittest.mock import patch
+
+from benchmarks.fake_openai_server import FakeOpenAIServer, create_fake_openai_app
+from benchmarks.load_test import PAYLOAD
+from resilience import (
+    CircuitBreaker,
+    RequestBudgetMiddleware,
+    ResilientCaller,
+    RetryPolicy,
+    request_deadline,
+)
+
+
+def make_caller(max_attempts=3, min_requests=10) -> ResilientCaller:
+    return ResilientCaller(
+        RetryPolicy(max_attempts=max_attempts, base_delay=0.01, max_delay=0.05),
+        CircuitBreaker(window=10, min_requests=min_requests, error_rate=0.5, open_seconds=30),
+        budget=10,
+        attempt_timeout=10,
+    )
+
+
+def post_stories(total: int, headers=None) -> list:
+    """Envía `total` solicitudes secuenciales a `/generate-story` dentro del lifespan"""
+    from main import app, lifespan
+
+    async def run():
+        async with lifespan(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+                return [
+                    await c.post("/generate-story", json=PAYLOAD, headers=headers)
+                    for _ in range(total)
+                ]
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def fake_openai(override_settings):
+    """
+    Devuelve una función que levanta el servidor falso con la configuración dada.
+    """
+    servers = []
+
+    def start(**options):
+        server = FakeOpenAIServer(create_fake_openai_app(**options)).__enter__()
+        servers.append(server)
+        # Las historias del servidor falso son cortas: sin correcciones, una llamada por historia
+        override_settings(
+            openai_api_key="fake-key",
+            openai_base_url=server.base_url,
+            postprocess_max_repairs=0,
+        )
+        return server
+
+    yield start
+    for server in servers:
+        server.__exit__(None, None, None)
+
+
+class TestResilience:
+    """
+    Pruebas de la capa de resiliencia alrededor del LLM.
+    """
+
+    def test_breaker_opens_and_recovers_through_probe(self):
+        """
+        El circuito se abre al superar la tasa de error y se cierra tras una prueba correcta.
+        """
+        breaker = CircuitBreaker(window=4, min_requests=4, error_rate=0.5, open_seconds=0.05)
+        for _ in range(4):
+            breaker.record_failure()
+        assert breaker.state == "open"
+        with pytest.raises(Exception):
+            breaker.before_call()
+
+        time.sleep(0.06)
+        assert breaker.state == "half_open"
+        breaker.before_call()
+        with pytest.raises(Exception):
+            breaker.before_call()
+        breaker.record_success()
+        assert breaker.state == "closed"
+
+    def test_probe_ending_without_outcome_does_not_block_breaker(self):
+        """
+        Si la llamada de prueba falla con un error no transitorio o se cancela, la
+        siguiente llamada vuelve a probar en lugar de fallar para siempre.
+        """
+        caller = make_caller(min_requests=1)
+        caller.breaker.open_seconds = 0.01
+        caller.breaker.record_failure()
+        time.sleep(0.02)
+
+        async def invalid(timeout):
+            raise ValueError("solicitud inválida")
+
+        async def hang(timeout):
+            await asyncio.sleep(10)
+
+        async def ok(timeout):
+            return "ok"
+
+        async def run():
+            with pytest.raises(ValueError):
+                await caller.call(invalid)
+            task = asyncio.create_task(caller.call(hang))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            return await caller.call(ok)
+
+        assert asyncio.run(run()) == "ok"
+        assert caller.breaker.state == "closed"
+
+    def test_transient_errors_are_retried_honoring_retry_after(self, fake_openai):
+        """
+        Un 429 y un 500 se reintentan y la solicitud termina con éxito.
+        """
+        server = fake_openai(latency=0, failures=[429, 500], retry_after=0.1)
+        caller = make_caller()
+        with patch("services.llm_caller", caller):
+            start = time.perf_counter()
+            responses = post_stories(1)
+            elapsed = time.perf_counter() - start
+
+        assert responses[0].status_code == 200
+        assert server.app.state.requests == 3
+        assert caller.retries == 2
+        assert elapsed >= 0.2
+
+    def test_open_breaker_fails_fast_with_503(self, fake_openai):
+        """
+        Con el circuito abierto se responde 503 sin llamar al proveedor.
+        """
+        server = fake_openai(latency=0, failures=[500] * 10)
+        caller = make_caller(max_attempts=1, min_requests=3)
+        with patch("services.llm_caller", caller):
+            responses = post_stories(5)
+
+        assert [r.status_code for r in responses] == [503] * 5
+        assert server.app.state.requests == 3
+        assert caller.breaker.state == "open"
+        assert "retry-after" in responses[-1].headers
+
+    def test_client_budget_bounds_attempt_timeout(self, fake_openai):
+        """
+        `X-Request-Timeout` limita la espera aunque el proveedor sea lento.
+        """
+        fake_openai(latency=2)
+        with patch("services.llm_caller", make_caller()):
+            start = time.perf_counter()
+            responses = post_stories(1, headers={"X-Request-Timeout": "0.3"})
+            elapsed = time.perf_counter() - start
+
+        assert responses[0].status_code == 503
+        assert elapsed < 1.5
+
+    def test_budget_middleware_sets_and_resets_the_deadline(self):
+        """
+        El plazo de `X-Request-Timeout` es visible en la aplicación durante la solicitud
+        (también mientras se envía la respuesta) y se restablece al terminar; los
+        valores inválidos se ignoran.
+        """
+        seen = []
+
+        async def app(scope, receive, send):
+            seen.append(request_deadline.get())
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            seen.append(request_deadline.get())
+
+        async def send(message):
+            pass
+
+        async def run(value):
+            scope = {"type": "http", "headers": [(b"x-request-timeout", value)]}
+            before = time.monotonic()
+            await RequestBudgetMiddleware(app)(scope, None, send)
+            return before, request_deadline.get()
+
+        before, after = asyncio.run(run(b"5"))
+        assert all(before + 5 <= deadline <= time.monotonic() + 5 for deadline in seen)
+        assert after is None
+        seen.clear()
+        for value in (b"muchos", b"0", b"nan"):
+            asyncio.run(run(value))
+        assert seen == [None] * 6
@@ -0,0 +1,196 @@
+"""
+Pruebas del enrutado entre varios backends contra servidores falsos de OpenAI con
+latencias distintas.
+"""
+import time
+import asyncio
+import pytest
+
+from benchmarks.fake_openai_server import FakeOpenAIServer, create_fake_openai_app
+from benchmarks.load_test import PAYLOAD
+from models import StoryRequest
+from router import Backend, Router
+
+MESSAGES = [{"role": "user", "content": "Cuéntame una historia"}]
+
+
+@pytest.fixture
+def servers():
+    """
+    Devuelve una función que levanta un servidor falso por cada configuración dada.
+    """
+    started = []
+
+    def start(*options):
+        for option in options:
+            started.append(FakeOpenAIServer(create_fake_openai_app(**option)).__enter__())
+        return started
+
+    yield start
+    for server in started:
+        server.__exit__(None, None, None)
+
+
+def make_backend(server, name, **options) -> Backend:
+    return Backend(
+        name=name, model=f"modelo-{name}", base_url=server.base_url, api_key="fake-key", **options
+    )
+
+
+def run_with_router(router: Router, coroutine_function):
+    """Abre los clientes del router en el event loop de la prueba y los cierra al final"""
+
+    async def run():
+        router.open()
+        try:
+            return await coroutine_function()
+        finally:
+            await router.close()
+
+    return asyncio.run(run())
+
+
+class TestRouter:
+    """
+    Pruebas de la elección de backend, el hedging y el enrutado a modelos baratos.
+    """
+
+    def test_faster_backend_receives_most_requests(self, servers):
+        """
+        Tras explorar ambos backends, la mayoría de llamadas van al más rápido.
+        """
+        fast, slow = servers({"latency": 0.01}, {"latency": 0.15})
+        router = Router([make_backend(fast, "rapido"), make_backend(slow, "lento")])
+        request = StoryRequest(**PAYLOAD)
+
+        async def run():
+            for _ in range(12):
+                await router.complete(request, messages=MESSAGES)
+
+        run_with_router(router, run)
+        assert fast.app.state.requests >= 10
+        assert slow.app.state.requests <= 2
+
+    def test_failing_backend_is_avoided(self, servers):
+        """
+        Un backend que falla acumula tasa de error y deja de recibir llamadas.
+        """
+        healthy, broken = servers({"latency": 0.05}, {"latency": 0.01, "failures": [500] * 20})
+        router = Router([make_backend(healthy, "sano"), make_backend(broken, "roto")])
+        request = StoryRequest(**PAYLOAD)
+
+        async def run():
+            for _ in range(10):
+                try:
+                    await router.complete(request, messages=MESSAGES)
+                except Exception:
+                    pass
+
+        run_with_router(router, run)
+        assert broken.app.state.requests <= 2
+        assert healthy.app.state.requests >= 8
+
+    def test_slow_call_is_hedged_to_another_backend(self, servers):
+        """
+        Si el backend elegido tarda más que el retardo de hedging, gana el duplicado.
+        """
+        slow, fast = servers({"latency": 1.0}, {"latency": 0.02})
+        slow_backend, fast_backend = make_backend(slow, "lento"), make_backend(fast, "rapido")
+        # Un historial malo hace que el rápido no sea la primera opción
+        fast_backend.latency = 5.0
+        router = Router([slow_backend, fast_backend], hedge_delay=0.05)
+        request = StoryRequest(**PAYLOAD)
+
+        async def run():
+            start = time.perf_counter()
+            _, backend = await router.complete(request, messages=MESSAGES)
+            return backend, time.perf_counter() - start
+
+        backend, elapsed = run_with_router(router, run)
+        assert backend is fast_backend
+        assert elapsed < 0.5
+        assert router.hedges == 1 and router.hedge_wins == 1
+        assert slow_backend.in_flight == 0
+
+    def test_cancelled_caller_cancels_the_pending_call(self, servers):
+        """
+        Si se cancela quien espera antes del retardo de hedging, la llamada en curso
+        también se cancela en lugar de quedar huérfana ocupando el backend.
+        """
+        slow, other = servers({"latency": 1.0}, {"latency": 1.0})
+        slow_backend, other_backend = make_backend(slow, "lento"), make_backend(other, "otro")
+        other_backend.latency = 5.0
+        router = Router([slow_backend, other_backend], hedge_delay=0.5)
+        request = StoryRequest(**PAYLOAD)
+
+        async def run():
+            task = asyncio.create_task(router.complete(request, messages=MESSAGES))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await asyncio.sleep(0.05)
+            return slow_backend.in_flight
+
+        assert run_with_router(router, run) == 0
+        assert router.hedges == 0
+
+    def test_short_and_conservative_stories_go_to_cheap_backend(self, servers):
+        """
+        Con el enrutado barato, las historias cortas o conservadoras usan el modelo barato.
+        """
+        main_server, cheap_server = servers({"latency": 0.01}, {"latency": 0.01})
+        router = Router(
+            [
+                make_backend(main_server, "principal"),
+                make_backend(cheap_server, "barato", cheap=True),
+            ],
+            cheap_routing=True,
+            cheap_max_words=100,
+        )
+        requests = [
+            StoryRequest(**{**PAYLOAD, "word_count": 80}),
+            StoryRequest(**{**PAYLOAD, "creativity_level": "conservador"}),
+            StoryRequest(**{**PAYLOAD, "word_count": 800}),
+        ]
+
+        async def run():
+            return [
+                (await router.complete(request, messages=MESSAGES))[1].name
+                for request in requests
+            ]
+
+        assert run_with_router(router, run) == ["barato", "barato", "principal"]
+
+
+class TestRoutedGeneration:
+    """
+    Pruebas de `generate_story_with_llm` con varios backends configurados.
+    """
+
+    def test_retries_move_to_a_healthy_backend(self, override_settings, servers, monkeypatch):
+        """
+        Un backend caído no impide generar la historia: el reintento cambia de backend.
+        """
+        from services import close_llm_client, generate_story_with_llm, init_llm_client
+
+        broken, healthy = servers({"latency": 0.01, "failures": [503] * 10}, {"latency": 0.05})
+        override_settings(
+            openai_api_key="fake-key",
+            llm_backends=(
+                {"name": "roto", "base_url": broken.base_url, "model": "m1"},
+                {"name": "sano", "base_url": healthy.base_url, "model": "m2"},
+            ),
+        )
+        monkeypatch.setattr("services.llm_caller.policy.base_delay", 0.01)
+
+        async def run():
+            await init_llm_client()
+            try:
+                return [await generate_story_with_llm(StoryRequest(**PAYLOAD)) for _ in range(3)]
+            finally:
+                await close_llm_client()
+
+        stories = asyncio.run(run())
+        # Los metadatos informan del modelo del backend que respondió, no de OPENAI_MODEL
+        assert [story[:2] for story in stories] == [("Había una vez un dragón...", "m2")] * 3
+        assert healthy.app.state.requests == 3
@@ -0,0 +1,121 @@
+"""
+Pruebas de la caché de sugerencias casi idénticas.
+"""
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from main import app
+from models import StoryRequest
+from prompt_manager import prompt_manager
+from semantic_cache import (
+    NearDuplicateIndex,
+    SemanticStoryCache,
+    make_scope_key,
+    normalize_text,
+)
+
+
+def make_request(**overrides) -> StoryRequest:
+    values = {
+        "word_count": 300,
+        "creativity_level": "creativo",
+        "genre": "fantasia",
+        "category": "infantil",
+        "suggestions": "Un dragón amable",
+    }
+    values.update(overrides)
+    return StoryRequest(**values)
+
+
+class TestNearDuplicateIndex:
+    """
+    Pruebas de la normalización y del índice MinHash/LSH.
+    """
+
+    def test_normalization_folds_accents_case_and_punctuation(self):
+        """
+        Acentos, mayúsculas, puntuación y espacios repetidos no cambian el texto normalizado.
+        """
+        assert normalize_text("  Un  DRAGÓN amable!!") == "un dragon amable"
+        assert normalize_text("¿Niño, pingüino?") == "nino pinguino"
+
+    def test_near_duplicates_hit_and_different_texts_miss(self):
+        """
+        Una variante trivial encuentra la historia; un texto distinto no.
+        """
+        index = NearDuplicateIndex(threshold=0.85)
+        index.add("scope", "un dragón amable que vive en una montaña", "historia", ttl=60)
+
+        story, similarity = index.lookup("scope", "Un dragon amable, que vive en una montaña!")
+        assert story == "historia"
+        assert similarity == 1.0
+        story, similarity = index.lookup("scope", "un dragón amable que vive en unas montañas")
+        assert similarity >= 0.85
+        assert index.lookup("scope", "una princesa pirata en el mar del norte") is None
+
+    def test_lookups_are_scoped(self):
+        """
+        Las mismas sugerencias con otros parámetros no comparten historia.
+        """
+        index = NearDuplicateIndex()
+        index.add(make_scope_key(make_request()), "un dragón amable", "historia", ttl=60)
+        assert index.lookup(make_scope_key(make_request(genre="drama")), "un dragón amable") is None
+        assert index.lookup(make_scope_key(make_request(word_count=500)), "un dragón amable") is None
+        assert index.lookup(make_scope_key(make_request()), "un dragón amable") is not None
+
+    def test_memory_is_bounded_by_entries_and_ttl(self):
+        """
+        Al superar el máximo se expulsa la entrada menos usada y sus bandas; las expiradas no se sirven.
+        """
+        index = NearDuplicateIndex(max_entries=2)
+        index.add("scope", "un dragón amable", "1", ttl=60)
+        index.add("scope", "una bruja despistada", "2", ttl=60)
+        index.lookup("scope", "un dragón amable")
+        index.add("scope", "un robot que cocina", "3", ttl=60)
+
+        assert index.lookup("scope", "una bruja despistada") is None
+        assert index.lookup("scope", "un dragón amable")[0] == "1"
+        assert index.stats()["evictions"] == 1
+        assert index.stats()["buckets"] <= 2 * index.bands
+
+        index.add("scope", "un gato astronauta", "4", ttl=0)
+        assert index.lookup("scope", "un gato astronauta") is None
+        assert index.stats()["expirations"] == 1
+
+
+class TestSemanticStoryCache:
+    """
+    Pruebas de la integración con `/generate-story`.
+    """
+
+    @patch(
+        "main.generate_story_with_llm",
+        return_value=("Había una vez un dragón amable...", "gpt-4o-mini", prompt_manager.version),
+    )
+    def test_trivial_variant_is_served_from_cache(self, mock_generate, override_settings):
+        """
+        La segunda solicitud con una variante de las sugerencias no llama al LLM.
+        """
+        override_settings(postprocess_max_repairs=0)
+        cache = SemanticStoryCache(NearDuplicateIndex(), ttl=60)
+        client = TestClient(app)
+        with patch("main.semantic_cache", cache):
+            first = client.post(
+                "/generate-story", json=make_request().model_dump()
+            ).json()
+            second = client.post(
+                "/generate-story", json=make_request(suggestions="un dragon amable!").model_dump()
+            ).json()
+            other = client.post(
+                "/generate-story", json=make_request(genre="drama").model_dump()
+            ).json()
+            health = client.get("/health").json()
+
+        assert first["metadata"]["semantic_cache"] == "miss"
+        assert second["metadata"]["semantic_cache"] == "hit"
+        assert second["metadata"]["similarity"] == 1.0
+        assert second["story"] == first["story"]
+        assert other["metadata"]["semantic_cache"] == "miss"
+        assert mock_generate.call_count == 2
+        assert health["semantic_cache"]["hits"] == 1
+        assert health["semantic_cache"]["entries"] == 2
@@ -0,0 +1,139 @@
+"""
+Pruebas de la entrada de producción (`server.py`): varios workers, apagado ordenado y
+escalado del rendimiento con el número de workers.
+"""
+import os
+import sys
+import time
+import signal
+import threading
+import subprocess
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from benchmarks.bench_workers import measure
+from benchmarks.fake_openai_server import FakeOpenAIServer, create_fake_openai_app
+from benchmarks.harness import free_port, wait_until_ready, worker_pids
+from health import drain_state
+from main import app
+from prompt_manager import prompt_manager
+
+PAYLOAD = {
+    "word_count": 100,
+    "creativity_level": "creativo",
+    "genre": "fantasia",
+    "category": "todos",
+}
+
+
+class TestDrainState:
+    """
+    Pruebas del drenaje dentro de un worker.
+    """
+
+    @patch(
+        "main.generate_story_with_llm",
+        return_value=("Había una vez un dragón...", "gpt-4o-mini", prompt_manager.version),
+    )
+    def test_draining_worker_rejects_new_requests(self, mock_generate, override_settings):
+        """
+        Durante el drenaje, el worker no está listo y responde 503 con
+        `Connection: close` a las solicitudes nuevas, salvo a las de `/health`.
+        """
+        override_settings(postprocess_max_repairs=0)
+        client = TestClient(app)
+        drain_state.start()
+        try:
+            ready = client.get("/health/ready")
+            rejected = client.post("/generate-story", json=PAYLOAD)
+            live = client.get("/health/live")
+        finally:
+            drain_state.reset()
+
+        assert ready.status_code == 503
+        assert "draining" in ready.json()["reasons"]
+        assert rejected.status_code == 503
+        assert rejected.headers["connection"] == "close"
+        assert rejected.headers["retry-after"] == "1"
+        assert live.status_code == 200
+        assert client.post("/generate-story", json=PAYLOAD).status_code == 200
+
+
+def start_server(port: int, upstream_url: str, **env) -> subprocess.Popen:
+    """Arranca `server.py` contra el servidor falso con las variables indicadas"""
+    environ = {
+        **os.environ,
+        "OPENAI_API_KEY": "fake-key",
+        "OPENAI_BASE_URL": upstream_url,
+        "LLM_BACKENDS": "",
+        "HOST": "127.0.0.1",
+        "PORT": str(port),
+        "LOG_LEVEL": "WARNING",
+        "HEALTH_PROBE_INTERVAL": "0",
+        **env,
+    }
+    return subprocess.Popen(
+        [sys.executable, "server.py"],
+        env=environ,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+class TestServer:
+    """
+    Pruebas de `server.py` como proceso independiente.
+    """
+
+    def test_sigterm_drains_in_flight_requests(self):
+        """
+        Con SIGTERM, los workers dejan de estar listos y rechazan solicitudes nuevas,
+        la generación en curso termina con éxito y el servidor sale con código 0.
+        """
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        with FakeOpenAIServer(create_fake_openai_app(latency=1.5)) as upstream:
+            process = start_server(
+                port, upstream.base_url, WORKERS="2", SHUTDOWN_DRAIN_DELAY="1"
+            )
+            try:
+                wait_until_ready(base_url, process)
+                workers = worker_pids(process.pid)
+                in_flight = {}
+                request = threading.Thread(
+                    target=lambda: in_flight.update(
+                        response=httpx.post(f"{base_url}/generate-story", json=PAYLOAD, timeout=10)
+                    )
+                )
+                request.start()
+                time.sleep(0.3)
+                process.send_signal(signal.SIGTERM)
+                time.sleep(0.2)
+                ready = httpx.get(f"{base_url}/health/ready")
+                rejected = httpx.post(f"{base_url}/generate-story", json=PAYLOAD)
+                request.join()
+                exit_code = process.wait(timeout=20)
+            finally:
+                if process.poll() is None:
+                    process.kill()
+
+        assert len(workers) == 2
+        assert ready.status_code == 503 and ready.json()["reasons"] == ["draining"]
+        assert rejected.status_code == 503
+        assert in_flight["response"].status_code == 200
+        assert exit_code == 0
+        with pytest.raises(httpx.ConnectError):
+            httpx.get(f"{base_url}/health", timeout=1)
+
+    @pytest.mark.skipif(
+        (os.cpu_count() or 1) < 4, reason="El escalado necesita al menos 4 CPUs"
+    )
+    def test_throughput_scales_with_workers(self):
+        """
+        Con la CPU como límite, dos workers atienden bastante más que uno.
+        """
+        results = measure([1, 2], concurrency=32, duration=3)
+        assert results[2] > 1.5 * results[1], results
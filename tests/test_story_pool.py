@@ -0,0 +1,193 @@
+"""
+Pruebas del pool de historias pregeneradas.
+"""
+import asyncio
+from types import SimpleNamespace
+from typing import Tuple
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from main import app
+from models import StoryRequest
+from prompt_manager import prompt_manager
+from story_pool import StoryPool
+
+
+def make_request(**overrides) -> StoryRequest:
+    values = {
+        "word_count": 300,
+        "creativity_level": "creativo",
+        "genre": "fantasia",
+        "category": "infantil",
+    }
+    values.update(overrides)
+    return StoryRequest(**values)
+
+
+class FakeGenerator:
+    """
+    Generador que numera cada historia para comprobar que no se repiten.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, request: StoryRequest) -> Tuple[str, str, str]:
+        self.calls.append(request)
+        return f"Historia {len(self.calls)}", "gpt-4o-mini", prompt_manager.version
+
+
+class TestStoryPool:
+    """
+    Pruebas de la recarga, el consumo y la caducidad del pool.
+    """
+
+    def test_requests_are_bucketed_by_word_count(self):
+        """
+        Las solicitudes se agrupan en el bucket más cercano dentro de la tolerancia.
+        """
+        pool = StoryPool(FakeGenerator(), word_buckets=[100, 300], word_tolerance=0.2)
+        assert pool.key_for(make_request(word_count=280))[3] == 300
+        assert pool.key_for(make_request(word_count=200)) is None
+        assert pool.key_for(make_request(suggestions="Un dragón")) is None
+
+    def test_refill_and_serve_each_story_once(self):
+        """
+        Un fallo programa la recarga y luego cada historia se entrega una sola vez.
+        """
+        generator = FakeGenerator()
+        pool = StoryPool(generator, depth=2, low_watermark=1, refill_rate=1000)
+
+        async def run():
+            await pool.start()
+            assert pool.take(make_request()) is None
+            await asyncio.sleep(0.05)
+            served = [pool.take(make_request()), pool.take(make_request())]
+            await pool.stop()
+            return served
+
+        served = asyncio.run(run())
+        assert [entry[:2] for entry in served] == [
+            ("Historia 1", "gpt-4o-mini"),
+            ("Historia 2", "gpt-4o-mini"),
+        ]
+        assert generator.calls[0].word_count == 300
+        stats = pool.stats()
+        assert stats["hits"] == 2
+        assert stats["misses"] == 1
+
+    def test_worker_survives_unexpected_errors(self):
+        """
+        Un fallo fuera de la generación no detiene al worker: las siguientes
+        combinaciones se siguen recargando.
+        """
+        generator = FakeGenerator()
+        pool = StoryPool(generator, depth=1, refill_rate=1000)
+        throttle = pool._throttle
+        failures = iter([ZeroDivisionError("division by zero")])
+
+        async def failing_throttle():
+            for error in failures:
+                raise error
+            await throttle()
+
+        pool._throttle = failing_throttle
+        other = make_request(category="adolescente")
+
+        async def run():
+            await pool.start()
+            pool.take(make_request())
+            pool.take(other)
+            await asyncio.sleep(0.05)
+            served = pool.take(other)
+            await pool.stop()
+            return served
+
+        assert asyncio.run(run()) == ("Historia 1", "gpt-4o-mini", prompt_manager.version)
+        assert pool.stats()["refill_errors"] == 1
+
+    def test_stale_stories_are_dropped(self):
+        """
+        Las historias más antiguas que `max_age` no se sirven.
+        """
+        pool = StoryPool(FakeGenerator(), depth=1, refill_rate=1000, max_age=0)
+
+        async def run():
+            key = pool.key_for(make_request())
+            pool.take(make_request())
+            await pool._refill(key)
+            return pool.take(make_request())
+
+        assert asyncio.run(run()) is None
+        assert pool.stats()["stale_dropped"] == 1
+
+    def test_stories_from_previous_prompt_version_are_dropped(self):
+        """
+        Tras recargar las plantillas no se sirven las historias generadas con la
+        versión anterior; la combinación se programa para recargarse.
+        """
+        pool = StoryPool(FakeGenerator(), depth=2, refill_rate=1000)
+        key = pool.key_for(make_request())
+        asyncio.run(pool._refill(key))
+
+        with patch("story_pool.prompt_manager", SimpleNamespace(version="nueva")):
+            served = pool.take(make_request())
+
+        assert served is None
+        assert pool.stats()["stale_dropped"] == 2
+        assert pool.stats()["pending_refills"] == 1
+
+    @patch(
+        "main.generate_story_with_llm",
+        return_value=("Historia del LLM", "gpt-4o-mini", prompt_manager.version),
+    )
+    def test_generate_story_serves_from_pool(self, mock_generate, override_settings):
+        """
+        `/generate-story` entrega la historia del pool sin llamar al LLM.
+        """
+        override_settings(postprocess_max_repairs=0)
+        pool = StoryPool(FakeGenerator(), depth=1, refill_rate=1000)
+        asyncio.run(pool._refill(pool.key_for(make_request())))
+        payload = make_request().model_dump(exclude_none=True)
+        client = TestClient(app)
+        with patch("main.story_pool", pool):
+            first = client.post("/generate-story", json=payload).json()
+            second = client.post("/generate-story", json=payload).json()
+
+        assert first["story"] == "Historia 1"
+        assert first["metadata"]["pool"] == "hit"
+        assert second["story"] == "Historia del LLM"
+        assert mock_generate.call_count == 1
+
+    def test_refill_postprocesses_and_drops_flagged_stories(self, override_settings):
+        """
+        Las historias del pool pasan por el post-procesado y las que siguen con
+        contenido no adecuado para la categoría no se guardan.
+        """
+        override_settings(postprocess_max_repairs=0)
+        stories = iter(
+            [
+                ("Había una vez un asesino sangriento.", "gpt-4o-mini", prompt_manager.version),
+                ("Había una vez un dragón amable.", "gpt-4o-mini", prompt_manager.version),
+            ]
+        )
+
+        async def generate(request):
+            return next(stories)
+
+        pool = StoryPool(depth=1, refill_rate=1000)
+        key = pool.key_for(make_request())
+
+        async def run():
+            with patch("story_pool.generate_story_with_llm", generate):
+                await pool._refill(key)
+                rejected = pool.take(make_request())
+                await pool._refill(key)
+                return rejected, pool.take(make_request())
+
+        rejected, served = asyncio.run(run())
+        assert rejected is None
+        assert served == (
+            "Había una vez un dragón amable.", "gpt-4o-mini", prompt_manager.version
+        )
+        assert pool.stats()["rejected"] == 1
@@ -0,0 +1,196 @@
+"""
+Pruebas del almacén persistente de historias y de los endpoints `/stories`.
+"""
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from main import app
+from models import StoryRequest
+from prompt_manager import prompt_manager
+from story_store import FILTERS, SQLiteStoryStore, StoryArchive, encode_cursor
+
+
+def make_row(index: int, created_at: float, genre: str = "drama") -> tuple:
+    return (
+        f"id-{index}", created_at, genre, "todos", "creativo", 100, None, f"historia {index}", "{}"
+    )
+
+
+@pytest.fixture
+def store(tmp_path):
+    """
+    Almacén SQLite en un archivo temporal.
+    """
+    store = SQLiteStoryStore(str(tmp_path / "stories.db"))
+    yield store
+    asyncio.run(store.close())
+
+
+class TestSQLiteStoryStore:
+    """
+    Pruebas de la paginación por cursor y de los índices.
+    """
+
+    def test_keyset_pagination_visits_every_story_once(self, store):
+        """
+        Las páginas recorren todas las historias en orden, sin repetir ni saltar
+        ninguna aunque varias compartan `created_at`.
+        """
+        rows = [make_row(i, 1000.0 + i // 3, "drama" if i % 2 else "terror") for i in range(25)]
+
+        async def run():
+            await store.save_many(rows)
+            pages, cursor = [], None
+            while True:
+                stories, cursor = await store.list(10, cursor)
+                pages.append([story.story_id for story in stories])
+                if cursor is None:
+                    return pages, await store.list(100, genre="drama")
+
+        pages, (dramas, cursor) = asyncio.run(run())
+        assert [len(page) for page in pages] == [10, 10, 5]
+        seen = [story_id for page in pages for story_id in page]
+        assert seen == [f"id-{i}" for i in reversed(range(25))]
+        assert [story.story_id for story in dramas] == [f"id-{i}" for i in range(23, 0, -2)]
+        assert cursor is None
+
+    def test_pages_are_served_from_indexes(self, store):
+        """
+        Ninguna combinación de filtros recorre la tabla completa ni ordena en memoria.
+        """
+        asyncio.run(store.save_many([make_row(0, 1000.0)]))
+        connection = store._connect()
+        for mask in range(1 << len(FILTERS)):
+            filters = {name: "x" for bit, name in enumerate(FILTERS) if mask & (1 << bit)}
+            for after in (None, (1000.0, 5)):
+                query, params = store.list_query(20, after, filters)
+                plan = " ".join(
+                    row[3] for row in connection.execute("EXPLAIN QUERY PLAN " + query, params)
+                )
+                assert "USING INDEX" in plan, (filters, plan)
+                assert "TEMP B-TREE" not in plan, (filters, plan)
+
+    def test_invalid_cursor_is_rejected(self, store):
+        """
+        Un cursor mal formado produce ValueError.
+        """
+        with pytest.raises(ValueError, match="Cursor inválido"):
+            asyncio.run(store.list(10, "no-es-un-cursor"))
+        assert asyncio.run(store.list(10, encode_cursor(1.0, 1))) == ([], None)
+
+
+class TestStoryArchive:
+    """
+    Pruebas de la escritura diferida por lotes.
+    """
+
+    def test_records_are_written_in_batches(self, store):
+        """
+        `record` no escribe; al completarse un lote el worker inserta lo pendiente sin
+        esperar al intervalo, y la historia se lee antes y después de escribirse.
+        """
+        archive = StoryArchive(store, batch_size=4, flush_interval=10)
+        request = StoryRequest(
+            word_count=100, creativity_level="creativo", genre="drama", category="todos"
+        )
+
+        async def run():
+            await archive.start()
+            ids = [archive.record(request, f"historia {i}", {"n": i}) for i in range(10)]
+            pending = await archive.get(ids[-1])
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                if archive.stats()["written"]:
+                    break
+            written = archive.stats()["written"]
+            await archive.stop()
+            return ids, pending, written, await store.get(ids[-1])
+
+        ids, pending, written, stored = asyncio.run(run())
+        assert pending.story == "historia 9"
+        assert written == 10
+        assert stored.metadata == {"n": 9}
+        assert archive.stats() == {
+            "pending": 0, "written": 10, "batches": 3, "dropped": 0, "failed": 0
+        }
+
+    def test_full_buffer_drops_new_stories(self, store):
+        """
+        Con el búfer lleno, las historias nuevas no se guardan ni reciben id.
+        """
+        archive = StoryArchive(store, max_pending=2)
+        request = StoryRequest(
+            word_count=100, creativity_level="creativo", genre="drama", category="todos"
+        )
+        ids = [archive.record(request, "historia", {}) for _ in range(3)]
+        assert ids[2] is None
+        assert archive.stats()["dropped"] == 1
+
+
+class TestStoriesEndpoints:
+    """
+    Pruebas de `/stories` y `/stories/{story_id}`.
+    """
+
+    @patch(
+        "main.generate_story_with_llm",
+        return_value=("Había una vez un dragón...", "gpt-4o-mini", prompt_manager.version),
+    )
+    def test_generated_story_can_be_retrieved(self, mock_generate, store, override_settings):
+        """
+        La historia generada lleva `story_id` y se consulta antes y después de escribirse.
+        """
+        override_settings(postprocess_max_repairs=0)
+        archive = StoryArchive(store)
+        payload = {
+            "word_count": 300, "creativity_level": "creativo", "genre": "fantasia",
+            "category": "infantil",
+        }
+        client = TestClient(app)
+        with patch("main.story_archive", archive):
+            metadata = client.post("/generate-story", json=payload).json()["metadata"]
+            story = client.get(f"/stories/{metadata['story_id']}").json()
+            asyncio.run(archive.flush())
+            page = client.get("/stories", params={"genre": "fantasia", "limit": 5}).json()
+            missing = client.get("/stories/no-existe")
+            invalid = client.get("/stories", params={"cursor": "???"})
+
+        assert story["story"] == "Había una vez un dragón..."
+        assert story["metadata"]["genre"] == "fantasia"
+        assert page["stories"][0]["story_id"] == metadata["story_id"]
+        assert page["next_cursor"] is None
+        assert missing.status_code == 404
+        assert invalid.status_code == 400
+
+    def test_streamed_story_is_archived_whole(self, store):
+        """
+        La historia transmitida por fragmentos se guarda completa en el almacén.
+        """
+        async def fake_stream(request):
+            for text in ["Había ", "una ", "vez..."]:
+                yield text, "gpt-4o-mini", prompt_manager.version
+
+        archive = StoryArchive(store)
+        payload = {
+            "word_count": 300, "creativity_level": "creativo", "genre": "fantasia",
+            "category": "infantil",
+        }
+        client = TestClient(app)
+        with patch("main.story_archive", archive), patch(
+            "main.stream_story_with_llm", side_effect=fake_stream
+        ):
+            response = client.post("/generate-story/stream", json=payload)
+            story_id = response.text.split('"story_id": "')[1].split('"')[0]
+            story = client.get(f"/stories/{story_id}").json()
+
+        assert story["story"] == "Había una vez..."
+
+    def test_disabled_store_returns_404(self):
+        """
+        Sin almacén configurado los endpoints responden 404.
+        """
+        client = TestClient(app)
+        with patch("main.story_archive", None):
+            assert client.get("/stories").status_code == 404
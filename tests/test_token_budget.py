@@ -0,0 +1,149 @@
+"""
+Pruebas del presupuesto de tokens por solicitud y de las continuaciones cuando la
+respuesta se corta por `max_tokens`.
+"""
+import asyncio
+import pytest
+
+from benchmarks.fake_openai_server import FakeOpenAIServer, create_fake_openai_app
+from benchmarks.load_test import PAYLOAD
+from models import StoryRequest
+from token_budget import TokenBudget
+
+# Historia falsa de 120 palabras numeradas
+CONTENT = " ".join(f"palabra{i}" for i in range(120))
+
+
+class TestTokenBudget:
+    """
+    Pruebas del cálculo y el ajuste de `max_tokens`.
+    """
+
+    def test_max_tokens_scales_with_word_count(self):
+        """
+        El presupuesto crece con las palabras pedidas y respeta los límites.
+        """
+        budget = TokenBudget(tokens_per_word=1.5, headroom=1.2, min_tokens=64, max_tokens=2000)
+        assert budget.max_tokens_for(100) == 180
+        assert budget.max_tokens_for(10) == 64
+        assert budget.max_tokens_for(2000) == 2000
+
+    def test_ratio_converges_to_observed_usage(self):
+        """
+        La proporción de tokens por palabra se acerca a la observada.
+        """
+        budget = TokenBudget(tokens_per_word=1.0, alpha=0.5)
+        for _ in range(10):
+            budget.observe(words=100, completion_tokens=200)
+        assert budget.tokens_per_word == pytest.approx(2.0, abs=0.01)
+        assert budget.samples == 10
+
+    def test_outliers_are_clamped(self):
+        """
+        Una muestra anómala no desajusta la media más allá de los límites.
+        """
+        budget = TokenBudget(tokens_per_word=1.5, alpha=1.0)
+        budget.observe(words=1, completion_tokens=1000)
+        assert budget.tokens_per_word == TokenBudget.MAX_RATIO
+        budget.observe(words=0, completion_tokens=10)
+        assert budget.samples == 1
+
+
+class TestContinuation:
+    """
+    Pruebas de la generación contra el servidor falso, que cuenta un token por palabra.
+    """
+
+    @pytest.fixture
+    def fake_openai(self, override_settings):
+        """
+        Levanta el servidor falso con una historia de 120 palabras.
+        """
+        app = create_fake_openai_app(latency=0.01, content=CONTENT)
+        with FakeOpenAIServer(app) as server:
+            override_settings(openai_api_key="fake-key", openai_base_url=server.base_url)
+            yield server
+
+    @pytest.fixture
+    def budget(self, monkeypatch):
+        """Presupuesto de 1 token por palabra sin margen, para cortar a 50 palabras"""
+        budget = TokenBudget(tokens_per_word=1.0, headroom=1.0, min_tokens=50, alpha=0.5)
+        monkeypatch.setattr("services.token_budget", budget)
+        return budget
+
+    def run(self, coroutine_function):
+        """Ejecuta la corrutina con el cliente de OpenAI creado en el mismo event loop"""
+        from services import close_llm_client, init_llm_client
+
+        async def run():
+            await init_llm_client()
+            try:
+                return await coroutine_function()
+            finally:
+                await close_llm_client()
+
+        return asyncio.run(run())
+
+    def test_truncated_story_is_continued(self, fake_openai, budget):
+        """
+        Una historia cortada por max_tokens se completa con continuaciones.
+        """
+        from services import generate_story_with_llm
+
+        request = StoryRequest(**{**PAYLOAD, "word_count": 50})
+        story, *_ = self.run(lambda: generate_story_with_llm(request))
+
+        assert story == CONTENT
+        assert fake_openai.app.state.requests == 3
+        assert budget.samples == 1
+
+    def test_continuations_are_bounded(self, override_settings, fake_openai, budget):
+        """
+        Sin continuaciones disponibles se devuelve lo generado y no se ajusta la proporción.
+        """
+        from services import generate_story_with_llm
+
+        override_settings(llm_max_continuations=0)
+        request = StoryRequest(**{**PAYLOAD, "word_count": 50})
+        story, *_ = self.run(lambda: generate_story_with_llm(request))
+
+        assert len(story.split()) == 50
+        assert fake_openai.app.state.requests == 1
+        assert budget.samples == 0
+
+    def test_stream_is_continued(self, fake_openai, budget):
+        """
+        El stream abre continuaciones sin cortar el texto emitido.
+        """
+        from services import stream_story_with_llm
+
+        async def collect():
+            request = StoryRequest(**{**PAYLOAD, "word_count": 50})
+            return "".join([text async for text, *_ in stream_story_with_llm(request)])
+
+        assert self.run(collect) == CONTENT
+        assert fake_openai.app.state.requests == 3
+        assert budget.tokens_per_word == pytest.approx(1.0)
+
+    def test_stream_continuation_keeps_only_the_tail(self, fake_openai, budget, monkeypatch):
+        """
+        La continuación del stream recibe solo el final del texto emitido y aun así
+        continúa en la palabra correcta.
+        """
+        from services import _StreamTail, stream_story_with_llm
+
+        monkeypatch.setattr("services._STREAM_CONTEXT_CHARS", 60)
+
+        async def collect():
+            request = StoryRequest(**{**PAYLOAD, "word_count": 50})
+            return "".join([text async for text, *_ in stream_story_with_llm(request)])
+
+        assert self.run(collect) == CONTENT
+        assert fake_openai.app.state.requests == 3
+
+        tail = _StreamTail(size=10)
+        for text in ["Había una", " vez un dra", "gón muy ", "grande y amable"]:
+            tail.feed(text)
+        assert tail.words == 9
+        assert tail.text == "y amable"
+
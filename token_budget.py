@@ -0,0 +1,66 @@
+"""Presupuesto de tokens por solicitud a partir del número de palabras pedido"""
+
+# Python imports.
+import math
+import logging
+from typing import Any, Dict
+
+# Project imports.
+from config import settings
+
+# Configuración de logging.
+logger = logging.getLogger(__name__)
+
+
+class TokenBudget:
+    """
+    Calcula `max_tokens` como `word_count × tokens por palabra × margen`, acotado entre
+    `min_tokens` y `max_tokens`. La proporción de tokens por palabra se ajusta con una
+    media móvil exponencial del uso real (`usage.completion_tokens`) de cada historia.
+    """
+
+    # Límites de las muestras aceptadas, para que un valor anómalo no desajuste la media
+    MIN_RATIO = 0.5
+    MAX_RATIO = 5.0
+
+    def __init__(
+        self,
+        tokens_per_word: float = 1.6,
+        headroom: float = 1.3,
+        min_tokens: int = 64,
+        max_tokens: int = 2000,
+        alpha: float = 0.1,
+    ):
+        self.tokens_per_word = tokens_per_word
+        self.headroom = headroom
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.alpha = alpha
+        self.samples = 0
+
+    def max_tokens_for(self, word_count: int) -> int:
+        """Tokens a reservar para generar `word_count` palabras"""
+        estimate = math.ceil(word_count * self.tokens_per_word * self.headroom)
+        return min(self.max_tokens, max(self.min_tokens, estimate))
+
+    def observe(self, words: int, completion_tokens: int) -> None:
+        """Ajusta la proporción con una historia completa (no cortada por max_tokens)"""
+        if words <= 0 or completion_tokens <= 0:
+            return
+        ratio = min(self.MAX_RATIO, max(self.MIN_RATIO, completion_tokens / words))
+        self.tokens_per_word += self.alpha * (ratio - self.tokens_per_word)
+        self.samples += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Proporción actual y número de muestras"""
+        return {"tokens_per_word": round(self.tokens_per_word, 4), "samples": self.samples}
+
+
+# Instancia global usada por los servicios del LLM
+token_budget = TokenBudget(
+    tokens_per_word=settings.tokens_per_word,
+    headroom=settings.token_budget_headroom,
+    min_tokens=settings.token_budget_min_tokens,
+    max_tokens=settings.openai_max_tokens,
+    alpha=settings.token_budget_ewma_alpha,
+)